@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+PyOCL Benchmark Suite
+
+Measures the heat equation kernels, host <-> device transfers for each memory allocation strategy, program build
+times with a cold and warm cache and the host overhead of kernel launches. The suite is intended to run on a CPU
+OpenCL implementation (e.g. pocl) so that it can be used in CI. The results are written as JSON and may be compared
+against a baseline to detect performance regressions::
+
+    python benchmarks/benchmark.py --output results.json
+    python benchmarks/benchmark.py --baseline results.json --tolerance 0.2
+
+Each result has a unique name and a ``time`` [ms], for which lower is better. When a baseline is given, the process
+exits with a non-zero status if any result is slower than the baseline by more than the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyopencl as cl
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pyocl
+
+HEAT_KERNEL_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'examples', 'heat_eq_2D.cl'))
+
+LAUNCH_SRC = """
+kernel void noop(global float *u) {
+    u[get_global_id(0)] += 1.0f;
+}
+"""
+
+
+def summarise(times: List[float]) -> Dict[str, float]:
+    """
+    Summarises a list of timings
+
+    :param times: The timings [ms]
+    :return: The median (``time``), mean, minimum and maximum [ms]
+    """
+    times = np.asarray(times, dtype=np.float64)
+
+    return {'time': float(np.median(times)),
+            'mean': float(np.mean(times)),
+            'min': float(np.min(times)),
+            'max': float(np.max(times)),
+            'repeats': int(len(times))}
+
+
+def eventTime(event: cl.Event) -> float:
+    """
+    Returns the device execution time of a profiled event
+
+    :param event: The completed event
+    :return: The execution time [ms]
+    """
+    return (event.profile.end - event.profile.start) * 1e-6
+
+
+def hostTime(func: Callable[[], Any], repeats: int) -> List[float]:
+    """
+    Times a function on the host after a warm-up call
+
+    :param func: The function to time
+    :param repeats: The number of timed calls
+    :return: The wall-clock time of each call [ms]
+    """
+    func()
+
+    times = []
+
+    for i in range(repeats):
+        startTime = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - startTime) * 1e3)
+
+    return times
+
+
+class BenchmarkSuite:
+    """
+    Collects the benchmarks run on a single device
+    """
+
+    def __init__(self, ocl: pyocl.Core, repeats: int = 10) -> None:
+
+        self.ocl = ocl
+        self.repeats = repeats
+        self.queue = cl.CommandQueue(ocl.context, properties=cl.command_queue_properties.PROFILING_ENABLE)
+        self.results = []  # type: List[Dict[str, Any]]
+
+    def add(self, name: str, category: str, times: List[float], **params) -> None:
+
+        result = {'name': name, 'category': category}
+        result.update(summarise(times))
+        result.update(params)
+
+        self.results.append(result)
+        print('{:48s} {:10.4f} ms'.format(name, result['time']), file=sys.stderr)
+
+    def kernels(self, sizes: List[int], localSize: Tuple[int, int] = (16, 16)) -> None:
+        """
+        Benchmarks the heat equation kernel variants on square grids
+
+        :param sizes: The grid sizes
+        :param localSize: The work group size. ``heat_eq_2D_shared4`` requires (16, 16)
+        """
+        with open(HEAT_KERNEL_FILE) as f:
+            program = self.ocl.buildProgram(f.read())
+
+        alpha, dt, dx, dy = np.float32(1e-5), np.float32(0.01), np.float32(1e-3), np.float32(1e-3)
+        mf = cl.mem_flags
+
+        for n in sizes:
+            u0 = np.random.rand(n, n).astype(np.float32)
+            bufU0 = cl.Buffer(self.ocl.context, mf.READ_WRITE | mf.COPY_HOST_PTR, hostbuf=u0)
+            bufU1 = cl.Buffer(self.ocl.context, mf.READ_WRITE, u0.nbytes)
+
+            variants = {}
+
+            kernel = cl.Kernel(program, 'heat_eq_2D')
+            local = localSize if n % localSize[0] == 0 and n % localSize[1] == 0 else None
+            variants['heat_eq_2D'] = (kernel, (n, n), local, [bufU1, bufU0, alpha, dt, dx, dy])
+
+            kernel = cl.Kernel(program, 'heat_eq_2D_shared')
+            plan = pyocl.LaunchPlanner(self.ocl.device, kernel).plan((n, n), localSize)
+            variants['heat_eq_2D_shared'] = (kernel, plan.globalSize, plan.localSize,
+                                             [bufU1, bufU0, plan.localMemory(), alpha, dt, dx, dy,
+                                              np.int32(n), np.int32(n)])
+
+            kernel = cl.Kernel(program, 'heat_eq_2D_shared4')
+            plan = pyocl.LaunchPlanner(self.ocl.device, kernel).plan((n, n), localSize, vectorWidth=8)
+            variants['heat_eq_2D_shared4'] = (kernel, plan.globalSize, plan.localSize,
+                                              [bufU1, bufU0, plan.localMemory(), alpha, dt, dx, dy,
+                                               np.int32(n), np.int32(n)])
+
+            for name, (kernel, globalSize, local, args) in variants.items():
+                kernel(self.queue, globalSize, local, *args).wait()
+
+                times = [self._launch(kernel, globalSize, local, args) for i in range(self.repeats)]
+
+                time_ = float(np.median(times))
+                self.add('kernel/{:s}/{:d}'.format(name, n), 'kernel', times, size=n,
+                         localSize=list(local) if local else None,
+                         mcells=n * n / (time_ * 1e3),
+                         bandwidth=2 * u0.nbytes / (time_ * 1e6))
+
+            bufU0.release()
+            bufU1.release()
+
+    def _launch(self, kernel: cl.Kernel, globalSize: Tuple[int, ...], localSize: Optional[Tuple[int, ...]],
+                args: List[Any]) -> float:
+
+        ev = kernel(self.queue, globalSize, localSize, *args)
+        ev.wait()
+
+        return eventTime(ev)
+
+    def transfers(self, nbytes: int) -> None:
+        """
+        Benchmarks the upload and download bandwidth of a host array for each memory allocation strategy
+
+        :param nbytes: The size of the transfer [bytes]
+        """
+        context = self.ocl.context
+        queue = self.queue
+        mf = cl.mem_flags
+        host = np.random.rand(nbytes // 4).astype(np.float32)
+        out = np.empty_like(host)
+
+        def record(strategy: str, direction: str, times: List[float]) -> None:
+            time_ = float(np.median(times))
+            self.add('transfer/{:s}/{:s}'.format(strategy, direction), 'transfer', times,
+                     nbytes=host.nbytes, bandwidth=host.nbytes / (time_ * 1e6))
+
+        # Allocation and initialisation of a device buffer from the host array
+        def copyHostPtr():
+            cl.Buffer(context, mf.READ_WRITE | mf.COPY_HOST_PTR, hostbuf=host).release()
+
+        record('COPY_HOST_PTR', 'htod', hostTime(copyHostPtr, self.repeats))
+
+        # Explicit copies between pageable host memory and a device buffer
+        buffer = cl.Buffer(context, mf.READ_WRITE, host.nbytes)
+        record('copy', 'htod', hostTime(lambda: cl.enqueue_copy(queue, buffer, host, is_blocking=True),
+                                        self.repeats))
+        record('copy', 'dtoh', hostTime(lambda: cl.enqueue_copy(queue, out, buffer, is_blocking=True),
+                                        self.repeats))
+
+        # Copies staged through a pinned host buffer allocated by the runtime
+        pinned = cl.Buffer(context, mf.READ_WRITE | mf.ALLOC_HOST_PTR, host.nbytes)
+        pinnedArray, ev = cl.enqueue_map_buffer(queue, pinned, cl.map_flags.READ | cl.map_flags.WRITE, 0,
+                                                host.shape, host.dtype, is_blocking=True)
+        pinnedArray[...] = host
+
+        record('ALLOC_HOST_PTR', 'htod', hostTime(lambda: cl.enqueue_copy(queue, buffer, pinnedArray,
+                                                                          is_blocking=True), self.repeats))
+        record('ALLOC_HOST_PTR', 'dtoh', hostTime(lambda: cl.enqueue_copy(queue, pinnedArray, buffer,
+                                                                          is_blocking=True), self.repeats))
+        pinnedArray.base.release(queue)
+
+        # Zero-copy mapping of host memory used directly by the device
+        def mapped(flags: int) -> Callable[[], None]:
+            def func():
+                with pyocl.mapBuffer(queue, target, host.shape, host.dtype, flags) as array:
+                    array[0]
+            return func
+
+        for strategy, flags in (('USE_HOST_PTR', mf.READ_WRITE | mf.USE_HOST_PTR),
+                                ('ALLOC_HOST_PTR_MAP', mf.READ_WRITE | mf.ALLOC_HOST_PTR)):
+            target = cl.Buffer(context, flags, host.nbytes, hostbuf=host if flags & mf.USE_HOST_PTR else None)
+            record(strategy, 'map', hostTime(mapped(cl.map_flags.READ), self.repeats))
+            target.release()
+
+        queue.finish()
+        buffer.release()
+        pinned.release()
+
+    def builds(self) -> None:
+        """
+        Benchmarks building the heat equation program from source (cold), from the on-disk binary cache (warm) and
+        from the programs retained in memory by the Core
+        """
+        with open(HEAT_KERNEL_FILE) as f:
+            source = f.read()
+
+        cold, warm, memory = [], [], []
+
+        with tempfile.TemporaryDirectory() as cacheDir:
+            ocl = self.ocl
+            cache = ocl.programCache
+
+            try:
+                ocl.programCache = pyocl.ProgramCache(cacheDir)
+
+                for i in range(max(self.repeats // 2, 1)):
+                    # A unique definition defeats the driver and PyOpenCL caches
+                    options = ['-DPYOCL_BENCHMARK={:s}'.format(uuid.uuid4().hex)]
+
+                    ocl.clearPrograms()
+                    startTime = time.perf_counter()
+                    ocl.buildProgram(source, options)
+                    cold.append((time.perf_counter() - startTime) * 1e3)
+
+                    ocl.clearPrograms()
+                    startTime = time.perf_counter()
+                    ocl.buildProgram(source, options)
+                    warm.append((time.perf_counter() - startTime) * 1e3)
+
+                    startTime = time.perf_counter()
+                    ocl.buildProgram(source, options)
+                    memory.append((time.perf_counter() - startTime) * 1e3)
+            finally:
+                ocl.clearPrograms()
+                ocl.programCache = cache
+
+        self.add('build/cold', 'build', cold)
+        self.add('build/warm', 'build', warm)
+        self.add('build/memory', 'build', memory)
+
+    def launchOverhead(self, launches: int = 1000) -> None:
+        """
+        Benchmarks the host overhead of enqueuing a trivial kernel, the round-trip latency of a launch and the
+        delay between the launch being queued and started on the device
+
+        :param launches: The number of launches
+        """
+        program = self.ocl.buildProgram(LAUNCH_SRC)
+        kernel = cl.Kernel(program, 'noop')
+        buffer = cl.Buffer(self.ocl.context, cl.mem_flags.READ_WRITE, 4)
+
+        def enqueue():
+            for i in range(launches):
+                kernel(self.queue, (1,), None, buffer)
+            self.queue.finish()
+
+        times = [t / launches for t in hostTime(enqueue, self.repeats)]
+        self.add('launch/enqueue', 'launch', times, launches=launches)
+
+        times = hostTime(lambda: kernel(self.queue, (1,), None, buffer).wait(), self.repeats * 10)
+        self.add('launch/roundtrip', 'launch', times)
+
+        events = [kernel(self.queue, (1,), None, buffer) for i in range(self.repeats * 10)]
+        cl.wait_for_events(events)
+        self.add('launch/latency', 'launch', [(ev.profile.start - ev.profile.queued) * 1e-6 for ev in events])
+
+        buffer.release()
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Returns the results together with a description of the environment
+        """
+        device = self.ocl.device
+
+        return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'host': {'python': platform.python_version(),
+                         'machine': platform.machine(),
+                         'pyopencl': cl.VERSION_TEXT},
+                'device': {'name': device.name.strip(),
+                           'platform': device.platform.name,
+                           'version': device.version,
+                           'driver': device.driver_version,
+                           'computeUnits': device.max_compute_units},
+                'results': self.results}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Compares the results against a baseline
+
+    :param results: The current results
+    :param baseline: The baseline results
+    :param tolerance: The permitted relative increase in time
+    :return: A description of each regression
+    """
+    reference = {r['name']: r for r in baseline['results']}
+    regressions = []
+
+    for result in results['results']:
+        base = reference.get(result['name'])
+
+        if base is None or base['time'] <= 0.0:
+            continue
+
+        ratio = result['time'] / base['time']
+
+        if ratio > 1.0 + tolerance:
+            regressions.append('{:s}: {:.4f} ms (baseline {:.4f} ms, {:+.1f}%)'.format(
+                    result['name'], result['time'], base['time'], (ratio - 1.0) * 100.0))
+
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    parser = argparse.ArgumentParser(description='PyOCL benchmark suite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024, 2048],
+                        help='grid sizes for the kernel benchmarks')
+    parser.add_argument('--transfer-size', type=int, default=64, help='transfer size [MB]')
+    parser.add_argument('--repeats', type=int, default=10, help='number of timed repeats')
+    parser.add_argument('--launches', type=int, default=1000, help='number of launches for the overhead')
+    parser.add_argument('--only', nargs='+', choices=['kernels', 'transfers', 'builds', 'launch'],
+                        help='run a subset of the benchmarks')
+    parser.add_argument('--gpu', action='store_true', help='prefer a GPU device')
+    parser.add_argument('--output', help='write the results to a JSON file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='permitted relative slow down')
+
+    args = parser.parse_args(argv)
+    groups = args.only or ['kernels', 'transfers', 'builds', 'launch']
+
+    suite = BenchmarkSuite(pyocl.Core(useGPU=args.gpu), args.repeats)
+
+    if 'kernels' in groups:
+        suite.kernels(args.sizes)
+
+    if 'transfers' in groups:
+        suite.transfers(args.transfer_size * 1024 * 1024)
+
+    if 'builds' in groups:
+        suite.builds()
+
+    if 'launch' in groups:
+        suite.launchOverhead(args.launches)
+
+    results = suite.report()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+        for regression in regressions:
+            print('Regression - ' + regression, file=sys.stderr)
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,6 +16,9 @@ class TransientHeatSim(pyocl.OpenCLSimBase):
     """
     Class that holds data for the heat equation using OpenCL
     """
+
+    # Precision policy for heat_eq_2D_precision e.g. half precision storage halves the memory traffic of the stencil
+    # precision = pyocl.Precision.HALF
     def __init__(self, u0):
         # Make sure that the data is single precision floating point
         assert (np.issubdtype(u0.dtype, np.float32))
@@ -73,12 +76,22 @@ class TransientHeatSim(pyocl.OpenCLSimBase):
 
     @property
     def kernel(self):
+        return self.renderKernel()
+
+    def renderKernel(self, **params):
         from mako.template import Template
         with open('./heat_eq_2D.cl') as f:
-            code = str(Template(f.read()).render())
+            code = str(Template(f.read()).render(**params))
 
         return code
 
+    def specialiseCoefficients(self):
+        # Bake the coefficients and domain size into the kernel as compile-time constants. Variants are cached,
+        # so returning to earlier parameters does not rebuild the kernel
+        return self.specialise(KAPPA1=np.float32(self.alpha * self.dt / (self.dx * self.dx)),
+                               KAPPA2=np.float32(self.alpha * self.dt / (self.dy * self.dy)),
+                               NX=self.nx, NY=self.ny)
+
     @property
     def alpha(self) -> np.float32:
         return np.float32(self.k / (self.rho * self.cp))
@@ -94,24 +107,47 @@ class TransientHeatSim(pyocl.OpenCLSimBase):
         #        ev = self.program.copy(self.queue, (self.nx, self.ny), self.workGroupSize,
         #                             self.u1, self.u0)
 
-        #        ev = self.program.heat_eq_2D_shared(self.queue, (self.nx, self.ny), self.workGroupSize,
-        #                                     self.u1, self.u0, cl.LocalMemory(4*18*18),
-        #                                     np.float32(self.alpha), np.float32(self.dt), np.float32(self.dx), np.float32(self.dy))
+        #        # The launch planner sizes the local tile and pads the global range for arbitrary grid sizes
+        #        plan = self.planLaunch('heat_eq_2D_shared', (self.nx, self.ny), halo=1)
+        #        ev = self.getKernel('heat_eq_2D_shared')(self.queue, plan.globalSize, plan.localSize,
+        #                                     self.u1, self.u0, plan.localMemory(),
+        #                                     np.float32(self.alpha), np.float32(self.dt), np.float32(self.dx), np.float32(self.dy),
+        #                                     np.int32(self.nx), np.int32(self.ny))
+
+        #        plan = self.planLaunch('heat_eq_2D_shared4', (self.nx, self.ny), halo=1, vectorWidth=8)
+        #        ev = self.getKernel('heat_eq_2D_shared4')(self.queue, plan.globalSize, plan.localSize,
+        #                                     self.u1, self.u0, plan.localMemory(),
+        #                                     np.float32(self.alpha), np.float32(self.dt), np.float32(self.dx), np.float32(self.dy),
+        #                                     np.int32(self.nx), np.int32(self.ny))
+
+        self.run(1)  # wait for kernel to finish
+
+    def enqueueStep(self, waitFor=None):
+        # Enqueue the kernel without waiting on the host
+
+        # ev = self.getKernel('heat_eq_2D_precision')(self.queue, (self.nx, self.ny), self.workGroupSize,
+        #                                             self.u1, self.u0,
+        #                                             self.real(self.alpha * self.dt / (self.dx * self.dx)),
+        #                                             self.real(self.alpha * self.dt / (self.dy * self.dy)),
+        #                                             wait_for=waitFor)
 
-        #        ev = self.program.heat_eq_2D_shared4(self.queue, (self.nx, self.ny), self.workGroupSize,
-        #                                     self.u1, self.u0, cl.LocalMemory(4*18*24),
-        #                                     np.float32(self.alpha), np.float32(self.dt), np.float32(self.dx), np.float32(self.dy))
+        # ev = self.getKernel('heat_eq_2D_const')(self.queue, (self.nx, self.ny), self.workGroupSize,
+        #                                         self.u1, self.u0, wait_for=waitFor)
 
-        ev = self.program.heat_eq_2D(self.queue, (self.nx, self.ny), self.workGroupSize,
-                                     self.u1, self.u0,
-                                     np.float32(self.alpha), np.float32(self.dt), np.float32(self.dx),
-                                     np.float32(self.dy))
+        ev = self.getKernel('heat_eq_2D')(self.queue, (self.nx, self.ny), self.workGroupSize,
+                                          self.u1, self.u0,
+                                          np.float32(self.alpha), np.float32(self.dt), np.float32(self.dx),
+                                          np.float32(self.dy), wait_for=waitFor)
 
-        ev.wait()  # wait for kernel to finish
-        # print('Time taken {:.5f}'.format((ev.profile.end - ev.profile.start)*1e-9))
         # Swap the buffers ( this involves pointers so no copying is actually performed!)
         self.u0, self.u1 = self.u1, self.u0
 
+        return ev
+
+    def enqueueResidual(self, waitFor=None):
+        # Reduce the change of the most recent step on the device. After the swap, u0 holds the new state
+        return self.convergenceMonitor.enqueue(self.queue, self.u0, self.u1, self.nx * self.ny, waitFor)
+
     def download(self):
         """
         Enables downloading data from CL device to Python
@@ -122,7 +158,7 @@ class TransientHeatSim(pyocl.OpenCLSimBase):
 
         #  Transfers a copy from the device buffer (u0) to host array (self.u0)
         # is_blocking is by default true on transfers between the host
-        cl.enqueue_copy(self.queue, u1, self.u1, is_blocking=True)
+        self.enqueueCopy(u1, self.u1, is_blocking=True)
 
         # Return
         return u1
@@ -149,8 +185,17 @@ heatsim.cp = 920.0  # J/kgK
 heatsim.dx = heatsim.dy = 1e-3  # [m]
 heatsim.dt = heatsim.maxTimestep()
 
-# Set the work group size for the kernel
-heatsim.workGroupSize = (16, 16)
+# Select the fastest work group size for the kernel. The result is persisted for subsequent runs
+heatsim.autotuneWorkGroupSize('heat_eq_2D', (heatsim.nx, heatsim.ny),
+                              (heatsim.u1, heatsim.u0, heatsim.alpha, np.float32(heatsim.dt),
+                               np.float32(heatsim.dx), np.float32(heatsim.dy)))
+
+# Run to steady state, reducing the change of the field on the device every convergenceInterval steps
+# heatsim.run(100000, tolerance=1e-3)
+# print('Converged after {:d} steps - max change {:.3e}'.format(heatsim.stepsRun, heatsim.residual.maxChange))
+
+# Record the device timings of each kernel launch and transfer
+heatsim.profiler = pyocl.Profiler()
 
 avgIncTime = []
 for i in range(1, 10):
@@ -158,9 +203,9 @@ for i in range(1, 10):
     # Simulate 10 timesteps
 
     startTime = time.time()
-    for j in range(0, timesteps_per_plot):
-        # Perform a kernal launch. Note these are synchronously launched.
-        heatsim.step()
+
+    # Enqueue the batch of timesteps and only wait on the host for the final step
+    heatsim.run(timesteps_per_plot)
 
     endTime = float((time.time() - startTime)) / float(timesteps_per_plot)
 
@@ -170,7 +215,10 @@ for i in range(1, 10):
 # Note that on shared memory devices (Intel) The result can be used immediately
 
 if heatsim.ocl.hasSharedMemory():
-    plt.imshow(u0)
+    # Map the device buffer to a NumPy view without copying the field
+    with heatsim.mapBuffer(heatsim.u0, u0.shape, flags=cl.map_flags.READ) as u:
+        plt.imshow(u)
+        plt.savefig('heat_eq_2D.png')
 else:
     # Download data if using a non-shared memory device e.g. GPU
     u1 = heatsim.download()
@@ -178,3 +226,9 @@ else:
 
 print('Average iteration time {:.5f} ± {:.3f} ms '.format(np.mean(avgIncTime) * 1e3, np.std(avgIncTime) * 1e3))
 print('Average iteration time {:.5f} MPix '.format(nx * ny / np.mean(avgIncTime) / 1e6))
+
+for name, stats in heatsim.profiler.stats().items():
+    print('{:s}: {:d} launches, {:.3f} ms mean, {:.2f} GB/s'.format(name, stats['count'], stats['mean'],
+                                                                    stats['bandwidth']))
+
+heatsim.profiler.exportChromeTrace('heat_eq_2D_trace.json')
@@ -19,113 +19,95 @@ kernel void copy(global const float * in,
 }
 
 
-__kernel void heat_eq_2D_shared4(__global float *u1, __global const float *u0, __local float *block, float alpha, float dt, float dx, float dy) {
-    
-    //Get total number of cells
-    int nx = get_global_size(0);
-    int ny = get_global_size(1);
-    
+__kernel void heat_eq_2D_shared4(__global float *u1, __global const float *u0, __local float *block, float alpha, float dt, float dx, float dy,
+                                 int nx, int ny) {
+
+    // The real extents of the domain (nx, ny) are passed in, as the global size is padded to a multiple of the work group
+    // size. The tile of the work group includes the halo (1 cell), with the width padded to a multiple of the vector
+    // width (see OpenCLSimBase.planLaunch with vectorWidth=8)
+
     int i  = get_global_id(0);
     int j  = get_global_id(1);
-    
-    int loadWidth = 8;
-    
-    int localHeight = 18; //18; 
-    int localWidth  = 24;// vec4 needs to be a multiple of 4
-    
+
+    const int loadWidth = 8;
+
+    int localHeight = get_local_size(1) + 2;
+    int localWidth  = ((get_local_size(0) + 2 + loadWidth - 1) / loadWidth) * loadWidth;
+
     // Determine where each workgroup begins reading
-    int groupStartCol = get_group_id(0)*get_local_size(0)/loadWidth;
+    int groupStartCol = get_group_id(0)*get_local_size(0);
     int groupStartRow = get_group_id(1)*get_local_size(1);
-    
+
     // Determine the local ID of each work-item
     int localId = get_local_id(1) * get_local_size(0) + get_local_id(0); // Flatten id to array
-    
-    // Each work item is reading 
-    int localRow = localId / (localWidth / loadWidth); // Multiple of 4 to get the current row
-    int localCol = localId % (localWidth /loadWidth);  // Position along using the modulus
-    
-    // Current position in the global grid
-    int globalRow = groupStartRow + localRow;
-    int globalCol = groupStartCol + localCol;
- 
-    
-    // Determine the global ID of each work-item. work-items
-    // representing the output region will have a unique
-    // global ID
-    
-    
-    //float block[18*18];
-    
-    // Cache global memory into local memory
-    // We set the block4
-    
-     __local float8* block4;
+    int groupSize = get_local_size(0) * get_local_size(1);
+
+    // Cache global memory into local memory, with each work-item loading vectors of loadWidth cells. The vectors
+    // crossing the edge of the domain are loaded per cell
+    int vectorsPerRow = localWidth / loadWidth;
+
+    for(int v = localId; v < vectorsPerRow * localHeight; v += groupSize) {
+        int row = v / vectorsPerRow;
+        int col = (v % vectorsPerRow) * loadWidth;
+
+        int curRow = groupStartRow + row;
+        int curCol = groupStartCol + col;
+
+        __local float *dst = &block[row * localWidth + col];
+
+        if(curRow < ny && curCol + loadWidth <= nx) {
+            vstore8(vload8(0, u0 + curRow * nx + curCol), 0, dst);
+        } else if(curRow < ny) {
+            for(int k = 0; k < loadWidth && curCol + k < nx; k++) {
+                dst[k] = u0[curRow * nx + curCol + k];
+            }
+        }
+    }
 
-     
-     // Initialise the block 4 pointer to the local memory space
-     block4 = (__local float8*) &block[localRow*localWidth+localCol*loadWidth];
-    
-     if(globalRow < ny && globalCol < nx/loadWidth && 
-         localRow < localHeight) {
-         block4[0] = vload8(globalRow*nx/loadWidth +globalCol, u0);
-     }
-    
     __local float kappa1;
     __local float kappa2;
-    
+
     if(get_local_id(0) == 0 && get_local_id(1) == 0) {
         kappa1 = alpha * dt / (dx * dx);
         kappa2 = alpha * dt / (dy * dy);
-        
+
     }
-    
+
     // Required to ensure all the work items are syncrhonised together
     barrier(CLK_LOCAL_MEM_FENCE);
-    
-    //i = clamp(i,1,nx-2);
-    //j = clamp(j,1,ny-2);
-    //Calculate the four indices of our neighbouring cells
-    //int offset = 1; 
-    
+
     // The initial offset is needed so Image[i,j] starts at (1,1)
-    
-    localCol = get_local_id(0);
-    localRow = get_local_id(1);
-    
+    int localCol = get_local_id(0);
+    int localRow = get_local_id(1);
+
     int ii = localCol+1; int jj = localRow+1;
-    
+
     int center = jj * localWidth + (ii);
     int north = (jj + 1) * localWidth + (ii);
     int south = (jj - 1) * localWidth + ii;
     int east = jj * localWidth + (ii + 1);
     int west = jj * localWidth + (ii - 1);
-    
-    float tmp = 0.0;
-    
 
-    
-    globalCol = get_group_id(0)*get_local_size(0) + localCol;
-    globalRow =  get_group_id(1)*get_local_size(1) + localRow;
-    
+    int globalCol = groupStartCol + localCol;
+    int globalRow = groupStartRow + localRow;
+
     //Internall cells
     if ((globalCol < nx-2) && (globalRow < ny-2)) {
-        u1[(j+1)* nx + i+1] = block[center] + kappa1 * (block[west] - 2.0 * block[center] + block[east])
-        + kappa2 * (block[south] - 2.0 * block[center] + block[north]);
-        // u1[(j)* nx + i]= tmp;
-    } 
-    
-    if( globalCol < 1 || globalCol > nx-2 || globalRow < 1 || globalRow > ny-2) {
+        u1[(j+1)* nx + i+1] = block[center] + kappa1 * (block[west] - 2.0f * block[center] + block[east])
+                                     + kappa2 * (block[south] - 2.0f * block[center] + block[north]);
+    }
+
+    if( (globalCol < nx && globalRow < ny) &&
+        (globalCol < 1 || globalCol > nx-2 || globalRow < 1 || globalRow > ny-2)) {
         u1[(j)* nx + i] = block[localRow*localWidth + localCol];
     }
-    
-    
 }
 
-__kernel void heat_eq_2D_shared(__global float *u1, __global const float *u0, __local float *block, float alpha, float dt, float dx, float dy) {
+__kernel void heat_eq_2D_shared(__global float *u1, __global const float *u0, __local float *block, float alpha, float dt, float dx, float dy,
+                                int nx, int ny) {
 
-   //Get total number of cells
-   int nx = get_global_size(0);
-   int ny = get_global_size(1);
+   // The real extents of the domain (nx, ny) are passed in, as the global size is padded to a multiple of the work group
+   // size (see OpenCLSimBase.planLaunch)
 
    int i  = get_global_id(0);
    int j  = get_global_id(1);
@@ -139,8 +121,9 @@ __kernel void heat_eq_2D_shared(__global float *u1, __global const float *u0, __
     int localCol = get_local_id(0);
     int localRow = get_local_id(1);
 
-    int localHeight = 18; //18; 
-    int localWidth  = 18;// vec4 needs to be a multiple of 4
+    // Local tile including the halo (1 cell) of the stencil
+    int localHeight = get_local_size(1) + 2;
+    int localWidth  = get_local_size(0) + 2;
 
     // Determine the global ID of each work-item. work-items
     // representing the output region will have a unique
@@ -205,7 +188,8 @@ __kernel void heat_eq_2D_shared(__global float *u1, __global const float *u0, __
       // u1[(j)* nx + i]= tmp;
    } 
    
-   if( globalCol < 1 || globalCol > nx-2 || globalRow < 1 || globalRow > ny-2) {
+   if( (globalCol < nx && globalRow < ny) &&
+       (globalCol < 1 || globalCol > nx-2 || globalRow < 1 || globalRow > ny-2)) {
        u1[(j)* nx + i] = block[localRow*localWidth + localCol];
    }
    
@@ -256,3 +240,56 @@ __kernel void heat_eq_2D(__global float *u1, __global const float *u0, float alp
     
     
 }
+
+
+#if defined(KAPPA1) && defined(KAPPA2)
+// Specialised variant with the coefficients baked in as compile-time constants (see OpenCLSimBase.specialise)
+__kernel void heat_eq_2D_const(__global float *u1, __global const float *u0) {
+
+#if defined(NX) && defined(NY)
+    const int nx = NX;
+    const int ny = NY;
+#else
+    int nx = get_global_size(0);
+    int ny = get_global_size(1);
+#endif
+
+    int i  = get_global_id(0);
+    int j  = get_global_id(1);
+
+    int center = j * nx + i;
+
+    if (i > 0 && i < nx - 1 && j > 0 && j < ny - 1) {
+        u1[center] = u0[center] + KAPPA1 * (u0[center - 1] - 2.0f * u0[center] + u0[center + 1])
+                                + KAPPA2 * (u0[center - nx] - 2.0f * u0[center] + u0[center + nx]);
+    } else {
+        // Boundary conditions (ghost cells)
+        u1[center] = u0[center];
+    }
+}
+#endif
+
+
+#ifdef PYOCL_PRECISION
+// Variant following the precision policy of the simulation (see OpenCLSimBase.precision). The fields are stored as
+// storage_t (e.g. half) and the arithmetic is performed in real_t
+__kernel void heat_eq_2D_precision(__global storage_t *u1, __global const storage_t *u0, real_t kappa1, real_t kappa2) {
+
+    int nx = get_global_size(0);
+    int ny = get_global_size(1);
+
+    int i  = get_global_id(0);
+    int j  = get_global_id(1);
+
+    int center = j * nx + i;
+    real_t c = LOAD(u0, center);
+
+    if (i > 0 && i < nx - 1 && j > 0 && j < ny - 1) {
+        STORE(u1, center, c + kappa1 * (LOAD(u0, center - 1) - 2 * c + LOAD(u0, center + 1))
+                            + kappa2 * (LOAD(u0, center - nx) - 2 * c + LOAD(u0, center + nx)));
+    } else {
+        // Boundary conditions (ghost cells)
+        STORE(u1, center, c);
+    }
+}
+#endif
@@ -1,2 +1,68 @@
-from .core import OpenCLFlags, Core
-from .sim import OpenCLSimBase
+"""
+The public classes of pyocl are imported on first access, so that ``import pyocl`` does not load PyOpenCL or the
+OpenCL runtime. For example, :mod:`pyocl.capabilities` can load saved device capabilities without either.
+"""
+import importlib
+
+_EXPORTS = {
+    'OpenCLFlags': 'core',
+    'Core': 'core',
+    'BuildProfile': 'core',
+    'OpenCLSimBase': 'sim',
+    'ProfileValidation': 'sim',
+    'ProgramCache': 'cache',
+    'CorePool': 'pool',
+    'WorkGroupTuner': 'tuning',
+    'Profiler': 'profiling',
+    'ProfileRecord': 'profiling',
+    'BufferPool': 'memory',
+    'DoubleBuffer': 'memory',
+    'mapBuffer': 'memory',
+    'Slab': 'decomposition',
+    'SlabDecomposition': 'decomposition',
+    'DeviceSelector': 'selection',
+    'Workload': 'selection',
+    'SnapshotWriter': 'snapshot',
+    'Tile': 'tiling',
+    'TiledExecutor': 'tiling',
+    'TemporalHeatStencil2D': 'stencil',
+    'ImageHeatStencil': 'stencil',
+    'HeatEnsemble2D': 'stencil',
+    'ConvergentHeatStencil2D': 'stencil',
+    'Ensemble': 'ensemble',
+    'LaunchPlan': 'launch',
+    'LaunchPlanner': 'launch',
+    'Precision': 'precision',
+    'ImageField': 'image',
+    'clampSampler': 'image',
+    'hasImageSupport': 'image',
+    'SimExecutor': 'executor',
+    'PartitionScheduler': 'scheduler',
+    'Checkpoint': 'checkpoint',
+    'ConvergenceMonitor': 'convergence',
+    'ConvergenceNorm': 'convergence',
+    'Residual': 'convergence',
+    'DeviceCapabilities': 'capabilities',
+    'deviceCapabilities': 'capabilities',
+    'loadCapabilities': 'capabilities',
+    'saveCapabilities': 'capabilities',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+
+    module = _EXPORTS.get(name)
+
+    if module is None:
+        raise AttributeError("module 'pyocl' has no attribute '{:s}'".format(name))
+
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+import pyopencl as cl
+
+from .paths import atomicWrite, cacheDirectory
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache holding a bounded number of entries. The least recently used entry is evicted once
+    the maximum number of entries is exceeded.
+    """
+
+    def __init__(self, maxEntries: int = 64) -> None:
+        self._maxEntries = maxEntries
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    @property
+    def maxEntries(self) -> int:
+        """
+        The maximum number of entries held by the cache
+        """
+        return self._maxEntries
+
+    @maxEntries.setter
+    def maxEntries(self, maxEntries: int):
+        with self._lock:
+            self._maxEntries = maxEntries
+            self._evict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns an entry from the cache and marks it as recently used
+
+        :param key: The key of the entry
+        :param default: The value returned if the entry is not available
+        :return: The cached value
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores an entry in the cache, evicting the least recently used entries if required
+
+        :param key: The key of the entry
+        :param value: The value to store
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self._maxEntries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Removes all entries from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class ProgramCache:
+    """
+    Persistent on-disk cache of compiled OpenCL program binaries.
+
+    Entries are keyed by a hash of the rendered kernel source, the build options and the identity of the device
+    (device name, driver version and platform). The total size of the cache is bounded and the least recently used
+    entries are evicted once the bound is exceeded. Any failure to load a cached binary falls back to building the
+    program from source.
+    """
+
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024  # 256 MB
+    FILE_EXTENSION = '.bin'
+
+    def __init__(self, cacheDir: Optional[str] = None, maxSize: int = DEFAULT_MAX_SIZE) -> None:
+
+        if cacheDir is None:
+            cacheDir = ProgramCache.defaultCacheDir()
+
+        self._cacheDir = cacheDir
+        self._maxSize = maxSize
+
+    @staticmethod
+    def defaultCacheDir() -> str:
+        """
+        Returns the default location of the program cache within :func:`cacheDirectory`
+
+        :return: The default cache directory
+        """
+        return os.path.join(cacheDirectory(), 'programs')
+
+    @property
+    def cacheDir(self) -> str:
+        """
+        The directory used for storing the program binaries
+        """
+        return self._cacheDir
+
+    @property
+    def maxSize(self) -> int:
+        """
+        The maximum size of the cache [bytes]
+        """
+        return self._maxSize
+
+    @maxSize.setter
+    def maxSize(self, size: int):
+        self._maxSize = size
+        self.evict()
+
+    @staticmethod
+    def generateKey(source: str, options: List[str], device: cl.Device) -> str:
+        """
+        Generates the cache key for a program built on a device
+
+        :param source: The rendered kernel source
+        :param options: The build options passed to the compiler
+        :param device: The OpenCL device the program is built for
+        :return: A hex digest identifying the program binary
+        """
+        hasher = hashlib.sha256()
+
+        for item in (source,
+                     ' '.join(options),
+                     device.name,
+                     device.driver_version,
+                     device.platform.name,
+                     device.platform.version):
+            hasher.update(item.encode('utf-8'))
+            hasher.update(b'\0')
+
+        return hasher.hexdigest()
+
+    def _entryPath(self, key: str) -> str:
+        return os.path.join(self._cacheDir, key + ProgramCache.FILE_EXTENSION)
+
+    def _entries(self) -> List[os.DirEntry]:
+
+        if not os.path.isdir(self._cacheDir):
+            return []
+
+        return [entry for entry in os.scandir(self._cacheDir)
+                if entry.is_file() and entry.name.endswith(ProgramCache.FILE_EXTENSION)]
+
+    def _stats(self) -> List[Tuple[str, os.stat_result]]:
+
+        # Entries may be removed concurrently by other processes or threads, so these are skipped
+        stats = []
+
+        try:
+            entries = self._entries()
+        except OSError:
+            return stats
+
+        for entry in entries:
+            try:
+                stats.append((entry.path, entry.stat()))
+            except OSError:
+                pass
+
+        return stats
+
+    @property
+    def size(self) -> int:
+        """
+        Returns the total size of the binaries currently stored in the cache
+
+        :return: Cache size [bytes]
+        """
+        return sum(stat.st_size for path, stat in self._stats())
+
+    def __len__(self) -> int:
+        return len(self._entries())
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.isfile(self._entryPath(key))
+
+    def load(self, key: str) -> Optional[bytes]:
+        """
+        Loads a program binary from the cache. A successful lookup marks the entry as recently used.
+
+        :param key: The cache key
+        :return: The program binary or None if the entry is not available
+        """
+        path = self._entryPath(key)
+
+        try:
+            with open(path, 'rb') as f:
+                binary = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+
+        return binary
+
+    def store(self, key: str, binary: bytes) -> None:
+        """
+        Stores a program binary in the cache and evicts the least recently used entries if the cache size is exceeded.
+
+        :param key: The cache key
+        :param binary: The program binary
+        """
+        if not binary or len(binary) > self._maxSize:
+            return
+
+        try:
+            atomicWrite(self._entryPath(key), binary)
+            self.evict()
+
+        except OSError as e:
+            logging.warning('Unable to store program binary in cache ({:s})'.format(str(e)))
+
+    def remove(self, key: str) -> None:
+        """
+        Removes an entry from the cache
+
+        :param key: The cache key
+        """
+        try:
+            os.remove(self._entryPath(key))
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        """
+        Evicts the least recently used entries until the cache is within the maximum size
+        """
+        entries = sorted(self._stats(), key=lambda entry: entry[1].st_mtime)
+        totalSize = sum(stat.st_size for path, stat in entries)
+
+        for path, stat in entries:
+            if totalSize <= self._maxSize:
+                break
+
+            totalSize -= stat.st_size
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self) -> None:
+        """
+        Removes all entries from the cache
+        """
+        for entry in self._entries():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def buildProgram(self, context: cl.Context, device: cl.Device, source: str,
+                     options: Optional[List[str]] = None) -> cl.Program:
+        """
+        Builds an OpenCL program, using a cached binary if one is available for the source, options and device.
+        On a cache miss or an invalid binary, the program is built from source and the resulting binary is stored.
+
+        :param context: The OpenCL context
+        :param device: The OpenCL device to build the program for
+        :param source: The rendered kernel source
+        :param options: The build options passed to the compiler
+        :return: The built OpenCL program
+        """
+        options = list(options) if options else []
+        key = ProgramCache.generateKey(source, options, device)
+
+        binary = self.load(key)
+
+        if binary is not None:
+            try:
+                return cl.Program(context, [device], [binary]).build(options=options)
+            except (cl.Error, RuntimeError) as e:
+                logging.warning('Invalid cached program binary - rebuilding from source ({:s})'.format(str(e)))
+                self.remove(key)
+
+        program = cl.Program(context, source).build(options=options, devices=[device])
+
+        try:
+            deviceIdx = program.devices.index(device)
+            self.store(key, program.binaries[deviceIdx])
+        except (cl.Error, ValueError) as e:
+            logging.warning('Unable to retrieve program binary ({:s})'.format(str(e)))
+
+        return program
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import logging
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from .paths import atomicWrite, cacheDirectory
+
+# PyOpenCL is only imported when a device is queried, so that capabilities may be loaded from disk without loading
+# the OpenCL runtime
+
+
+class DeviceCapabilities(NamedTuple):
+    """
+    A frozen snapshot of the capabilities of an OpenCL device.
+
+    The snapshot is queried from the driver once (see :meth:`fromDevice`) and may be saved to disk, so that subsequent
+    processes can make decisions such as the choice of device, work group or tile sizes without enumerating the
+    OpenCL platforms (see :func:`deviceCapabilities`).
+    """
+
+    name: str
+    vendor: str
+    type: str
+    version: str
+    driverVersion: str
+    platformName: str
+    platformVendor: str
+    platformVersion: str
+    computeUnits: int
+    maxClockFrequency: int
+    maxWorkGroupSize: int
+    maxWorkItemSizes: Tuple[int, ...]
+    localMemorySize: int
+    globalMemorySize: int
+    maxMemAllocSize: int
+    hostUnifiedMemory: bool
+    imageSupport: bool
+    max2DImageSize: Tuple[int, int]
+    max3DImageSize: Tuple[int, int, int]
+    extensions: Tuple[str, ...]
+    platformExtensions: Tuple[str, ...]
+    outOfOrderExecution: bool = False
+
+    @classmethod
+    def fromDevice(cls, device) -> 'DeviceCapabilities':
+        """
+        Queries the capabilities of a device from the driver
+
+        :param device: The OpenCL device
+        :return: The capability snapshot
+        """
+        import pyopencl as cl
+
+        deviceType = 'OTHER'
+
+        for name in ('GPU', 'ACCELERATOR', 'CPU'):
+            if device.type & getattr(cl.device_type, name):
+                deviceType = name
+                break
+
+        try:
+            hostUnifiedMemory = bool(device.host_unified_memory)
+        except cl.Error:
+            # Attribute is deprecated from OpenCL 2.0 and may not be reported
+            hostUnifiedMemory = False
+
+        if device.image_support:
+            max2DImageSize = (device.image2d_max_width, device.image2d_max_height)
+            max3DImageSize = (device.image3d_max_width, device.image3d_max_height, device.image3d_max_depth)
+        else:
+            max2DImageSize = (0, 0)
+            max3DImageSize = (0, 0, 0)
+
+        try:
+            outOfOrderExecution = bool(device.queue_properties &
+                                       cl.command_queue_properties.OUT_OF_ORDER_EXEC_MODE_ENABLE)
+        except cl.Error:
+            outOfOrderExecution = False
+
+        platform = device.platform
+
+        return cls(name=device.name.strip(),
+                   vendor=device.vendor.strip(),
+                   type=deviceType,
+                   version=device.version,
+                   driverVersion=device.driver_version,
+                   platformName=platform.name.strip(),
+                   platformVendor=platform.vendor.strip(),
+                   platformVersion=platform.version,
+                   computeUnits=device.max_compute_units,
+                   maxClockFrequency=device.max_clock_frequency,
+                   maxWorkGroupSize=device.max_work_group_size,
+                   maxWorkItemSizes=tuple(device.max_work_item_sizes),
+                   localMemorySize=device.local_mem_size,
+                   globalMemorySize=device.global_mem_size,
+                   maxMemAllocSize=device.max_mem_alloc_size,
+                   hostUnifiedMemory=hostUnifiedMemory,
+                   imageSupport=bool(device.image_support),
+                   max2DImageSize=max2DImageSize,
+                   max3DImageSize=max3DImageSize,
+                   extensions=tuple(device.extensions.split()),
+                   platformExtensions=tuple(platform.extensions.split()),
+                   outOfOrderExecution=outOfOrderExecution)
+
+    @classmethod
+    def fromDict(cls, data: Dict[str, Any]) -> 'DeviceCapabilities':
+        """
+        Creates the snapshot from its dictionary representation (see :meth:`toDict`)
+
+        :param data: The dictionary
+        :return: The capability snapshot
+        """
+        return cls(**{name: tuple(value) if isinstance(value, list) else value for name, value in data.items()
+                      if name in cls._fields})
+
+    def toDict(self) -> Dict[str, Any]:
+        """
+        Returns the snapshot as a dictionary which may be serialised to JSON
+
+        :return: The dictionary
+        """
+        return dict(self._asdict())
+
+    @property
+    def isGPU(self) -> bool:
+        """
+        The device is a GPU
+        """
+        return self.type == 'GPU'
+
+    @property
+    def isCPU(self) -> bool:
+        """
+        The device is a CPU
+        """
+        return self.type == 'CPU'
+
+    def hasExtension(self, extension: str) -> bool:
+        """
+        Returns if the device reports an extension
+
+        :param extension: The name of the extension (e.g. ``cl_khr_fp64``)
+        :return: The extension is available
+        """
+        return extension in self.extensions
+
+    @property
+    def hasFloat16(self) -> bool:
+        """
+        The device has native float16 support
+        """
+        return self.hasExtension('cl_khr_fp16')
+
+    @property
+    def hasDouble(self) -> bool:
+        """
+        The device has native float64 (double) support
+        """
+        return self.hasExtension('cl_khr_fp64')
+
+    def device(self):
+        """
+        Finds the OpenCL device described by the snapshot. This enumerates the OpenCL platforms.
+
+        :return: The OpenCL device
+        """
+        for platform in platforms():
+            if platform.name.strip() != self.platformName:
+                continue
+
+            for device in platform.get_devices():
+                if device.name.strip() == self.name:
+                    return device
+
+        raise RuntimeError('OpenCL device <{:s}> is not available'.format(self.name))
+
+
+_platforms = None
+_platformsLock = threading.Lock()
+
+
+def platforms() -> List[Any]:
+    """
+    Returns the OpenCL platforms. The platforms are enumerated on first use and retained for the process, so that
+    repeated queries do not return to the ICD loader.
+
+    :return: The list of OpenCL platforms
+    """
+    global _platforms
+
+    with _platformsLock:
+        if _platforms is None:
+            import pyopencl as cl
+            _platforms = cl.get_platforms()
+
+        return _platforms
+
+
+def capabilitiesFile() -> str:
+    """
+    Returns the default location of the saved device capabilities within :func:`~pyocl.paths.cacheDirectory`
+
+    :return: The filename
+    """
+    return os.path.join(cacheDirectory(), 'capabilities.json')
+
+
+def saveCapabilities(capabilities: List[DeviceCapabilities], filename: Optional[str] = None) -> None:
+    """
+    Saves the capabilities of devices to disk
+
+    :param capabilities: The capability snapshots
+    :param filename: The file to write. By default :func:`capabilitiesFile` is used
+    """
+    filename = filename if filename else capabilitiesFile()
+
+    try:
+        atomicWrite(filename, json.dumps([c.toDict() for c in capabilities], indent=2))
+
+    except OSError as e:
+        logging.warning('Unable to save device capabilities ({:s})'.format(str(e)))
+
+
+def loadCapabilities(filename: Optional[str] = None) -> Optional[List[DeviceCapabilities]]:
+    """
+    Loads the capabilities of devices saved by :func:`saveCapabilities`. This does not load the OpenCL runtime.
+
+    :param filename: The file to read. By default :func:`capabilitiesFile` is used
+    :return: The capability snapshots or None if they are not available
+    """
+    filename = filename if filename else capabilitiesFile()
+
+    try:
+        with open(filename) as f:
+            return [DeviceCapabilities.fromDict(data) for data in json.load(f)]
+    except (OSError, ValueError, TypeError) as e:
+        logging.debug('Unable to load device capabilities ({:s})'.format(str(e)))
+        return None
+
+
+def deviceCapabilities(refresh: bool = False, filename: Optional[str] = None) -> List[DeviceCapabilities]:
+    """
+    Returns the capabilities of all the OpenCL devices. Saved capabilities are used when available, otherwise the
+    devices are queried and the capabilities are saved for subsequent processes.
+
+    :param refresh: Query the devices even if saved capabilities are available (e.g. after a driver update)
+    :param filename: The file to use. By default :func:`capabilitiesFile` is used
+    :return: The capability snapshots
+    """
+    if not refresh:
+        capabilities = loadCapabilities(filename)
+
+        if capabilities is not None:
+            return capabilities
+
+    capabilities = [DeviceCapabilities.fromDevice(device) for platform in platforms()
+                    for device in platform.get_devices()]
+
+    saveCapabilities(capabilities, filename)
+
+    return capabilities
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from .paths import atomicWrite
+
+
+def _toJSON(value: Any) -> Any:
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+
+    if isinstance(value, (list, tuple)):
+        return [_toJSON(v) for v in value]
+
+    if isinstance(value, dict):
+        return {str(k): _toJSON(v) for k, v in value.items()}
+
+    return value
+
+
+class Checkpoint:
+    """
+    A restartable checkpoint of named arrays and JSON serialisable scalar state stored in a directory.
+
+    Each array is stored as a memory-mapped ``.npy`` file, which is divided into tiles of :attr:`tileBytes`. A digest
+    of every tile is recorded, so that an incremental checkpoint only writes the tiles which have changed. The arrays
+    are written to two alternating slots, and the metadata file (``checkpoint.json``), which selects the current slot,
+    is replaced atomically once the arrays have been flushed. A checkpoint interrupted whilst being written (e.g. by
+    pre-emption) therefore leaves the previous checkpoint intact. The incremental write compares against the slot
+    being overwritten, which holds the checkpoint before the previous one.
+
+    Restoring maps the files of the current slot read-only (see :meth:`array`), so they may be copied straight to the
+    device without an intermediate host copy.
+    """
+
+    metadataFilename = 'checkpoint.json'
+
+    def __init__(self, directory: str, tileBytes: int = 1 << 20) -> None:
+        """
+        :param directory: The directory of the checkpoint, which is created if it does not exist
+        :param tileBytes: The size of the tiles compared by incremental checkpoints [bytes]. This is only used for
+                          a new checkpoint, otherwise the tile size of the existing checkpoint is retained.
+        """
+        self._directory = directory
+        self._metadata = {'version': 1, 'generation': 0, 'slot': None, 'tileBytes': int(tileBytes),
+                          'state': {}, 'arrays': {}}  # type: Dict[str, Any]
+
+        os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(self.metadataPath):
+            with open(self.metadataPath) as f:
+                self._metadata = json.load(f)
+
+    @property
+    def directory(self) -> str:
+        """
+        The directory of the checkpoint
+        """
+        return self._directory
+
+    @property
+    def metadataPath(self) -> str:
+        """
+        The path of the metadata file
+        """
+        return os.path.join(self._directory, self.metadataFilename)
+
+    @property
+    def exists(self) -> bool:
+        """
+        A checkpoint has been written
+        """
+        return self._metadata['slot'] is not None
+
+    @property
+    def generation(self) -> int:
+        """
+        The number of checkpoints written to the directory
+        """
+        return self._metadata['generation']
+
+    @property
+    def tileBytes(self) -> int:
+        """
+        The size of the tiles compared by incremental checkpoints [bytes]
+        """
+        return self._metadata['tileBytes']
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        """
+        The scalar state of the current checkpoint
+        """
+        return self._metadata['state']
+
+    @property
+    def names(self) -> List[str]:
+        """
+        The names of the arrays in the current checkpoint
+        """
+        return list(self._metadata['arrays'].keys())
+
+    def _path(self, name: str, slot: int) -> str:
+        return os.path.join(self._directory, '{:s}.{:d}.npy'.format(name, slot))
+
+    def write(self, arrays: Dict[str, np.ndarray], state: Optional[Dict[str, Any]] = None,
+              incremental: bool = True) -> int:
+        """
+        Writes a checkpoint of the arrays and scalar state
+
+        :param arrays: The arrays by name. These may be views of mapped device buffers
+        :param state: The scalar state, which must be JSON serialisable after converting NumPy values
+        :param incremental: Only write the tiles which differ from the slot being overwritten. Otherwise every tile is
+                            written.
+        :return: The number of bytes of array data written
+        """
+        slot = 0 if self._metadata['slot'] is None else 1 - self._metadata['slot']
+        tileBytes = self.tileBytes
+        previous = self._metadata['arrays']
+        entries = {}
+        written = 0
+
+        # Invalidate the digests of the slot before overwriting it, so that the tiles of an interrupted write are
+        # never trusted by a later incremental write. The digests are retained in memory for comparison.
+        if any(entry['digests'][slot] is not None for entry in previous.values()):
+            invalidated = {name: dict(entry, digests=[None if i == slot else digests
+                                                      for i, digests in enumerate(entry['digests'])])
+                           for name, entry in previous.items()}
+
+            self._writeMetadata(dict(self._metadata, arrays=invalidated))
+            self._metadata = dict(self._metadata, arrays=invalidated)
+
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            path = self._path(name, slot)
+
+            entry = previous.get(name)
+            digests = entry['digests'][slot] if entry is not None else None
+
+            if (not incremental or digests is None or not os.path.exists(path) or
+                    entry['shape'] != list(array.shape) or entry['dtype'] != array.dtype.str):
+                digests = None
+                target = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape)
+            else:
+                target = np.lib.format.open_memmap(path, mode='r+')
+
+            source = array.reshape(-1).view(np.uint8)
+            dest = target.reshape(-1).view(np.uint8)
+            newDigests = []
+
+            for i, start in enumerate(range(0, source.size, tileBytes)):
+                tile = source[start:start + tileBytes]
+                digest = hashlib.blake2b(tile, digest_size=16).hexdigest()
+
+                if digests is None or digests[i] != digest:
+                    dest[start:start + tileBytes] = tile
+                    written += tile.size
+
+                newDigests.append(digest)
+
+            target.flush()
+            del target, dest
+
+            slotDigests = list(entry['digests']) if entry is not None else [None, None]
+            slotDigests[slot] = newDigests
+
+            # The digests of the other slot are only valid if it holds an array of the same shape and type
+            if entry is not None and (entry['shape'] != list(array.shape) or entry['dtype'] != array.dtype.str):
+                slotDigests[1 - slot] = None
+
+            entries[name] = {'shape': list(array.shape), 'dtype': array.dtype.str, 'digests': slotDigests}
+
+        metadata = dict(self._metadata, generation=self.generation + 1, slot=slot, state=_toJSON(state or {}),
+                        arrays=entries)
+
+        # The checkpoint switches to the new slot once it is complete
+        self._writeMetadata(metadata)
+        self._metadata = metadata
+
+        logging.debug('Checkpoint {:d} written to <{:s}> ({:d} bytes)'.format(self.generation, self._directory,
+                                                                              written))
+        return written
+
+    def _writeMetadata(self, metadata: Dict[str, Any]) -> None:
+
+        atomicWrite(self.metadataPath, json.dumps(metadata), sync=True)
+
+    def array(self, name: str) -> np.ndarray:
+        """
+        Maps an array of the current checkpoint read-only
+
+        :param name: The name of the array
+        :return: The memory-mapped array
+        """
+        if not self.exists:
+            raise RuntimeError('No checkpoint has been written to <{:s}>'.format(self._directory))
+
+        if name not in self._metadata['arrays']:
+            raise KeyError('Array <{:s}> is not in the checkpoint'.format(name))
+
+        return np.load(self._path(name, self._metadata['slot']), mmap_mode='r')
+
+    def arrayInfo(self, name: str) -> Tuple[Tuple[int, ...], np.dtype]:
+        """
+        Returns the shape and data type of an array of the current checkpoint
+
+        :param name: The name of the array
+        :return: The shape and data type
+        """
+        entry = self._metadata['arrays'][name]
+
+        return tuple(entry['shape']), np.dtype(entry['dtype'])
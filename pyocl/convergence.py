@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+from enum import Enum
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import pyopencl as cl
+
+from .core import Core
+from .paths import loadKernelSource
+
+
+class ConvergenceNorm(Enum):
+    """
+    The measure of the change of the field per step compared against the tolerance
+    """
+
+    MAX = 'max'
+    """ The maximum absolute change of any cell """
+
+    L2 = 'l2'
+    """ The L2 norm of the change of the field """
+
+
+class Residual(NamedTuple):
+    """
+    The change of a field over a single step, reduced on the device
+    """
+
+    maxChange: float
+    """ The maximum absolute change of any cell """
+
+    l2Norm: float
+    """ The L2 norm of the change of the field """
+
+    def norm(self, norm: ConvergenceNorm) -> float:
+        """
+        Returns the measure of the change for a norm
+
+        :param norm: The norm
+        :return: The measure of the change
+        """
+        return self.maxChange if norm == ConvergenceNorm.MAX else self.l2Norm
+
+
+class ConvergenceMonitor:
+    """
+    Device-side reduction of the change between two states of a field for detecting convergence to a steady state.
+
+    The first stage of the reduction (``convergence_partial``) writes a maximum and a sum of squares for each
+    work-group to :meth:`partials`, which the second stage (``convergence_finalise``) reduces in a single work-group.
+    Only the two resulting scalars are read back by :meth:`read`, rather than downloading the field. Kernels which
+    update the field may write the partials themselves, fusing the first stage into the update, and then call
+    :meth:`enqueueFinalise` (see ``kernels/convergence.cl`` and :class:`~pyocl.stencil.ConvergentHeatStencil2D`).
+    """
+
+    def __init__(self, ocl: Core, dtype=np.float32, localSize: Optional[int] = None) -> None:
+        """
+        :param ocl: The Core
+        :param dtype: The data type of the fields (float32 or float64)
+        :param localSize: The work group size of the reduction. By default this is chosen for the device
+        """
+        self._ocl = ocl
+        self._dtype = np.dtype(dtype)
+
+        if self._dtype not in (np.dtype(np.float32), np.dtype(np.float64)):
+            raise ValueError('Convergence is only supported for float32 and float64 fields')
+
+        self._program = ocl.buildProgram(loadKernelSource('convergence.cl'), self.buildOptions())
+        self._partialKernel = cl.Kernel(self._program, 'convergence_partial')
+        self._finaliseKernel = cl.Kernel(self._program, 'convergence_finalise')
+
+        if localSize is None:
+            localSize = min(256, ocl.maxWorkGroupSize,
+                            self._partialKernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE,
+                                                                    ocl.device),
+                            self._finaliseKernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE,
+                                                                     ocl.device))
+
+        self._localSize = localSize
+        self._partials = None  # type: Optional[cl.Buffer]
+        self._partialGroups = 0
+        self._result = ocl.memoryPool.allocate(2 * self._dtype.itemsize)
+        self._event = None  # type: Optional[cl.Event]
+        self._host = np.zeros(2, dtype=self._dtype)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        The data type of the fields and the reduction
+        """
+        return self._dtype
+
+    @property
+    def localSize(self) -> int:
+        """
+        The work group size of the reduction
+        """
+        return self._localSize
+
+    def buildOptions(self) -> List[str]:
+        """
+        Returns the build options of ``convergence.cl`` for the data type. These must also be used by programs which
+        fuse the reduction into their kernels.
+
+        :return: The build options
+        """
+        return ['-DVALUE_DOUBLE'] if self._dtype == np.dtype(np.float64) else []
+
+    def localMemory(self, items: int) -> List[cl.LocalMemory]:
+        """
+        Returns the local memory arguments (``maxChange`` and ``sumSquares``) of a kernel using ``reduce_change``
+
+        :param items: The number of work items in the work group
+        :return: The local memory arguments
+        """
+        return [cl.LocalMemory(items * self._dtype.itemsize), cl.LocalMemory(items * self._dtype.itemsize)]
+
+    def partials(self, groups: int) -> cl.Buffer:
+        """
+        Returns the buffer of the partial results, with capacity for at least a number of work-groups
+
+        :param groups: The number of work-groups
+        :return: The buffer of the partial results
+        """
+        if groups > self._partialGroups:
+            if self._partials is not None:
+                self._ocl.memoryPool.free(self._partials, [self._event])
+
+            self._partials = self._ocl.memoryPool.allocate(2 * groups * self._dtype.itemsize)
+            self._partialGroups = groups
+
+        return self._partials
+
+    def enqueue(self, queue: cl.CommandQueue, u1: cl.Buffer, u0: cl.Buffer, size: int,
+                waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Enqueues both stages of the reduction of the change between two states of a field
+
+        :param queue: The command queue
+        :param u1: The buffer of the new state
+        :param u0: The buffer of the previous state
+        :param size: The number of elements of the field
+        :param waitFor: Events which must complete before the reduction (e.g. the step producing the new state)
+        :return: The event of the reduction
+        """
+        groups = max(min(-(-size // self._localSize), 8 * self._ocl.computeUnits), 1)
+
+        ev = self._partialKernel(queue, (groups * self._localSize,), (self._localSize,), self.partials(groups),
+                                 u1, u0, np.int32(size), *self.localMemory(self._localSize), wait_for=waitFor)
+
+        return self.enqueueFinalise(queue, groups, [ev])
+
+    def enqueueFinalise(self, queue: cl.CommandQueue, groups: int,
+                        waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Enqueues the second stage of the reduction, reducing the partial results of a number of work-groups
+
+        :param queue: The command queue
+        :param groups: The number of work-groups which wrote to :meth:`partials`
+        :param waitFor: Events which must complete before the reduction (e.g. the kernel writing the partials)
+        :return: The event of the reduction
+        """
+        self._event = self._finaliseKernel(queue, (self._localSize,), (self._localSize,), self._result,
+                                           self.partials(groups), np.int32(groups), *self.localMemory(self._localSize),
+                                           wait_for=waitFor)
+
+        return self._event
+
+    def read(self, queue: cl.CommandQueue, waitFor: Optional[List[cl.Event]] = None) -> Residual:
+        """
+        Reads back the result of the most recent reduction, blocking until it is available
+
+        :param queue: The command queue
+        :param waitFor: Events which must complete before the read (e.g. the event of the reduction)
+        :return: The residual
+        """
+        cl.enqueue_copy(queue, self._host, self._result, is_blocking=True, wait_for=waitFor)
+
+        return Residual(float(self._host[0]), float(self._host[1]))
+
+    def release(self, waitFor: Optional[List[cl.Event]] = None) -> None:
+        """
+        Returns the buffers of the reduction to the pool
+
+        :param waitFor: The events of the commands using the reduction, which must complete before the buffers are
+                        reused. The most recent reduction is included automatically.
+        """
+        waitFor = [self._event] + (list(waitFor) if waitFor else [])
+
+        if self._partials is not None:
+            self._ocl.memoryPool.free(self._partials, waitFor)
+            self._partials = None
+            self._partialGroups = 0
+
+        if self._result is not None:
+            self._ocl.memoryPool.free(self._result, waitFor)
+            self._result = None
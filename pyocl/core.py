@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 import os
 from enum import Enum, auto
-from typing import List, Tuple
+from typing import Dict, Hashable, List, Optional, Tuple
 import logging
+import threading
+from collections import OrderedDict
 import pyopencl as cl
 
+from .cache import LRUCache, ProgramCache
+from .capabilities import DeviceCapabilities, platforms
+from .memory import BufferPool
+from .selection import DeviceSelector, Workload
+
 
 class OpenCLFlags(Enum):
     """
@@ -17,6 +24,28 @@ class OpenCLFlags(Enum):
     DISABLE_OPTIMISATIONS = auto()  # '-cl-opt-disable'
 
 
+BUILD_FLAG_OPTIONS = {OpenCLFlags.DISABLE_NON_FINITE_MATH: '-cl-finite-math-only',
+                      OpenCLFlags.DISABLE_OPTIMISATIONS: '-cl-opt-disable'}
+""" The compiler options of the build flags enabled via :meth:`Core.setBuildFlag` """
+
+
+class BuildProfile(Enum):
+    """
+    Named sets of compiler options used for building kernels. The FAST profile relaxes the accuracy of floating point
+    arithmetic, so should be validated for a kernel before use (see :meth:`OpenCLSimBase.setBuildProfile`).
+    """
+    DEBUG = ('-g', '-cl-opt-disable')
+    DEFAULT = ()
+    FAST = ('-cl-fast-relaxed-math', '-cl-mad-enable', '-cl-finite-math-only', '-cl-denorms-are-zero')
+
+    @property
+    def options(self) -> List[str]:
+        """
+        The compiler options of the profile
+        """
+        return list(self.value)
+
+
 class Core:
     """
     PyOCL Core Class
@@ -24,22 +53,41 @@ class Core:
     Provides methods for interacting and setting up the OpenCL compute environment based on the capabilities provided
     by PyOpenCL. Common routines and flags are enabled for convenience to improve productivity and provide a consistent
     environment to develop in.
+
+    A Core may be shared by simulations running concurrently in separate threads, each with its own command queue.
+    Program builds are serialised per program, so that concurrent requests for the same program build it once, and
+    the program and memory caches are guarded by locks. The build settings (e.g. :meth:`setBuildFlag`) should be
+    configured before the Core is shared.
     """
 
-    def __init__(self, device = None, useGPU: bool = True) -> None:
+    def __init__(self, device = None, useGPU: bool = True, workload: Optional[Workload] = None) -> None:
+        """
+        :param device: The OpenCL device to use. If None, a default device is selected
+        :param useGPU: Prefer the first GPU of the first platform when no device is specified
+        :param workload: Opt-in selection of the fastest device across all platforms for the workload profile, based
+                         on cached micro-benchmark scores (see :class:`~pyocl.selection.DeviceSelector`)
+        """
 
         self._isUsingOpenCL2 = False
         self._isDebugBuild = False
         self._isUsingGPU = useGPU
         self._gl_interop = False
         self._clDevice = None
-
-        # Show compiled output by setting envrionment flag
-        self.enableCompilerOutput(OpenCLFlags.ENABLE_COMPILER_OUTPUT)
-        self.enableCompilerCache(OpenCLFlags.ENABLE_CACHE)
-
-        os.environ["AMPLXE_LOG_LEVEL"] = "TRACE"
-        os.environ["TPSS_DEBUG"] = "1"
+        self._programCache = ProgramCache()
+        self._programs = LRUCache(64)
+        self._memoryPool = None
+        self._capabilities = None
+        self._buildFlags = set()
+        self._supportedOptions = {}
+
+        # The process environment is not modified, so that Cores may be created whilst other threads are running. See
+        # enableCompilerOutput and enableCompilerCache for configuring PyOpenCL at startup
+        self._buildLock = threading.Lock()
+        self._buildLocks = {}  # type: Dict[Hashable, threading.Lock]
+
+        if device is None and workload is not None:
+            device = DeviceSelector().select(workload)
+            logging.debug('Selected device - {:s} for {:s}'.format(device.name, workload.name))
 
         if device:
             self._device = device
@@ -48,13 +96,15 @@ class Core:
         else:
             # Preselect the default platform and device
 
-            # Get the OpenCL Platforms
-            self._platform = cl.get_platforms()[0]
+            # Get the OpenCL Platforms. These are enumerated once per process
+            self._platform = platforms()[0]
 
             logging.debug('Initialising OpenCL Runtime - {:s}'.format(self.platform.name))
 
-            gpuDevices = self.gpuDevices  # get GPU devices of selected platform
-            cpuDevices = self.cpuDevices  # get GPU devices of selected platform
+            # Query the devices of the selected platform once
+            devices = self.platform.get_devices()
+            gpuDevices = [d for d in devices if d.type & cl.device_type.GPU]
+            cpuDevices = [d for d in devices if d.type & cl.device_type.CPU]
 
             if len(gpuDevices) > 0 and useGPU:
                 self._device = gpuDevices[0]  # take first GPU
@@ -87,11 +137,82 @@ class Core:
     @staticmethod
     def enableCompilerCache(state: OpenCLFlags) -> None:
         """
-        Sets PyOpenCL to use compiler caching to improve warm-up time
+        Sets PyOpenCL to use compiler caching to improve warm-up time. This modifies the process environment, so should
+        only be called at startup before PyOpenCL is imported and any threads are started.
 
         :param state: provide a OpenCLFlag
         """
-        os.environ["PYOPENCL_NO_CACHE"] = '1' if (state == OpenCLFlags.ENABLE_CACHE) else '0'
+        os.environ["PYOPENCL_NO_CACHE"] = '0' if (state == OpenCLFlags.ENABLE_CACHE) else '1'
+
+    @property
+    def programCache(self) -> Optional[ProgramCache]:
+        """
+        The on-disk program binary cache used when building programs. None indicates caching is disabled.
+        """
+        return self._programCache
+
+    @programCache.setter
+    def programCache(self, cache: Optional[ProgramCache]):
+        self._programCache = cache
+
+    @property
+    def programs(self) -> LRUCache:
+        """
+        The compiled programs retained in memory by this Core, with the least recently used programs evicted
+        """
+        return self._programs
+
+    def buildProgram(self, source: str, options: Optional[List[str]] = None,
+                     key: Optional[Hashable] = None) -> cl.Program:
+        """
+        Builds an OpenCL program for the selected device. The program binary is cached on disk when a program cache
+        is available to reduce the warm-up time of subsequent builds.
+
+        Programs are also retained in memory, so that simulations sharing this Core reuse the same compiled program.
+
+        :param source: The rendered kernel source
+        :param options: The build options passed to the compiler
+        :param key: The key to retain the program under in :attr:`programs`. By default the source and options are used
+        :return: The built OpenCL program
+        """
+        options = list(options) if options else []
+
+        if key is None:
+            key = (source, tuple(options))
+
+        program = self._programs.get(key)
+
+        if program is not None:
+            return program
+
+        # Concurrent requests for the same program wait for a single build, whilst different programs build in parallel
+        with self._buildLock:
+            lock = self._buildLocks.setdefault(key, threading.Lock())
+
+        try:
+            with lock:
+                program = self._programs.get(key)
+
+                if program is None:
+                    if self._programCache is None:
+                        program = cl.Program(self.context, source).build(options=options)
+                    else:
+                        program = self._programCache.buildProgram(self.context, self.device, source, options)
+
+                    self._programs.put(key, program)
+
+        finally:
+            # Failed builds must also release the lock of the key
+            with self._buildLock:
+                self._buildLocks.pop(key, None)
+
+        return program
+
+    def clearPrograms(self) -> None:
+        """
+        Releases the compiled programs retained in memory by this Core
+        """
+        self._programs.clear()
 
     def openCLVersion(self) -> Tuple[int,int]:
         return self._platform._get_cl_version()
@@ -130,26 +251,97 @@ class Core:
         """
         return self._isDebugBuild
 
+    def setBuildFlag(self, flag: OpenCLFlags, state: bool = True) -> None:
+        """
+        Enables a compiler flag for all the programs subsequently built for simulations on this Core
+
+        :param flag: The flag (``DISABLE_NON_FINITE_MATH`` or ``DISABLE_OPTIMISATIONS``)
+        :param state: Enable the flag
+        """
+        if flag not in BUILD_FLAG_OPTIONS:
+            raise ValueError('{:s} is not a build flag'.format(flag.name))
+
+        if state:
+            self._buildFlags.add(flag)
+        else:
+            self._buildFlags.discard(flag)
+
+    def isBuildFlagEnabled(self, flag: OpenCLFlags) -> bool:
+        """
+        Returns if a compiler flag is enabled
+
+        :param flag: The flag
+        :return: The flag is enabled
+        """
+        return flag in self._buildFlags
+
+    def isBuildOptionSupported(self, option: str) -> bool:
+        """
+        Returns if the compiler of the device accepts an option, by building a trivial program. The result is retained
+        by the Core.
+
+        :param option: The compiler option
+        :return: The option is supported
+        """
+        supported = self._supportedOptions.get(option)
+
+        if supported is None:
+            try:
+                cl.Program(self.context, 'kernel void pyocl_option(global int *a) { a[0] = 0; }').build(
+                        options=[option], devices=[self.device])
+                supported = True
+            except cl.Error:
+                logging.warning('Compiler option {:s} is not supported by {:s}'.format(option, self.device.name))
+                supported = False
+
+            self._supportedOptions[option] = supported
+
+        return supported
+
+    def buildOptions(self, profile: BuildProfile = BuildProfile.DEFAULT) -> List[str]:
+        """
+        Returns the compiler options for a build profile combined with the debug setting and the enabled build flags
+        of the Core. Options which are not supported by the device are omitted.
+
+        :param profile: The build profile
+        :return: The list of build options
+        """
+        options = profile.options
+
+        if self.isDebugBuild():
+            options += ['-g']
+
+        options += [BUILD_FLAG_OPTIONS[flag] for flag in OpenCLFlags if flag in self._buildFlags]
+
+        if self.isUsingOpenCL2():
+            options += ['-cl-std=CL2.0']
+
+        # Remove duplicates whilst preserving the order
+        options = list(OrderedDict.fromkeys(options))
+
+        return [option for option in options if self.isBuildOptionSupported(option)]
+
     @staticmethod
     def enableCompilerOutput(state: int) -> None:
         """
-        Sets PyOpenCL to enable the compiler output including errors
+        Sets PyOpenCL to enable the compiler output including errors. This modifies the process environment, so should
+        only be called at startup before any threads are started.
 
         :param state: provide a OpenCLFlag
         """
-        os.environ["PYOPENCL_COMPILER_OUTPUT"] = '0' if (state == OpenCLFlags. ENABLE_COMPILER_OUTPUT) else '1'
+        os.environ["PYOPENCL_COMPILER_OUTPUT"] = '1' if (state == OpenCLFlags.ENABLE_COMPILER_OUTPUT) else '0'
 
     def isUsingGPU(self) -> bool:
         """
         Returns if the device is a GPU
         """
-        return self.device.type == cl.device_type.GPU
+        return self.capabilities.isGPU
 
     def isUsingCPU(self) -> bool:
         """
-        Returns if the device is a GPU
+        Returns if the device is a CPU
         """
-        return self.device.type == cl.device_type.CPU
+        return self.capabilities.isCPU
 
     @property
     def device(self) -> cl.Device:
@@ -158,6 +350,19 @@ class Core:
         """
         return self._device
 
+    @property
+    def capabilities(self) -> DeviceCapabilities:
+        """
+        The frozen capabilities of the selected device. These are queried from the driver on first use, so that the
+        device properties of the Core do not return to the driver on every access.
+
+        :return: The device capabilities
+        """
+        if self._capabilities is None:
+            self._capabilities = DeviceCapabilities.fromDevice(self.device)
+
+        return self._capabilities
+
     @property
     def platform(self) -> cl.Platform:
         """
@@ -176,22 +381,107 @@ class Core:
         """
         return self._context
 
+    @staticmethod
+    def partitionDevice(device: cl.Device, count: Optional[int] = None, numa: bool = False) -> List[cl.Device]:
+        """
+        Partitions a device (typically a CPU) into sub-devices using device fission. The device is returned unpartitioned
+        when fission is not supported.
+
+        :param device: The OpenCL device to partition
+        :param count: The number of sub-devices. By default each sub-device has a single compute unit, or with NUMA
+                      partitioning, there is one sub-device per NUMA node
+        :param numa: Partition by NUMA node, falling back to the next partitionable affinity domain. When more
+                     sub-devices than NUMA nodes are requested, each node is partitioned equally
+        :return: List of sub-devices
+        """
+        partitionProperty = cl.device_partition_property
+        properties = device.partition_properties
+
+        if numa and partitionProperty.BY_AFFINITY_DOMAIN in properties:
+            for domain in (cl.device_affinity_domain.NUMA, cl.device_affinity_domain.NEXT_PARTITIONABLE):
+                if not device.partition_affinity_domain & domain:
+                    continue
+
+                try:
+                    nodes = device.create_sub_devices([partitionProperty.BY_AFFINITY_DOMAIN, domain])
+                except cl.Error:
+                    continue
+
+                if count is None or count <= len(nodes):
+                    return nodes[:count] if count else nodes
+
+                perNode = -(-count // len(nodes))
+
+                return [sub for node in nodes for sub in Core.partitionDevice(node, perNode)][:count]
+
+            logging.warning('NUMA partitioning is not supported by {:s} - partitioning equally'.format(device.name))
+
+        if count is None:
+            count = device.max_compute_units
+
+        if count <= 1 or partitionProperty.EQUALLY not in properties:
+            return [device]
+
+        computeUnits = max(device.max_compute_units // count, 1)
+
+        return device.create_sub_devices([partitionProperty.EQUALLY, computeUnits])[:count]
+
+    def createSubDevices(self, count: Optional[int] = None, numa: bool = False) -> List[cl.Device]:
+        """
+        Partitions the selected device into sub-devices. See :meth:`partitionDevice`.
+
+        :param count: The number of sub-devices
+        :param numa: Partition by NUMA node
+        :return: List of sub-devices
+        """
+        return Core.partitionDevice(self.device, count, numa)
+
+    def createQueue(self, outOfOrder: bool = False, profiling: bool = True) -> cl.CommandQueue:
+        """
+        Creates a command queue on the selected device
+
+        :param outOfOrder: Use out-of-order execution where supported by the device. Commands on an out-of-order queue
+                           are only ordered by their event dependencies
+        :param profiling: Enable profiling of the commands
+        :return: The command queue
+        """
+        properties = cl.command_queue_properties.PROFILING_ENABLE if profiling else 0
+
+        if outOfOrder and self.capabilities.outOfOrderExecution:
+            properties |= cl.command_queue_properties.OUT_OF_ORDER_EXEC_MODE_ENABLE
+
+        return cl.CommandQueue(self.context, self.device, properties=properties)
+
+    @property
+    def memoryPool(self) -> BufferPool:
+        """
+        Returns the pooled buffer allocator for the context. Allocations are tracked against the global memory size
+        of the device.
+
+        :return: The buffer pool
+        """
+        with self._buildLock:
+            if self._memoryPool is None:
+                self._memoryPool = BufferPool(self.context, self.globalMemorySize)
+
+        return self._memoryPool
+
     def useGLInterop(self) -> bool:
         return self._gl_interop
 
     def hasSharedMemory(self) -> bool:
         """
-        Returns if the currently selected Compute Device has shared memory capability (e.g. APU, Intel Platforms)
+        Returns if the currently selected Compute Device has shared memory capability (e.g. CPU, APU, Intel Platforms)
 
-        :return:
+        :return: Device shares physical memory with the host
         """
-        if self.deviceType() == 'Intel GPU':
+        if self.isUsingCPU() or self.deviceType() == 'Intel GPU':
             return True
-        else:
-            return False
+
+        return self.capabilities.hostUnifiedMemory
 
     def deviceType(self) -> str:
-        if "Intel" in self.device.vendor and self.device.type == cl.device_type.GPU:
+        if "Intel" in self.capabilities.vendor and self.capabilities.isGPU:
             return 'Intel GPU'
 
     ### Helper functions ###
@@ -222,28 +512,28 @@ class Core:
 
         :return: number of compute units available
         """
-        return self.device.max_compute_units
+        return self.capabilities.computeUnits
 
     @property
     def maxWorkGroupSize(self) -> int:
         """
         The maximum work group size for the device
         """
-        return self.device.max_work_group_size()
+        return self.capabilities.maxWorkGroupSize
 
     @property
     def max2DImageSize(self) -> Tuple[int,int]:
         """
         The maximum 2D image size buffer
         """
-        return self.device.image2d_max_width,  self.device.image2d_max_height
+        return self.capabilities.max2DImageSize
 
     @property
     def max3DImageSize(self) -> Tuple[int,int, int]:
         """
         The maximum 3D image size buffer
         """
-        return self.device.image3d_max_width, self.device.image3d_max_height, self.device.image3d_max_depth
+        return self.capabilities.max3DImageSize
 
     @property
     def localMemorySize(self) -> int:
@@ -252,7 +542,7 @@ class Core:
 
         :return: Size of local memory available [bytes]
         """
-        return self.device.local_mem_size
+        return self.capabilities.localMemorySize
 
     @property
     def globalMemorySize(self) -> int:
@@ -261,7 +551,7 @@ class Core:
         
         :return: Size of global memory available [bytes]
         """
-        return self.device.global_mem_size
+        return self.capabilities.globalMemorySize
 
     def hasFloat16(self) -> bool:
         """
@@ -269,7 +559,7 @@ class Core:
 
          :return: Native float16 support available
          """
-        return 'cl_khr_fp16' in self.platform.extensions
+        return self.capabilities.hasFloat16
 
     def hasDouble(self) -> bool:
         """
@@ -277,7 +567,7 @@ class Core:
 
          :return: Native float64 support available
          """
-        return 'cl_khr_fp64' in self.platform.extensions
+        return self.capabilities.hasDouble
 
     def hasGLShareExtension(self) -> bool:
         """
@@ -285,4 +575,4 @@ class Core:
 
          :return: Native GLInterop Sharing support available
          """
-        return 'cl_khr_gl_sharing' in self.platform.extensions
+        return 'cl_khr_gl_sharing' in self.capabilities.platformExtensions
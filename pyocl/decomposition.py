@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+from typing import Callable, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+import pyopencl as cl
+
+from .core import Core
+from .memory import BufferPool, DoubleBuffer
+
+
+class Slab:
+    """
+    A contiguous slab of a decomposed field assigned to a single device.
+
+    The field is split along its first axis. The local field of the slab holds the rows owned by the slab together with
+    halo rows copied from the neighbouring slabs, laid out as ``[haloTop | interior | haloBottom]``. Halo rows are not
+    present at the physical boundaries of the domain.
+    """
+
+    def __init__(self, index: int, device: cl.Device, context: cl.Context, pool: BufferPool,
+                 rowStart: int, rows: int, haloTop: int, haloBottom: int,
+                 shape: Tuple[int, ...], dtype: np.dtype) -> None:
+
+        self.index = index
+        self.device = device
+        self.pool = pool
+
+        # Separate queues for the compute and the halo exchange allow the exchange to overlap with interior compute
+        props = cl.command_queue_properties.PROFILING_ENABLE
+        self.queue = cl.CommandQueue(context, device, properties=props)
+        self.transferQueue = cl.CommandQueue(context, device, properties=props)
+
+        self.rowStart = rowStart
+        self.rows = rows
+        self.haloTop = haloTop
+        self.haloBottom = haloBottom
+
+        self.shape = (haloTop + rows + haloBottom,) + tuple(shape[1:])
+        self.field = DoubleBuffer(pool, self.shape, dtype)
+
+        self.events = []  # type: List[cl.Event]
+
+    @property
+    def rowOffset(self) -> int:
+        """
+        The global row of the first row of the local field (including the top halo)
+        """
+        return self.rowStart - self.haloTop
+
+    @property
+    def rowBytes(self) -> int:
+        """
+        The size of a single row of the field [bytes]
+        """
+        return self.field.nbytes // self.shape[0]
+
+
+class SlabDecomposition:
+    """
+    Multi-device execution of a field decomposed into slabs along its first axis.
+
+    Each slab is assigned to a device (round-robin if there are more slabs than devices) and advanced by a user
+    provided launch function. After each step the halo rows are exchanged between neighbouring slabs. The rows adjacent
+    to the halos are computed first, so that the exchange on the transfer queue overlaps with the compute of the
+    remaining interior rows.
+
+    The launch function has the signature ``launch(slab, rowStart, rowCount, waitFor) -> cl.Event`` and must compute
+    the local rows ``[rowStart, rowStart + rowCount)`` of ``slab.field.back`` from ``slab.field.front`` on
+    ``slab.queue``. The global position of the slab is given by :attr:`Slab.rowOffset`.
+    """
+
+    def __init__(self, devices: Sequence[cl.Device], shape: Tuple[int, ...], halo: int = 1, dtype=np.float32,
+                 numSlabs: Optional[int] = None, context: Optional[cl.Context] = None) -> None:
+
+        if not devices:
+            raise ValueError('No OpenCL devices provided for the decomposition')
+
+        numSlabs = numSlabs if numSlabs else len(devices)
+
+        if shape[0] < numSlabs * max(halo, 1):
+            raise ValueError('Field with {:d} rows is too small for {:d} slabs'.format(shape[0], numSlabs))
+
+        self._devices = list(devices)
+        self._shape = tuple(shape)
+        self._halo = halo
+        self._dtype = np.dtype(dtype)
+        self._context = context if context is not None else cl.Context(devices=self._devices)
+        self._program = None
+
+        # The slabs on each device are allocated from a pool limited by the memory of that device
+        self._pools = {device.int_ptr: BufferPool(self._context, device.global_mem_size) for device in self._devices}
+
+        self._slabs = []  # type: List[Slab]
+
+        bounds = np.linspace(0, shape[0], numSlabs + 1).astype(np.int64)
+
+        for i in range(numSlabs):
+            haloTop = halo if i > 0 else 0
+            haloBottom = halo if i < numSlabs - 1 else 0
+
+            device = self._devices[i % len(self._devices)]
+
+            self._slabs.append(Slab(i, device, self._context, self._pools[device.int_ptr],
+                                    int(bounds[i]), int(bounds[i + 1] - bounds[i]), haloTop, haloBottom,
+                                    self._shape, self._dtype))
+
+        logging.debug('Decomposed field {:s} into {:d} slabs over {:d} devices'.format(str(self._shape), numSlabs,
+                                                                                        len(self._devices)))
+
+    @classmethod
+    def fromCore(cls, ocl: Core, shape: Tuple[int, ...], halo: int = 1, dtype=np.float32,
+                 subDevices: int = 0) -> 'SlabDecomposition':
+        """
+        Creates a decomposition across every device of the platform selected by a Core, or across sub-devices of
+        the selected CPU device
+
+        :param ocl: The Core providing the platform and device
+        :param shape: The global shape of the field
+        :param halo: The number of halo rows
+        :param dtype: The data type of the field
+        :param subDevices: The number of CPU sub-devices to partition the selected device into. When zero, all the
+                           devices of the platform are used
+        :return: The decomposition
+        """
+        if subDevices > 0:
+            if not ocl.isUsingCPU():
+                raise ValueError('Sub-devices are only supported for CPU devices')
+
+            devices = cls.subDevices(ocl.device, subDevices)
+        else:
+            devices = ocl.platform.get_devices()
+
+        return cls(devices, shape, halo, dtype)
+
+    @staticmethod
+    def subDevices(device: cl.Device, count: int) -> List[cl.Device]:
+        """
+        Partitions a device (typically a CPU) into equally sized sub-devices for use in a decomposition
+
+        :param device: The OpenCL device to partition
+        :param count: The number of sub-devices
+        :return: List of sub-devices
+        """
+        return Core.partitionDevice(device, count)
+
+    @property
+    def context(self) -> cl.Context:
+        """
+        The OpenCL context shared by all the devices
+        """
+        return self._context
+
+    @property
+    def devices(self) -> List[cl.Device]:
+        """
+        The devices used by the decomposition
+        """
+        return self._devices
+
+    @property
+    def slabs(self) -> List[Slab]:
+        """
+        The slabs of the decomposed field
+        """
+        return self._slabs
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        The global shape of the field
+        """
+        return self._shape
+
+    @property
+    def halo(self) -> int:
+        """
+        The number of halo rows exchanged between neighbouring slabs
+        """
+        return self._halo
+
+    def buildProgram(self, source: str, options: Optional[List[str]] = None) -> cl.Program:
+        """
+        Builds an OpenCL program for all the devices of the decomposition
+
+        :param source: The rendered kernel source
+        :param options: The build options passed to the compiler
+        :return: The built OpenCL program
+        """
+        self._program = cl.Program(self._context, source).build(options=list(options) if options else [])
+        return self._program
+
+    @property
+    def program(self) -> Optional[cl.Program]:
+        """
+        The program built by :meth:`buildProgram`
+        """
+        return self._program
+
+    def scatter(self, data: np.ndarray) -> None:
+        """
+        Uploads a host field to the slabs, including their halos
+
+        :param data: The host array of the global field
+        """
+        if data.shape != self._shape:
+            raise ValueError('Data does not match the shape of the decomposed field')
+
+        data = np.ascontiguousarray(data, dtype=self._dtype)
+
+        for slab in self._slabs:
+            local = data[slab.rowOffset:slab.rowOffset + slab.shape[0]]
+            slab.events = [slab.field.upload(slab.queue, local, blocking=False)]
+
+        self.synchronise()
+
+    def gather(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Downloads the rows owned by each slab into a host field
+
+        :param out: An optional host array to copy into
+        :return: The host array of the global field
+        """
+        if out is None:
+            out = np.empty(self._shape, dtype=self._dtype)
+
+        events = []
+
+        for slab in self._slabs:
+            local = out[slab.rowStart:slab.rowStart + slab.rows]
+            events.append(cl.enqueue_copy(slab.queue, local, slab.field.front,
+                                          src_offset=slab.haloTop * slab.rowBytes,
+                                          wait_for=slab.events, is_blocking=False))
+
+        cl.wait_for_events(events)
+
+        return out
+
+    def _rowRanges(self, slab: Slab) -> Tuple[List[Tuple[int, int]], Optional[Tuple[int, int]]]:
+
+        first = slab.haloTop
+        last = slab.haloTop + slab.rows
+        halo = self._halo
+
+        if slab.rows <= 2 * halo:
+            return [(first, slab.rows)], None
+
+        boundary = []
+
+        if slab.haloTop:
+            boundary.append((first, halo))
+            first += halo
+
+        if slab.haloBottom:
+            boundary.append((last - halo, halo))
+            last -= halo
+
+        return boundary, (first, last - first)
+
+    def step(self, launch: Callable[[Slab, int, int, Optional[List[cl.Event]]], cl.Event]) -> List[cl.Event]:
+        """
+        Advances every slab by one step and exchanges the halo rows. The commands are enqueued without blocking.
+
+        :param launch: The launch function computing a range of rows of a slab
+        :return: The events which complete the step
+        """
+        boundaryEvents = []
+        interiorEvents = []
+
+        for slab in self._slabs:
+            boundary, interior = self._rowRanges(slab)
+            waitFor = slab.events if slab.events else None
+
+            boundaryEvents.append([launch(slab, rowStart, rowCount, waitFor) for rowStart, rowCount in boundary])
+            interiorEvents.append([launch(slab, interior[0], interior[1], waitFor)] if interior else [])
+
+        # OpenCL requires the commands to be submitted before the queues of other slabs wait on their events
+        for slab in self._slabs:
+            slab.queue.flush()
+
+        # Exchange the halos of the updated fields on the transfer queues, overlapping with the interior compute
+        exchangeEvents = [[] for slab in self._slabs]
+
+        for slab in self._slabs:
+            nbytes = self._halo * slab.rowBytes
+            waitFor = boundaryEvents[slab.index]
+
+            if slab.haloTop:
+                above = self._slabs[slab.index - 1]
+                dstOffset = (above.haloTop + above.rows) * above.rowBytes
+                exchangeEvents[above.index].append(
+                    cl.enqueue_copy(slab.transferQueue, above.field.back, slab.field.back, byte_count=nbytes,
+                                    src_offset=slab.haloTop * slab.rowBytes, dst_offset=dstOffset,
+                                    wait_for=waitFor + above.events))
+
+            if slab.haloBottom:
+                below = self._slabs[slab.index + 1]
+                srcOffset = (slab.haloTop + slab.rows - self._halo) * slab.rowBytes
+                exchangeEvents[below.index].append(
+                    cl.enqueue_copy(slab.transferQueue, below.field.back, slab.field.back, byte_count=nbytes,
+                                    src_offset=srcOffset, dst_offset=0,
+                                    wait_for=waitFor + below.events))
+
+        for slab in self._slabs:
+            slab.transferQueue.flush()
+
+        events = []
+
+        for slab in self._slabs:
+            slab.events = boundaryEvents[slab.index] + interiorEvents[slab.index] + exchangeEvents[slab.index]
+            slab.field.swap()
+            events += slab.events
+
+        return events
+
+    def run(self, steps: int, launch: Callable[[Slab, int, int, Optional[List[cl.Event]]], cl.Event],
+            blocking: bool = True) -> List[cl.Event]:
+        """
+        Advances the decomposed field by a number of steps
+
+        :param steps: The number of steps
+        :param launch: The launch function computing a range of rows of a slab
+        :param blocking: Wait for the steps to complete before returning
+        :return: The events which complete the final step
+        """
+        events = []
+
+        for i in range(steps):
+            events = self.step(launch)
+
+        if blocking:
+            self.synchronise()
+
+        return events
+
+    def synchronise(self) -> None:
+        """
+        Blocks until all the commands on every slab have completed
+        """
+        for slab in self._slabs:
+            slab.queue.finish()
+            slab.transferQueue.finish()
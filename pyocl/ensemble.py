@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyopencl as cl
+
+from .memory import BufferPool, DoubleBuffer
+
+
+class Ensemble:
+    """
+    A batch of same-shaped fields stored in a single pair of ping-pong buffers, for advancing many small simulations
+    with one kernel launch per step.
+
+    Member ``m`` occupies the contiguous block ``[m * memberSize, (m + 1) * memberSize)`` of each buffer, so the batch
+    corresponds to a host array of shape ``(members,) + shape``. Parameters which differ between members are stored
+    as device arrays of length :attr:`members` and indexed by the member in the kernel, typically using the third
+    dimension of the NDRange (``get_global_id(2)``).
+    """
+
+    def __init__(self, pool: BufferPool, members: int, shape: Tuple[int, ...], dtype=np.float32,
+                 flags: int = cl.mem_flags.READ_WRITE) -> None:
+
+        if members < 1:
+            raise ValueError('An ensemble requires at least one member')
+
+        self._pool = pool
+        self._members = members
+        self._shape = tuple(shape)
+        self._field = DoubleBuffer(pool, (members,) + self._shape, dtype, flags)
+        self._parameters = {}  # type: Dict[str, Tuple[cl.Buffer, np.ndarray]]
+
+    @property
+    def members(self) -> int:
+        """
+        The number of members in the ensemble
+        """
+        return self._members
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        The shape of the field of each member
+        """
+        return self._shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        The data type of the fields
+        """
+        return self._field.dtype
+
+    @property
+    def memberBytes(self) -> int:
+        """
+        The size of the field of a single member [bytes]
+        """
+        return self._field.nbytes // self._members
+
+    @property
+    def field(self) -> DoubleBuffer:
+        """
+        The batched field of all the members
+        """
+        return self._field
+
+    @property
+    def front(self) -> cl.Buffer:
+        """
+        The buffer holding the current state of all the members
+        """
+        return self._field.front
+
+    @property
+    def back(self) -> cl.Buffer:
+        """
+        The buffer to write the next state of all the members to
+        """
+        return self._field.back
+
+    def swap(self) -> None:
+        """
+        Exchanges the front and back buffers of all the members
+        """
+        self._field.swap()
+
+    def setParameter(self, queue: cl.CommandQueue, name: str, values, dtype=np.float32) -> cl.Buffer:
+        """
+        Uploads a parameter with a value for each member. A scalar is broadcast to all the members.
+
+        :param queue: The command queue
+        :param name: The name of the parameter
+        :param values: The value of each member
+        :param dtype: The data type of the parameter
+        :return: The device array of the parameter
+        """
+        values = np.ascontiguousarray(np.broadcast_to(np.asarray(values, dtype=dtype), (self._members,)))
+
+        entry = self._parameters.get(name)
+
+        if entry is None or entry[1].dtype != values.dtype:
+            if entry is not None:
+                # The marker completes once the launches reading the previous parameter have completed
+                self._pool.free(entry[0], [cl.enqueue_marker(queue)])
+
+            buffer = self._pool.allocate(values.nbytes, cl.mem_flags.READ_ONLY)
+        else:
+            buffer = entry[0]
+
+        cl.enqueue_copy(queue, buffer, values, is_blocking=True)
+        self._parameters[name] = (buffer, values)
+
+        return buffer
+
+    def parameter(self, name: str) -> cl.Buffer:
+        """
+        Returns the device array of a parameter
+
+        :param name: The name of the parameter
+        :return: The device array
+        """
+        return self._parameters[name][0]
+
+    def parameterValues(self, name: str) -> np.ndarray:
+        """
+        Returns the host copy of a parameter
+
+        :param name: The name of the parameter
+        :return: The value of each member
+        """
+        return self._parameters[name][1]
+
+    def upload(self, queue: cl.CommandQueue, data: np.ndarray, blocking: bool = True,
+               waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Uploads the fields of all the members
+
+        :param queue: The command queue
+        :param data: The host array of shape ``(members,) + shape``
+        :param blocking: Wait for the transfer to complete
+        :param waitFor: Events which must complete before the transfer
+        :return: The event for the transfer
+        """
+        return self._field.upload(queue, data, blocking, waitFor)
+
+    def uploadMember(self, queue: cl.CommandQueue, index: int, data: np.ndarray, blocking: bool = True,
+                     waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Uploads the field of a single member
+
+        :param queue: The command queue
+        :param index: The index of the member
+        :param data: The host array matching the shape and type of a member
+        :param blocking: Wait for the transfer to complete
+        :param waitFor: Events which must complete before the transfer
+        :return: The event for the transfer
+        """
+        if data.shape != self._shape or data.dtype != self.dtype:
+            raise ValueError('Data does not match the shape and type of the member')
+
+        return cl.enqueue_copy(queue, self.front, np.ascontiguousarray(data), dst_offset=self._offset(index),
+                               is_blocking=blocking, wait_for=waitFor)
+
+    def download(self, queue: cl.CommandQueue, out: Optional[np.ndarray] = None,
+                 waitFor: Optional[List[cl.Event]] = None) -> np.ndarray:
+        """
+        Downloads the fields of all the members
+
+        :param queue: The command queue
+        :param out: An optional host array of shape ``(members,) + shape`` to copy into
+        :param waitFor: Events which must complete before the transfer
+        :return: The host array
+        """
+        return self._field.download(queue, out, waitFor)
+
+    def member(self, queue: cl.CommandQueue, index: int, out: Optional[np.ndarray] = None,
+               waitFor: Optional[List[cl.Event]] = None) -> np.ndarray:
+        """
+        Downloads the field of a single member
+
+        :param queue: The command queue
+        :param index: The index of the member
+        :param out: An optional host array to copy into
+        :param waitFor: Events which must complete before the transfer
+        :return: The host array
+        """
+        if out is None:
+            out = np.empty(self._shape, dtype=self.dtype)
+
+        cl.enqueue_copy(queue, out, self.front, src_offset=self._offset(index), is_blocking=True, wait_for=waitFor)
+
+        return out
+
+    def _offset(self, index: int) -> int:
+
+        if index < 0:
+            index += self._members
+
+        if not 0 <= index < self._members:
+            raise IndexError('Member {:d} is outside of the ensemble'.format(index))
+
+        return index * self.memberBytes
+
+    def release(self, waitFor: Optional[List[cl.Event]] = None) -> None:
+        """
+        Returns the buffers of the fields and parameters to the pool
+
+        :param waitFor: The events of the commands using the ensemble, which must complete before the buffers are
+                        reused
+        """
+        self._field.release(waitFor)
+
+        for buffer, values in self._parameters.values():
+            self._pool.free(buffer, waitFor)
+
+        self._parameters = {}
+
+    def __enter__(self) -> 'Ensemble':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
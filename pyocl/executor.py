@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+
+import pyopencl as cl
+
+
+class SimExecutor:
+    """
+    Runs simulations concurrently on a pool of host threads.
+
+    The simulations typically share a single :class:`~pyocl.core.Core` (and therefore one context and its compiled
+    programs), each with its own command queue. The blocking waits of PyOpenCL (e.g. :meth:`pyopencl.Event.wait` and
+    :meth:`pyopencl.CommandQueue.finish`) release the GIL, so the threads submit work to the device concurrently and
+    keep a multi-core device busy without forking processes.
+
+    A simulation must only be advanced by one thread at a time.
+    """
+
+    def __init__(self, maxWorkers: Optional[int] = None) -> None:
+        """
+        :param maxWorkers: The number of threads. By default this is chosen by :class:`ThreadPoolExecutor`
+        """
+        self._executor = ThreadPoolExecutor(maxWorkers, thread_name_prefix='pyocl-sim')
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Runs a function in the thread pool
+
+        :param func: The function
+        :param args: The arguments of the function
+        :param kwargs: The keyword arguments of the function
+        :return: The future of the result
+        """
+        return self._executor.submit(func, *args, **kwargs)
+
+    def map(self, func: Callable[[Any], Any], sims: Sequence[Any]) -> List[Any]:
+        """
+        Applies a function to each simulation concurrently and waits for the results. The first exception raised by
+        the function is re-raised.
+
+        :param func: The function, which is called with a simulation
+        :param sims: The simulations
+        :return: The result for each simulation
+        """
+        futures = [self._executor.submit(func, sim) for sim in sims]
+
+        return [future.result() for future in futures]
+
+    def run(self, sims: Sequence[Any], steps: int) -> List[Optional[cl.Event]]:
+        """
+        Advances each simulation by a number of steps concurrently, blocking until all have completed
+
+        :param sims: The simulations
+        :param steps: The number of steps
+        :return: The event of the final step of each simulation
+        """
+        return self.map(lambda sim: sim.run(steps), sims)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops the thread pool
+
+        :param wait: Wait for the submitted work to complete
+        """
+        self._executor.shutdown(wait)
+
+    def __enter__(self) -> 'SimExecutor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
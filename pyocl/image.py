@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pyopencl as cl
+
+
+IMAGE_CHANNEL_TYPES = {np.dtype(np.float32): cl.channel_type.FLOAT,
+                       np.dtype(np.float16): cl.channel_type.HALF_FLOAT}
+""" The image channel types of the supported field data types """
+
+
+def imageFormat(dtype) -> cl.ImageFormat:
+    """
+    Returns the single channel image format used to store a field of a data type
+
+    :param dtype: The data type of the field
+    :return: The image format
+    """
+    channelType = IMAGE_CHANNEL_TYPES.get(np.dtype(dtype))
+
+    if channelType is None:
+        raise ValueError('Image fields do not support the data type {:s}'.format(str(np.dtype(dtype))))
+
+    return cl.ImageFormat(cl.channel_order.R, channelType)
+
+
+def hasImageSupport(context: cl.Context, device: cl.Device, dims: int = 2, dtype=np.float32) -> bool:
+    """
+    Returns if a device supports image fields of a dimension and data type
+
+    :param context: The OpenCL context
+    :param device: The OpenCL device
+    :param dims: The dimensions of the field (2 or 3)
+    :param dtype: The data type of the field
+    :return: Image fields are supported
+    """
+    if not device.image_support or np.dtype(dtype) not in IMAGE_CHANNEL_TYPES:
+        return False
+
+    # Kernels writing to 3D images require an extension
+    if dims == 3 and 'cl_khr_3d_image_writes' not in device.extensions:
+        return False
+
+    imageType = cl.mem_object_type.IMAGE2D if dims == 2 else cl.mem_object_type.IMAGE3D
+    fmt = imageFormat(dtype)
+
+    for flags in (cl.mem_flags.READ_ONLY, cl.mem_flags.WRITE_ONLY):
+        formats = cl.get_supported_image_formats(context, flags, imageType)
+
+        if not any(f.channel_order == fmt.channel_order and f.channel_data_type == fmt.channel_data_type
+                   for f in formats):
+            return False
+
+    return True
+
+
+def clampSampler(context: cl.Context) -> cl.Sampler:
+    """
+    Returns a sampler for reading fields with integer coordinates. Reads outside the field are clamped to the edge,
+    which imposes a zero-gradient boundary condition on stencils without explicit boundary branches.
+
+    :param context: The OpenCL context
+    :return: The sampler
+    """
+    return cl.Sampler(context, False, cl.addressing_mode.CLAMP_TO_EDGE, cl.filter_mode.NEAREST)
+
+
+class ImageField:
+    """
+    A 2D or 3D field stored on the device as a pair of ping-pong image objects.
+
+    Image reads are served by the texture cache on devices which have one, with the boundary handled by the
+    addressing mode of the sampler. Kernels read from the :attr:`front` image (``read_only``) and write to the
+    :attr:`back` image (``write_only``), after which :meth:`swap` exchanges the images. The host array of shape
+    ``(ny, nx)`` or ``(nz, ny, nx)`` maps to an image of width ``nx``, matching the layout of buffer fields.
+    """
+
+    def __init__(self, context: cl.Context, shape: Tuple[int, ...], dtype=np.float32) -> None:
+
+        if len(shape) not in (2, 3):
+            raise ValueError('Image fields must be 2D or 3D')
+
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+        self._format = imageFormat(self._dtype)
+
+        # Recent versions of PyOpenCL deprecate the image constructor in favour of create_image
+        createImage = getattr(cl, 'create_image', cl.Image)
+
+        self._front = createImage(context, cl.mem_flags.READ_WRITE, self._format, self.region)
+        self._back = createImage(context, cl.mem_flags.READ_WRITE, self._format, self.region)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        The shape of the field
+        """
+        return self._shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        The data type of the field
+        """
+        return self._dtype
+
+    @property
+    def region(self) -> Tuple[int, ...]:
+        """
+        The extents of the images (width, height[, depth]), which is the reverse of the shape of the field
+        """
+        return tuple(reversed(self._shape))
+
+    @property
+    def front(self) -> cl.Image:
+        """
+        The image holding the current state of the field
+        """
+        return self._front
+
+    @property
+    def back(self) -> cl.Image:
+        """
+        The image to write the next state of the field to
+        """
+        return self._back
+
+    def swap(self) -> None:
+        """
+        Exchanges the front and back images. Only the image references are swapped, so this does not block.
+        """
+        self._front, self._back = self._back, self._front
+
+    def upload(self, queue: cl.CommandQueue, data: np.ndarray, blocking: bool = True,
+               waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Uploads the host data to the front image
+
+        :param queue: The command queue
+        :param data: The host array matching the shape and type of the field
+        :param blocking: Wait for the transfer to complete
+        :param waitFor: Events which must complete before the transfer
+        :return: The event for the transfer
+        """
+        if data.shape != self._shape or data.dtype != self._dtype:
+            raise ValueError('Data does not match the shape and type of the field')
+
+        return cl.enqueue_copy(queue, self._front, np.ascontiguousarray(data), origin=(0,) * len(self._shape),
+                               region=self.region, is_blocking=blocking, wait_for=waitFor)
+
+    def download(self, queue: cl.CommandQueue, out: Optional[np.ndarray] = None,
+                 waitFor: Optional[List[cl.Event]] = None) -> np.ndarray:
+        """
+        Downloads the front image to the host
+
+        :param queue: The command queue
+        :param out: An optional host array to copy into, avoiding a new allocation
+        :param waitFor: Events which must complete before the transfer
+        :return: The host array
+        """
+        if out is None:
+            out = np.empty(self._shape, dtype=self._dtype)
+
+        cl.enqueue_copy(queue, out, self._front, origin=(0,) * len(self._shape), region=self.region,
+                        is_blocking=True, wait_for=waitFor)
+
+        return out
+
+    def release(self) -> None:
+        """
+        Releases the images. The field must not be used after being released.
+        """
+        if self._front is not None:
+            self._front.release()
+            self._back.release()
+            self._front = self._back = None
+
+    def __enter__(self) -> 'ImageField':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
@@ -0,0 +1,92 @@
+// Two-stage reduction of the change between two states of a field (see pyocl.convergence.ConvergenceMonitor)
+//
+// The first stage produces a pair (max |u1 - u0|, sum (u1 - u0)^2) for each work-group, stored in consecutive
+// elements of `partials`. The second stage reduces the partials in a single work-group to the maximum change and the
+// L2 norm of the change, so that only two scalars are read back to the host. Kernels which update the field may write
+// the partials themselves using reduce_change, fusing the first stage into the update.
+
+#ifdef VALUE_DOUBLE
+#pragma OPENCL EXTENSION cl_khr_fp64 : enable
+typedef double value_t;
+#else
+typedef float value_t;
+#endif
+
+// Reduces the change of each work-item of the work-group held in local memory. The result is in the first element of
+// each local array. The work-group size does not need to be a power of two.
+inline void reduce_change(__local value_t *maxChange, __local value_t *sumSquares) {
+
+    const int lid = get_local_id(1) * get_local_size(0) + get_local_id(0);
+    int size = get_local_size(0) * get_local_size(1);
+
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    while (size > 1) {
+        const int upper = (size + 1) / 2;
+
+        if (lid < size - upper) {
+            maxChange[lid] = fmax(maxChange[lid], maxChange[lid + upper]);
+            sumSquares[lid] += sumSquares[lid + upper];
+        }
+
+        barrier(CLK_LOCAL_MEM_FENCE);
+        size = upper;
+    }
+}
+
+// Stores the change of the work-item and writes the reduction of the work-group to its pair of partials
+inline void store_partial_change(__global value_t *partials, __local value_t *maxChange, __local value_t *sumSquares,
+                                 value_t change, value_t squares) {
+
+    const int lid = get_local_id(1) * get_local_size(0) + get_local_id(0);
+
+    maxChange[lid] = change;
+    sumSquares[lid] = squares;
+
+    reduce_change(maxChange, sumSquares);
+
+    if (lid == 0) {
+        const int group = get_group_id(1) * get_num_groups(0) + get_group_id(0);
+        partials[2 * group] = maxChange[0];
+        partials[2 * group + 1] = sumSquares[0];
+    }
+}
+
+__kernel void convergence_partial(__global value_t *partials, __global const value_t *u1, __global const value_t *u0,
+                                  int n, __local value_t *maxChange, __local value_t *sumSquares) {
+
+    value_t change = 0;
+    value_t squares = 0;
+
+    for (int i = get_global_id(0); i < n; i += get_global_size(0)) {
+        const value_t d = u1[i] - u0[i];
+        change = fmax(change, fabs(d));
+        squares += d * d;
+    }
+
+    store_partial_change(partials, maxChange, sumSquares, change, squares);
+}
+
+__kernel void convergence_finalise(__global value_t *result, __global const value_t *partials, int groups,
+                                   __local value_t *maxChange, __local value_t *sumSquares) {
+
+    const int lid = get_local_id(0);
+
+    value_t change = 0;
+    value_t squares = 0;
+
+    for (int i = lid; i < groups; i += get_local_size(0)) {
+        change = fmax(change, partials[2 * i]);
+        squares += partials[2 * i + 1];
+    }
+
+    maxChange[lid] = change;
+    sumSquares[lid] = squares;
+
+    reduce_change(maxChange, sumSquares);
+
+    if (lid == 0) {
+        result[0] = maxChange[0];
+        result[1] = sqrt(sumSquares[0]);
+    }
+}
@@ -0,0 +1,30 @@
+// Explicit heat equation with the first stage of the convergence reduction fused into the update
+//
+// Requires convergence.cl, which is prepended by pyocl.stencil.ConvergentHeatStencil2D. The global size is padded to a
+// multiple of the work-group size, so the work-items outside of the domain contribute no change. The boundary cells
+// are fixed, matching heat_eq_2D.
+
+__kernel void heat_eq_2D_convergence(__global float *u1, __global const float *u0, float kappa1, float kappa2,
+                                     int nx, int ny, __global value_t *partials,
+                                     __local value_t *maxChange, __local value_t *sumSquares) {
+
+    const int i = get_global_id(0);
+    const int j = get_global_id(1);
+
+    value_t change = 0;
+
+    if (i < nx && j < ny) {
+        const int center = j * nx + i;
+        float u = u0[center];
+
+        if (i > 0 && i < nx - 1 && j > 0 && j < ny - 1) {
+            u += kappa1 * (u0[center - 1] - 2.0f * u0[center] + u0[center + 1])
+               + kappa2 * (u0[center - nx] - 2.0f * u0[center] + u0[center + nx]);
+        }
+
+        u1[center] = u;
+        change = u - u0[center];
+    }
+
+    store_partial_change(partials, maxChange, sumSquares, fabs(change), change * change);
+}
@@ -0,0 +1,29 @@
+// Explicit heat equation advancing a batch of fields in a single launch (see pyocl.ensemble.Ensemble)
+//
+// The third dimension of the NDRange selects the member. Each member has its own diffusion numbers, so members may
+// differ in their material properties as well as their initial conditions. The boundary cells of each member are
+// fixed, matching heat_eq_2D.
+
+__kernel void heat_eq_2D_ensemble(__global float *u1, __global const float *u0,
+                                  __global const float *kappa1, __global const float *kappa2,
+                                  int nx, int ny) {
+
+    int i = get_global_id(0);
+    int j = get_global_id(1);
+    int m = get_global_id(2);
+
+    if (i >= nx || j >= ny)
+        return;
+
+    size_t center = (size_t) m * nx * ny + j * nx + i;
+
+    if (i > 0 && i < nx - 1 && j > 0 && j < ny - 1) {
+        float k1 = kappa1[m];
+        float k2 = kappa2[m];
+
+        u1[center] = u0[center] + k1 * (u0[center - 1] - 2.0f * u0[center] + u0[center + 1])
+                                + k2 * (u0[center - nx] - 2.0f * u0[center] + u0[center + nx]);
+    } else {
+        u1[center] = u0[center];
+    }
+}
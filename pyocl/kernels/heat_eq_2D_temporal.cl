@@ -0,0 +1,48 @@
+// Temporally blocked explicit heat equation (5-point stencil)
+//
+// Each work-group loads a tile of the field, including a halo of width `steps`, into local memory and advances it by
+// `steps` timesteps before writing the interior of the tile back to global memory. The halo cells become stale by
+// one cell per timestep, so the valid output region of a work-group of (LX, LY) work-items is (LX - 2*steps,
+// LY - 2*steps). Boundary cells of the domain are held constant (ghost cells), matching heat_eq_2D.
+
+__kernel void heat_eq_2D_temporal(__global float *u1, __global const float *u0, __local float *tile,
+                                  float kappa1, float kappa2, int nx, int ny, int steps)
+{
+    const int lx = get_local_id(0);
+    const int ly = get_local_id(1);
+    const int LX = get_local_size(0);
+    const int LY = get_local_size(1);
+
+    // Global cell of this work-item. The tile origin is offset by the halo width
+    const int gx = get_group_id(0) * (LX - 2 * steps) + lx - steps;
+    const int gy = get_group_id(1) * (LY - 2 * steps) + ly - steps;
+
+    const int inside = gx >= 0 && gx < nx && gy >= 0 && gy < ny;
+    const int update = lx > 0 && lx < LX - 1 && ly > 0 && ly < LY - 1 &&
+                       gx > 0 && gx < nx - 1 && gy > 0 && gy < ny - 1;
+
+    const int l = ly * LX + lx;
+
+    float u = inside ? u0[gy * nx + gx] : 0.0f;
+    tile[l] = u;
+
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    for (int s = 0; s < steps; s++) {
+
+        if (update) {
+            const float c = tile[l];
+            u = c + kappa1 * (tile[l - 1] - 2.0f * c + tile[l + 1])
+                  + kappa2 * (tile[l - LX] - 2.0f * c + tile[l + LX]);
+        }
+
+        barrier(CLK_LOCAL_MEM_FENCE);
+        tile[l] = u;
+        barrier(CLK_LOCAL_MEM_FENCE);
+    }
+
+    // Only the interior of the tile is valid after advancing `steps` timesteps
+    if (inside && lx >= steps && lx < LX - steps && ly >= steps && ly < LY - steps) {
+        u1[gy * nx + gx] = u;
+    }
+}
@@ -0,0 +1,51 @@
+// Explicit heat equation on image-backed fields (see pyocl.image.ImageField)
+//
+// The field is read through a sampler with clamp-to-edge addressing, so the neighbours of the boundary cells are the
+// boundary cells themselves. This imposes a zero-gradient (insulated) boundary without any explicit boundary branches.
+// Reads use the texture cache on devices which have one, replacing the explicit local memory tiling of
+// heat_eq_2D_shared.
+
+#ifdef cl_khr_3d_image_writes
+#pragma OPENCL EXTENSION cl_khr_3d_image_writes : enable
+#endif
+
+__kernel void heat_eq_2D_image(__read_only image2d_t u0, __write_only image2d_t u1, sampler_t sampler,
+                               float kappa1, float kappa2) {
+
+    int2 p = (int2)(get_global_id(0), get_global_id(1));
+
+    if (p.x >= get_image_width(u1) || p.y >= get_image_height(u1))
+        return;
+
+    float c = read_imagef(u0, sampler, p).x;
+    float west  = read_imagef(u0, sampler, p + (int2)(-1, 0)).x;
+    float east  = read_imagef(u0, sampler, p + (int2)( 1, 0)).x;
+    float south = read_imagef(u0, sampler, p + (int2)( 0,-1)).x;
+    float north = read_imagef(u0, sampler, p + (int2)( 0, 1)).x;
+
+    float u = c + kappa1 * (west - 2.0f * c + east) + kappa2 * (south - 2.0f * c + north);
+
+    write_imagef(u1, p, (float4)(u, 0.0f, 0.0f, 0.0f));
+}
+
+#ifdef cl_khr_3d_image_writes
+__kernel void heat_eq_3D_image(__read_only image3d_t u0, __write_only image3d_t u1, sampler_t sampler,
+                               float kappa1, float kappa2, float kappa3) {
+
+    int4 p = (int4)(get_global_id(0), get_global_id(1), get_global_id(2), 0);
+
+    if (p.x >= get_image_width(u1) || p.y >= get_image_height(u1) || p.z >= get_image_depth(u1))
+        return;
+
+    float c = read_imagef(u0, sampler, p).x;
+
+    float dx = read_imagef(u0, sampler, p + (int4)(-1, 0, 0, 0)).x - 2.0f * c
+             + read_imagef(u0, sampler, p + (int4)( 1, 0, 0, 0)).x;
+    float dy = read_imagef(u0, sampler, p + (int4)( 0,-1, 0, 0)).x - 2.0f * c
+             + read_imagef(u0, sampler, p + (int4)( 0, 1, 0, 0)).x;
+    float dz = read_imagef(u0, sampler, p + (int4)( 0, 0,-1, 0)).x - 2.0f * c
+             + read_imagef(u0, sampler, p + (int4)( 0, 0, 1, 0)).x;
+
+    write_imagef(u1, p, (float4)(c + kappa1 * dx + kappa2 * dy + kappa3 * dz, 0.0f, 0.0f, 0.0f));
+}
+#endif
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+import pyopencl as cl
+
+
+class LaunchPlan(NamedTuple):
+    """
+    The launch configuration of a kernel using a local memory tile
+    """
+
+    globalSize: Tuple[int, ...]
+    """ The global size padded to a multiple of the local size """
+
+    localSize: Tuple[int, ...]
+    """ The local work group size """
+
+    extents: Tuple[int, ...]
+    """ The real extents of the domain, which should be passed to the kernel for bounds checking """
+
+    tileShape: Tuple[int, ...]
+    """ The shape of the local memory tile in elements, including the halo and vector width padding """
+
+    localMemorySize: int
+    """ The size of the local memory tile [bytes] """
+
+    def localMemory(self) -> cl.LocalMemory:
+        """
+        Returns the local memory argument for the kernel launch
+
+        :return: The local memory allocation
+        """
+        return cl.LocalMemory(self.localMemorySize)
+
+
+class LaunchPlanner:
+    """
+    Derives the launch configuration of kernels which cache a tile of the domain with a halo in local memory.
+
+    The local tile is sized from the work group size, the halo width of the stencil, the element type and the vector
+    width used for loading (the tile width is rounded up to a multiple of the vector width). The global range is padded
+    to a multiple of the local size, so kernels must bounds check against the real extents of the domain. The plan is
+    validated against the local memory available and the maximum work group size of the kernel on the device.
+    """
+
+    def __init__(self, device: cl.Device, kernel: Optional[cl.Kernel] = None) -> None:
+        self._device = device
+        self._kernel = kernel
+
+    @property
+    def maxWorkGroupSize(self) -> int:
+        """
+        The maximum work group size for the kernel on the device
+        """
+        if self._kernel is None:
+            return self._device.max_work_group_size
+
+        return self._kernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE, self._device)
+
+    @property
+    def localMemoryAvailable(self) -> int:
+        """
+        The local memory available for the tile, excluding any local memory statically used by the kernel [bytes]
+        """
+        if self._kernel is None:
+            return self._device.local_mem_size
+
+        staticSize = self._kernel.get_work_group_info(cl.kernel_work_group_info.LOCAL_MEM_SIZE, self._device)
+
+        return self._device.local_mem_size - staticSize
+
+    @staticmethod
+    def padGlobalSize(extents: Tuple[int, ...], localSize: Tuple[int, ...]) -> Tuple[int, ...]:
+        """
+        Pads the extents of the domain to a multiple of the local size
+
+        :param extents: The extents of the domain
+        :param localSize: The local work group size
+        :return: The padded global size
+        """
+        return tuple(-(-n // l) * l for n, l in zip(extents, localSize))
+
+    @staticmethod
+    def tileShape(localSize: Tuple[int, ...], halo: int = 1, vectorWidth: int = 1) -> Tuple[int, ...]:
+        """
+        Returns the shape of the local memory tile required by a work group
+
+        :param localSize: The local work group size
+        :param halo: The halo width of the stencil
+        :param vectorWidth: The vector width used for loading along the first dimension
+        :return: The shape of the tile in elements
+        """
+        width = localSize[0] + 2 * halo
+        width = -(-width // vectorWidth) * vectorWidth
+
+        return (width,) + tuple(l + 2 * halo for l in localSize[1:])
+
+    def plan(self, extents: Tuple[int, ...], localSize: Tuple[int, ...], halo: int = 1, dtype=np.float32,
+             vectorWidth: int = 1) -> LaunchPlan:
+        """
+        Plans the launch of a kernel over a domain
+
+        :param extents: The real extents of the domain
+        :param localSize: The local work group size
+        :param halo: The halo width of the stencil
+        :param dtype: The element type of the tile
+        :param vectorWidth: The vector width used for loading along the first dimension
+        :return: The launch plan
+        """
+        extents = tuple(int(n) for n in extents)
+        localSize = tuple(int(n) for n in localSize)
+
+        if len(extents) != len(localSize):
+            raise ValueError('Local size {:s} does not match the dimensions of the domain'.format(str(localSize)))
+
+        workGroupSize = int(np.prod(localSize))
+
+        if workGroupSize > self.maxWorkGroupSize:
+            raise ValueError('Work group size {:s} exceeds the maximum work group size ({:d})'.format(
+                    str(localSize), self.maxWorkGroupSize))
+
+        for dim, n in enumerate(localSize):
+            if n > self._device.max_work_item_sizes[dim]:
+                raise ValueError('Work group size {:s} exceeds the maximum work item sizes {:s}'.format(
+                        str(localSize), str(tuple(self._device.max_work_item_sizes))))
+
+        tileShape = LaunchPlanner.tileShape(localSize, halo, vectorWidth)
+        localMemorySize = int(np.prod(tileShape)) * np.dtype(dtype).itemsize
+
+        if localMemorySize > self.localMemoryAvailable:
+            raise ValueError('Local memory tile {:s} ({:d} bytes) exceeds the local memory available '
+                             '({:d} bytes)'.format(str(tileShape), localMemorySize, self.localMemoryAvailable))
+
+        return LaunchPlan(LaunchPlanner.padGlobalSize(extents, localSize), localSize, extents, tileShape,
+                          localMemorySize)
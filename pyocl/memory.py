@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+
+import numpy as np
+import pyopencl as cl
+
+
+@contextmanager
+def mapBuffer(queue: cl.CommandQueue, buffer: cl.Buffer, shape: Tuple[int, ...], dtype=np.float32,
+              flags: int = cl.map_flags.READ | cl.map_flags.WRITE,
+              waitFor: Optional[List[cl.Event]] = None) -> Iterator[np.ndarray]:
+    """
+    Maps a device buffer into host memory and provides a NumPy view of it. The buffer is unmapped on leaving the
+    context. On devices sharing memory with the host (see :meth:`Core.hasSharedMemory`) and buffers allocated with
+    ``ALLOC_HOST_PTR``, the view is zero-copy. The view must not be used after the context has exited.
+
+    .. code:: python
+
+        with mapBuffer(queue, buffer, (nx, ny)) as u:
+            plt.imshow(u)
+
+    :param queue: The command queue
+    :param buffer: The device buffer to map
+    :param shape: The shape of the view
+    :param dtype: The data type of the view
+    :param flags: The OpenCL map flags (e.g. ``cl.map_flags.READ``)
+    :param waitFor: Events which must complete before mapping the buffer
+    :return: The NumPy view of the buffer
+    """
+    array, ev = cl.enqueue_map_buffer(queue, buffer, flags, 0, shape, dtype, wait_for=waitFor, is_blocking=True)
+
+    try:
+        yield array
+    finally:
+        array.base.release(queue)
+
+
+class BufferPool:
+    """
+    Pooled allocator for OpenCL buffers on a context.
+
+    Buffers returned to the pool with :meth:`free` are held and reused by later allocations of the same size and memory
+    flags, avoiding the cost and fragmentation of repeatedly allocating large device buffers. The total number of bytes
+    allocated through the pool (both active and held) is tracked against a limit, which by default is the global memory
+    size of the device. Held buffers are released before an allocation would exceed the limit.
+
+    The pool may be shared by simulations on different queues, so a buffer may be freed whilst commands using it are
+    still in flight. The events of those commands are passed to :meth:`free`, and a held buffer is only handed out
+    again once its events have completed. Buffers without outstanding events are preferred, otherwise
+    :meth:`allocate` waits for the events of the reused buffer.
+    """
+
+    def __init__(self, context: cl.Context, limit: Optional[int] = None) -> None:
+
+        if limit is None:
+            limit = min(device.global_mem_size for device in context.devices)
+
+        self._context = context
+        self._limit = limit
+        self._held = {}  # type: Dict[Tuple[int, int], List[Tuple[cl.Buffer, List[cl.Event]]]]
+        self._activeBytes = 0
+        self._heldBytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def context(self) -> cl.Context:
+        """
+        The OpenCL context buffers are allocated on
+        """
+        return self._context
+
+    @property
+    def limit(self) -> int:
+        """
+        The maximum number of bytes that may be allocated by the pool [bytes]
+        """
+        return self._limit
+
+    @limit.setter
+    def limit(self, limit: int):
+        self._limit = limit
+
+    @property
+    def activeBytes(self) -> int:
+        """
+        The number of bytes currently in use by allocated buffers [bytes]
+        """
+        return self._activeBytes
+
+    @property
+    def heldBytes(self) -> int:
+        """
+        The number of bytes held by the pool for reuse [bytes]
+        """
+        return self._heldBytes
+
+    @property
+    def allocatedBytes(self) -> int:
+        """
+        The total number of bytes allocated on the device by the pool [bytes]
+        """
+        return self._activeBytes + self._heldBytes
+
+    def allocate(self, nbytes: int, flags: int = cl.mem_flags.READ_WRITE) -> cl.Buffer:
+        """
+        Allocates a buffer, reusing a held buffer of the same size and flags if available
+
+        :param nbytes: The size of the buffer [bytes]
+        :param flags: The OpenCL memory flags for the buffer. Host pointer flags are not supported.
+        :return: The allocated buffer
+        """
+        if flags & (cl.mem_flags.USE_HOST_PTR | cl.mem_flags.COPY_HOST_PTR):
+            raise ValueError('Host pointer memory flags cannot be used with a pooled buffer')
+
+        key = (int(nbytes), int(flags))
+
+        with self._lock:
+            held = self._held.get(key)
+
+            if held:
+                index = next((i for i, (buffer, events) in enumerate(held) if BufferPool._isComplete(events)), 0)
+                buffer, events = held.pop(index)
+                self._heldBytes -= nbytes
+                self._activeBytes += nbytes
+            else:
+                buffer, events = None, []
+
+        if buffer is not None:
+            # Commands enqueued before the buffer was freed must complete before it is reused
+            if events:
+                cl.wait_for_events(events)
+
+            return buffer
+
+        with self._lock:
+
+            if self.allocatedBytes + nbytes > self._limit:
+                self._releaseHeld()
+
+            if self.allocatedBytes + nbytes > self._limit:
+                raise MemoryError('Allocating {:d} bytes exceeds the device memory limit ({:d} of {:d} bytes '
+                                  'in use)'.format(nbytes, self._activeBytes, self._limit))
+
+            buffer = cl.Buffer(self._context, flags, nbytes)
+            self._activeBytes += nbytes
+
+        logging.debug('Allocated buffer ({:d} bytes)'.format(nbytes))
+
+        return buffer
+
+    @staticmethod
+    def _isComplete(events: List[cl.Event]) -> bool:
+        return all(ev.command_execution_status == cl.command_execution_status.COMPLETE for ev in events)
+
+    def free(self, buffer: cl.Buffer, waitFor: Optional[List[cl.Event]] = None) -> None:
+        """
+        Returns a buffer allocated by the pool so that it may be reused
+
+        :param buffer: The buffer to return
+        :param waitFor: The events of the commands using the buffer, which must complete before it is reused
+        """
+        key = (buffer.size, buffer.flags)
+        events = [ev for ev in waitFor if ev is not None] if waitFor else []
+
+        with self._lock:
+            self._held.setdefault(key, []).append((buffer, events))
+            self._activeBytes -= buffer.size
+            self._heldBytes += buffer.size
+
+    def _releaseHeld(self) -> None:
+
+        # Commands in flight retain their buffers, so the held buffers may be released immediately
+        for buffers in self._held.values():
+            for buffer, events in buffers:
+                buffer.release()
+
+        self._held.clear()
+        self._heldBytes = 0
+
+    def releaseHeld(self) -> None:
+        """
+        Releases all the buffers held by the pool for reuse back to the device
+        """
+        with self._lock:
+            self._releaseHeld()
+
+
+class DoubleBuffer:
+    """
+    A field stored on the device as a pair of ping-pong buffers.
+
+    The :attr:`front` buffer holds the current state of the field and the :attr:`back` buffer is the target of the
+    next update. :meth:`swap` exchanges the buffers without copying any data. Buffers are allocated from a
+    :class:`BufferPool` and are returned to it by :meth:`release`.
+    """
+
+    def __init__(self, pool: BufferPool, shape: Tuple[int, ...], dtype=np.float32,
+                 flags: int = cl.mem_flags.READ_WRITE) -> None:
+
+        self._pool = pool
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+
+        self._events = []  # type: List[cl.Event]
+        self._front = pool.allocate(self.nbytes, flags)
+
+        try:
+            self._back = pool.allocate(self.nbytes, flags)
+        except BaseException:
+            pool.free(self._front)
+            raise
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        The shape of the field
+        """
+        return self._shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        The data type of the field
+        """
+        return self._dtype
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The size of a single buffer of the field [bytes]
+        """
+        return int(np.prod(self._shape)) * self._dtype.itemsize
+
+    @property
+    def front(self) -> cl.Buffer:
+        """
+        The buffer holding the current state of the field
+        """
+        return self._front
+
+    @property
+    def back(self) -> cl.Buffer:
+        """
+        The buffer to write the next state of the field to
+        """
+        return self._back
+
+    def swap(self) -> None:
+        """
+        Exchanges the front and back buffers. Only the buffer references are swapped, so this does not block.
+        """
+        self._front, self._back = self._back, self._front
+
+    def upload(self, queue: cl.CommandQueue, data: np.ndarray, blocking: bool = True,
+               waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Uploads the host data to the front buffer
+
+        :param queue: The command queue
+        :param data: The host array matching the shape and type of the field
+        :param blocking: Wait for the transfer to complete
+        :param waitFor: Events which must complete before the transfer
+        :return: The event for the transfer
+        """
+        if data.shape != self._shape or data.dtype != self._dtype:
+            raise ValueError('Data does not match the shape and type of the field')
+
+        ev = cl.enqueue_copy(queue, self._front, np.ascontiguousarray(data), is_blocking=blocking, wait_for=waitFor)
+
+        if not blocking:
+            self._events = [ev]
+
+        return ev
+
+    def download(self, queue: cl.CommandQueue, out: Optional[np.ndarray] = None,
+                 waitFor: Optional[List[cl.Event]] = None) -> np.ndarray:
+        """
+        Downloads the front buffer to the host
+
+        :param queue: The command queue
+        :param out: An optional host array to copy into, avoiding a new allocation
+        :param waitFor: Events which must complete before the transfer
+        :return: The host array
+        """
+        if out is None:
+            out = np.empty(self._shape, dtype=self._dtype)
+
+        cl.enqueue_copy(queue, out, self._front, is_blocking=True, wait_for=waitFor)
+
+        return out
+
+    def map(self, queue: cl.CommandQueue, flags: int = cl.map_flags.READ | cl.map_flags.WRITE,
+            waitFor: Optional[List[cl.Event]] = None):
+        """
+        Maps the front buffer to a NumPy view for use in a ``with`` statement. See :func:`mapBuffer`.
+
+        :param queue: The command queue
+        :param flags: The OpenCL map flags
+        :param waitFor: Events which must complete before mapping the buffer
+        :return: The context manager providing the NumPy view
+        """
+        return mapBuffer(queue, self._front, self._shape, self._dtype, flags, waitFor)
+
+    def release(self, waitFor: Optional[List[cl.Event]] = None) -> None:
+        """
+        Returns the buffers to the pool. The field must not be used after being released.
+
+        :param waitFor: The events of the commands using the field (e.g. the most recent step), which must complete
+                        before the buffers are reused. The transfers of :meth:`upload` are included automatically.
+        """
+        if self._front is not None:
+            events = self._events + (list(waitFor) if waitFor else [])
+
+            self._pool.free(self._front, events)
+            self._pool.free(self._back, events)
+            self._front = self._back = None
+            self._events = []
+
+    def __enter__(self) -> 'DoubleBuffer':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
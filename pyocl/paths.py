@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from typing import Union
+
+
+def cacheDirectory() -> str:
+    """
+    Returns the base directory used by pyocl for persisting data between processes. This may be overridden by the
+    ``PYOCL_CACHE_DIR`` environment variable.
+
+    :return: The base cache directory
+    """
+    cacheDir = os.environ.get('PYOCL_CACHE_DIR')
+
+    if not cacheDir:
+        cacheDir = os.path.join(os.path.expanduser('~'), '.cache', 'pyocl')
+
+    return cacheDir
+
+
+def atomicWrite(filename: str, data: Union[str, bytes], sync: bool = False) -> None:
+    """
+    Writes a file atomically by writing to a temporary file in the same directory and replacing the file, so that
+    concurrent readers never observe a partial file. The directory is created if it does not exist.
+
+    :param filename: The file to write
+    :param data: The contents of the file
+    :param sync: Flush the contents to disk before replacing the file, so that the file is complete after a crash
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmpPath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        os.replace(tmpPath, filename)
+
+    except BaseException:
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+        raise
+
+
+KERNEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kernels')
+
+
+def loadKernelSource(name: str) -> str:
+    """
+    Loads the source of an OpenCL kernel bundled with pyocl
+
+    :param name: The filename of the kernel within the kernels directory
+    :return: The kernel source
+    """
+    with open(os.path.join(KERNEL_DIR, name)) as f:
+        return f.read()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import threading
+from typing import Dict, Optional, Tuple
+import logging
+import pyopencl as cl
+
+from .core import Core
+from .selection import Workload
+
+
+class CorePool:
+    """
+    Process-wide registry of :class:`Core` instances.
+
+    Creating a :class:`Core` enumerates the platforms and devices and creates a new OpenCL context. The pool hands back
+    an existing :class:`Core` for a given platform, device and set of options so that simulations targeting the same
+    device share a single context, its compiled programs and any buffers allocated on it. Each simulation is expected
+    to create its own command queue on the shared context.
+    """
+
+    _cores = {}  # type: Dict[Tuple, Core]
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _generateKey(device, useGPU: bool, workload: Optional[Workload] = None) -> Tuple:
+
+        if device is None:
+            return None, None, useGPU, workload
+
+        # The workload only affects the selection of a device, so a specified device ignores it
+        return device.platform.int_ptr, device.int_ptr, useGPU, None
+
+    @classmethod
+    def get(cls, device: cl.Device = None, useGPU: bool = True, workload: Optional[Workload] = None) -> Core:
+        """
+        Returns a shared :class:`Core` for the device and options requested, creating it on first use.
+
+        :param device: The OpenCL device to use. If None, the default device selected by :class:`Core` is used
+        :param useGPU: Prefer a GPU device when no device is specified
+        :param workload: Select the fastest device for the workload profile when no device is specified (see
+                         :class:`~pyocl.selection.DeviceSelector`)
+        :return: The shared Core instance
+        """
+        key = cls._generateKey(device, useGPU, workload)
+
+        with cls._lock:
+            core = cls._cores.get(key)
+
+            if core is None:
+                logging.debug('Creating shared OpenCL Core')
+                core = Core(device, useGPU, workload)
+
+                # Register the core under both the requested and the resolved device
+                cls._cores[key] = core
+                cls._cores.setdefault(cls._generateKey(core.device, useGPU), core)
+
+        return core
+
+    @classmethod
+    def cores(cls) -> Tuple[Core, ...]:
+        """
+        Returns the unique Core instances currently held by the pool
+        """
+        with cls._lock:
+            return tuple({id(core): core for core in cls._cores.values()}.values())
+
+    @classmethod
+    def release(cls, core: Core) -> None:
+        """
+        Removes a Core from the pool. Existing references to the Core remain valid.
+
+        :param core: The Core to remove
+        """
+        with cls._lock:
+            for key in [key for key, value in cls._cores.items() if value is core]:
+                del cls._cores[key]
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Removes all Core instances from the pool
+        """
+        with cls._lock:
+            cls._cores.clear()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from enum import Enum
+import logging
+
+import numpy as np
+import pyopencl as cl
+
+
+CL_TYPES = {'half': np.float16,
+            'float': np.float32,
+            'double': np.float64}
+""" The NumPy types of the OpenCL floating point types """
+
+
+class Precision(Enum):
+    """
+    Precision policy selecting the storage type of fields in device memory and the type used for arithmetic in kernels.
+
+    Kernels written against the policy use the ``storage_t`` and ``real_t`` types and the ``LOAD(p, i)`` and
+    ``STORE(p, i, v)`` macros, which are defined by the :meth:`header` prepended to the kernel source. Half precision
+    storage uses ``vload_half`` and ``vstore_half``, which are part of the core OpenCL specification and do not require
+    native float16 support, halving the memory traffic of bandwidth-bound kernels.
+    """
+
+    HALF = ('half', 'float')
+    """ Half precision storage with single precision arithmetic """
+
+    FLOAT = ('float', 'float')
+    """ Single precision storage and arithmetic """
+
+    MIXED = ('float', 'double')
+    """ Single precision storage with double precision arithmetic """
+
+    DOUBLE = ('double', 'double')
+    """ Double precision storage and arithmetic """
+
+    @property
+    def storage(self) -> str:
+        """
+        The OpenCL type of the fields stored in device memory
+        """
+        return self.value[0]
+
+    @property
+    def compute(self) -> str:
+        """
+        The OpenCL type used for arithmetic within the kernels
+        """
+        return self.value[1]
+
+    @property
+    def storageType(self) -> np.dtype:
+        """
+        The NumPy type of the fields stored in device memory
+        """
+        return np.dtype(CL_TYPES[self.storage])
+
+    @property
+    def computeType(self) -> np.dtype:
+        """
+        The NumPy type of scalar kernel arguments declared as ``real_t``
+        """
+        return np.dtype(CL_TYPES[self.compute])
+
+    def real(self, value: float) -> np.floating:
+        """
+        Converts a scalar to the compute type, for passing as a ``real_t`` kernel argument
+
+        :param value: The scalar value
+        :return: The converted scalar
+        """
+        return self.computeType.type(value)
+
+    def isSupported(self, device: cl.Device) -> bool:
+        """
+        Returns if the device supports the policy. Double precision arithmetic requires ``cl_khr_fp64``.
+
+        :param device: The OpenCL device
+        :return: The policy is supported by the device
+        """
+        if self.compute == 'double':
+            return 'cl_khr_fp64' in device.extensions
+
+        return True
+
+    def resolve(self, device: cl.Device) -> 'Precision':
+        """
+        Returns the policy to use on a device, falling back to single precision when double precision is unavailable
+
+        :param device: The OpenCL device
+        :return: The supported precision policy
+        """
+        if self.isSupported(device):
+            return self
+
+        logging.warning('Precision {:s} is not supported by {:s} - using FLOAT'.format(self.name, device.name))
+
+        return Precision.FLOAT
+
+    def header(self) -> str:
+        """
+        Returns the OpenCL source defining the types and macros of the policy
+
+        :return: The source prepended to the kernel
+        """
+        lines = ['// pyocl precision policy - {:s}'.format(self.name)]
+
+        if self.compute == 'double' or self.storage == 'double':
+            lines.append('#pragma OPENCL EXTENSION cl_khr_fp64 : enable')
+
+        lines += ['#define PYOCL_PRECISION 1',
+                  '#define PYOCL_PRECISION_{:s} 1'.format(self.name),
+                  'typedef {:s} storage_t;'.format(self.storage),
+                  'typedef {:s} real_t;'.format(self.compute)]
+
+        if self.storage == 'half':
+            lines += ['#define LOAD(p, i) ((real_t) vload_half((i), (p)))',
+                      '#define STORE(p, i, v) vstore_half((float) (v), (i), (p))']
+        else:
+            lines += ['#define LOAD(p, i) ((real_t) (p)[i])',
+                      '#define STORE(p, i, v) ((p)[i] = (storage_t) (v))']
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from typing import Any, Dict, List, NamedTuple
+
+import numpy as np
+import pyopencl as cl
+
+
+class ProfileRecord(NamedTuple):
+    """
+    Timing information of a command executed on an OpenCL device. Times are device timestamps in [ns].
+    """
+    name: str
+    category: str
+    queued: int
+    submit: int
+    start: int
+    end: int
+    nbytes: int
+    queue: int
+
+    @property
+    def duration(self) -> int:
+        """ The execution time of the command on the device [ns] """
+        return self.end - self.start
+
+    @property
+    def overhead(self) -> int:
+        """ The time between the command being enqueued on the host and starting on the device [ns] """
+        return self.start - self.queued
+
+
+class Profiler:
+    """
+    Collects the profiling information of kernel launches and memory transfers.
+
+    Commands are recorded with their event and are resolved into :class:`ProfileRecord` once the event has completed,
+    so that recording never blocks the host. The command queue must be created with ``PROFILING_ENABLE``, which is the
+    default for :class:`~pyocl.OpenCLSimBase`. Statistics can be aggregated per command and the timeline exported in
+    the Chrome trace format (viewable in ``chrome://tracing`` or Perfetto).
+    """
+
+    KERNEL = 'kernel'
+    TRANSFER = 'transfer'
+
+    def __init__(self, maxRecords: int = 1000000) -> None:
+        self._maxRecords = maxRecords
+        self._pending = []  # type: List[tuple]
+        self._records = []  # type: List[ProfileRecord]
+        self._lock = threading.Lock()
+
+    @property
+    def records(self) -> List[ProfileRecord]:
+        """
+        The profiling records of all completed commands
+        """
+        self.collect()
+        return list(self._records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def record(self, name: str, event: cl.Event, category: str = KERNEL, nbytes: int = 0) -> None:
+        """
+        Records a command for profiling
+
+        :param name: The name of the command (e.g. the kernel name)
+        :param event: The event returned when enqueuing the command
+        :param category: The category of command
+        :param nbytes: The number of bytes accessed by the command
+        """
+        with self._lock:
+            self._pending.append((name, category, event, nbytes))
+
+            if len(self._pending) > 1024:
+                self._collect()
+
+    def recordTransfer(self, event: cl.Event, dest: Any, src: Any) -> None:
+        """
+        Records a memory transfer for profiling. The direction and size of the transfer are derived from the
+        destination and source.
+
+        :param event: The event returned when enqueuing the transfer
+        :param dest: The destination of the transfer (host array or memory object)
+        :param src: The source of the transfer (host array or memory object)
+        """
+        srcDevice = isinstance(src, cl.MemoryObjectHolder)
+        destDevice = isinstance(dest, cl.MemoryObjectHolder)
+
+        if srcDevice and destDevice:
+            name = 'copy_dtod'
+            nbytes = 2 * min(src.size, dest.size)
+        elif destDevice:
+            name = 'copy_htod'
+            nbytes = memoryview(src).nbytes
+        else:
+            name = 'copy_dtoh'
+            nbytes = memoryview(dest).nbytes
+
+        self.record(name, event, Profiler.TRANSFER, nbytes)
+
+    def _collect(self) -> None:
+
+        pending = []
+        complete = cl.command_execution_status.COMPLETE
+
+        for item in self._pending:
+            name, category, event, nbytes = item
+
+            try:
+                if event.command_execution_status != complete:
+                    pending.append(item)
+                    continue
+
+                profile = event.profile
+                record = ProfileRecord(name, category, profile.queued, profile.submit, profile.start, profile.end,
+                                       nbytes, event.command_queue.int_ptr)
+            except cl.Error:
+                # Profiling information is not available (e.g. the queue was created without profiling)
+                continue
+
+            if len(self._records) < self._maxRecords:
+                self._records.append(record)
+
+        self._pending = pending
+
+    def collect(self) -> None:
+        """
+        Resolves the profiling information of all the commands that have completed
+        """
+        with self._lock:
+            self._collect()
+
+    def clear(self) -> None:
+        """
+        Removes all the recorded commands
+        """
+        with self._lock:
+            self._pending = []
+            self._records = []
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Aggregates the statistics of the completed commands by name. Times are provided in [ms] and the achieved
+        bandwidth in [GB/s] based on the bytes accessed by each command.
+
+        :return: A dictionary of statistics for each command
+        """
+        groups = {}  # type: Dict[str, List[ProfileRecord]]
+
+        for record in self.records:
+            groups.setdefault(record.name, []).append(record)
+
+        stats = {}
+
+        for name, records in groups.items():
+            durations = np.array([record.duration for record in records], dtype=np.float64) * 1e-6
+            overheads = np.array([record.overhead for record in records], dtype=np.float64) * 1e-6
+            nbytes = sum(record.nbytes for record in records)
+            totalTime = float(durations.sum())
+
+            stats[name] = {
+                'category': records[0].category,
+                'count': len(records),
+                'total': totalTime,
+                'mean': float(durations.mean()),
+                'min': float(durations.min()),
+                'max': float(durations.max()),
+                'p50': float(np.percentile(durations, 50)),
+                'p90': float(np.percentile(durations, 90)),
+                'p99': float(np.percentile(durations, 99)),
+                'overhead': float(overheads.mean()),
+                'bytes': nbytes,
+                'bandwidth': nbytes / (totalTime * 1e-3) * 1e-9 if totalTime > 0 else 0.0
+            }
+
+        return stats
+
+    def chromeTrace(self) -> Dict[str, Any]:
+        """
+        Generates the timeline of the completed commands in the Chrome trace event format. Each command queue is
+        shown as a separate thread.
+
+        :return: The Chrome trace
+        """
+        records = self.records
+
+        if not records:
+            return {'traceEvents': [], 'displayTimeUnit': 'ms'}
+
+        origin = min(record.queued for record in records)
+        queues = {}  # type: Dict[int, int]
+        events = []
+
+        for record in records:
+            tid = queues.setdefault(record.queue, len(queues))
+
+            events.append({
+                'name': record.name,
+                'cat': record.category,
+                'ph': 'X',
+                'pid': 0,
+                'tid': tid,
+                'ts': (record.start - origin) * 1e-3,
+                'dur': record.duration * 1e-3,
+                'args': {'queued': (record.queued - origin) * 1e-3,
+                         'submit': (record.submit - origin) * 1e-3,
+                         'overhead': record.overhead * 1e-3,
+                         'bytes': record.nbytes}
+            })
+
+        for queue, tid in queues.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': tid,
+                           'args': {'name': 'Queue {:d}'.format(tid)}})
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def exportChromeTrace(self, filename: str) -> None:
+        """
+        Exports the timeline of the completed commands to a Chrome trace JSON file
+
+        :param filename: The output filename
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.chromeTrace(), f)
+
+
+class ProfiledKernel:
+    """
+    Wraps an OpenCL kernel so that each launch is recorded by a :class:`Profiler`. The bytes accessed by the launch
+    are estimated from the size of the memory objects passed as arguments.
+    """
+
+    def __init__(self, kernel: cl.Kernel, profiler: Profiler) -> None:
+        self._kernel = kernel
+        self._profiler = profiler
+
+    @property
+    def kernel(self) -> cl.Kernel:
+        """ The wrapped OpenCL kernel """
+        return self._kernel
+
+    def __call__(self, queue: cl.CommandQueue, globalSize, localSize, *args, **kwargs) -> cl.Event:
+        ev = self._kernel(queue, globalSize, localSize, *args, **kwargs)
+
+        nbytes = sum(arg.size for arg in args if isinstance(arg, cl.MemoryObjectHolder))
+        self._profiler.record(self._kernel.function_name, ev, Profiler.KERNEL, nbytes)
+
+        return ev
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._kernel, attr)
+
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import threading
+from typing import Any, Dict, List, Optional
+import logging
+
+from .core import Core
+
+
+class PartitionScheduler:
+    """
+    Places simulations on partitions of a device created by device fission.
+
+    Concurrent simulations on the same CPU device otherwise compete for every core. The scheduler partitions the
+    device into sub-devices (equally or by NUMA node, see :meth:`Core.partitionDevice`), each with its own
+    :class:`Core` and context, and initialises each simulation on the least loaded partition. This gives predictable
+    throughput per simulation and keeps the memory of a simulation local to its NUMA node.
+    """
+
+    def __init__(self, ocl: Optional[Core] = None, count: Optional[int] = None, numa: bool = False) -> None:
+        """
+        :param ocl: The Core of the device to partition. By default the first CPU device is used
+        :param count: The number of partitions
+        :param numa: Partition by NUMA node
+        """
+        if ocl is None:
+            ocl = Core(useGPU=False)
+
+        devices = ocl.createSubDevices(count, numa)
+
+        self._partitions = [Core(device=device) for device in devices]
+        self._load = [0] * len(self._partitions)
+        self._placement = {}  # type: Dict[int, int]
+        self._lock = threading.Lock()
+
+        logging.debug('Partitioned {:s} into {:d} sub-devices'.format(ocl.device.name, len(self._partitions)))
+
+    @property
+    def partitions(self) -> List[Core]:
+        """
+        The Core of each partition
+        """
+        return self._partitions
+
+    @property
+    def load(self) -> List[int]:
+        """
+        The number of simulations placed on each partition
+        """
+        with self._lock:
+            return list(self._load)
+
+    def acquire(self) -> Core:
+        """
+        Reserves the least loaded partition
+
+        :return: The Core of the partition
+        """
+        with self._lock:
+            index = self._load.index(min(self._load))
+            self._load[index] += 1
+
+        return self._partitions[index]
+
+    def place(self, sim: Any) -> Core:
+        """
+        Initialises a simulation on the least loaded partition using :meth:`OpenCLSimBase.initialiseCL`
+
+        :param sim: The simulation
+        :return: The Core of the partition
+        """
+        with self._lock:
+            if id(sim) in self._placement:
+                raise ValueError('Simulation has already been placed')
+
+            index = self._load.index(min(self._load))
+            self._load[index] += 1
+            self._placement[id(sim)] = index
+
+        core = self._partitions[index]
+
+        try:
+            sim.initialiseCL(core)
+        except BaseException:
+            self.release(sim)
+            raise
+
+        return core
+
+    def release(self, sim: Any) -> None:
+        """
+        Releases the partition of a simulation once it has finished
+
+        :param sim: The simulation
+        """
+        with self._lock:
+            index = self._placement.pop(id(sim), None)
+
+            if index is not None:
+                self._load[index] -= 1
+
+    def releasePartition(self, core: Core) -> None:
+        """
+        Releases a partition reserved by :meth:`acquire`
+
+        :param core: The Core of the partition
+        """
+        with self._lock:
+            index = self._partitions.index(core)
+            self._load[index] = max(self._load[index] - 1, 0)
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import logging
+import threading
+from enum import Enum, auto
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyopencl as cl
+
+from .paths import atomicWrite, cacheDirectory
+from .capabilities import platforms
+
+
+class Workload(Enum):
+    """
+    Enums describing the performance characteristics of a workload for ranking devices
+    """
+    MEMORY_BOUND = auto()  # e.g. explicit stencils - ranked by memory bandwidth
+    COMPUTE_BOUND = auto()  # ranked by floating point throughput
+
+
+BENCHMARK_SRC = """
+kernel void bandwidth(global const float4 *in, global float4 *out)
+{
+    int i = get_global_id(0);
+    out[i] = in[i];
+}
+
+kernel void flops(global float4 *out, float b, float c)
+{
+    int i = get_global_id(0);
+
+    float4 a0 = (float4)(i, i + 1, i + 2, i + 3);
+    float4 a1 = a0 + 1.0f;
+    float4 a2 = a0 + 2.0f;
+    float4 a3 = a0 + 3.0f;
+
+    // mad is only defined for arguments of the same type
+    float4 vb = (float4)(b);
+    float4 vc = (float4)(c);
+
+    for (int j = 0; j < ${iterations}; j++) {
+        a0 = mad(a0, vb, vc);
+        a1 = mad(a1, vb, vc);
+        a2 = mad(a2, vb, vc);
+        a3 = mad(a3, vb, vc);
+    }
+
+    out[i] = a0 + a1 + a2 + a3;
+}
+"""
+
+
+class DeviceSelector:
+    """
+    Ranks the available OpenCL devices across all platforms using short micro-benchmarks.
+
+    Each device is measured for its achieved memory bandwidth (a vectorised copy) and floating point throughput (a
+    chain of fused multiply-adds). The scores are cached on disk for each device and driver version, so that the
+    benchmarks are only run once on each machine.
+    """
+
+    FLOP_ITERATIONS = 256
+
+    def __init__(self, cacheFile: Optional[str] = None, bandwidthSize: int = 64 * 1024 * 1024,
+                 repeats: int = 3) -> None:
+
+        if cacheFile is None:
+            cacheFile = os.path.join(cacheDirectory(), 'devices.json')
+
+        self._cacheFile = cacheFile
+        self._bandwidthSize = bandwidthSize
+        self._repeats = repeats
+        self._scores = None  # type: Optional[Dict[str, Dict[str, float]]]
+        self._lock = threading.Lock()
+
+    @property
+    def cacheFile(self) -> str:
+        """
+        The file used to persist the device scores
+        """
+        return self._cacheFile
+
+    @staticmethod
+    def devices() -> List[cl.Device]:
+        """
+        Returns all the OpenCL devices available across every platform
+
+        :return: List of clDevices
+        """
+        devices = []
+
+        for platform in platforms():
+            try:
+                devices += platform.get_devices()
+            except cl.Error:
+                logging.warning('Unable to query devices of platform <{:s}>'.format(platform.name))
+
+        return devices
+
+    @staticmethod
+    def generateKey(device: cl.Device) -> str:
+        """
+        Generates the key used for storing the scores of a device
+
+        :param device: The OpenCL device
+        :return: The key for the device scores
+        """
+        return '{:s}|{:s}|{:s}'.format(device.platform.name, device.name, device.driver_version)
+
+    def _loadScores(self) -> Dict[str, Dict[str, float]]:
+
+        if self._scores is None:
+            try:
+                with open(self._cacheFile, 'r') as f:
+                    self._scores = json.load(f)
+            except (OSError, ValueError):
+                self._scores = {}
+
+        return self._scores
+
+    def _saveScores(self) -> None:
+
+        try:
+            atomicWrite(self._cacheFile, json.dumps(self._scores, indent=2, sort_keys=True))
+
+        except OSError as e:
+            logging.warning('Unable to store the device scores ({:s})'.format(str(e)))
+
+    def _time(self, queue: cl.CommandQueue, kernel: cl.Kernel, globalSize: Tuple[int, ...]) -> float:
+
+        # Warm-up launch
+        cl.enqueue_nd_range_kernel(queue, kernel, globalSize, None).wait()
+
+        best = None
+        for i in range(self._repeats):
+            ev = cl.enqueue_nd_range_kernel(queue, kernel, globalSize, None)
+            ev.wait()
+            elapsed = (ev.profile.end - ev.profile.start) * 1e-9
+
+            best = elapsed if best is None else min(best, elapsed)
+
+        return max(best, 1e-9)
+
+    def benchmark(self, device: cl.Device) -> Dict[str, float]:
+        """
+        Runs the micro-benchmarks on a device
+
+        :param device: The OpenCL device
+        :return: The achieved memory bandwidth [GB/s] and floating point throughput [GFLOP/s]
+        """
+        from mako.template import Template
+
+        context = cl.Context(devices=[device])
+        queue = cl.CommandQueue(context, properties=cl.command_queue_properties.PROFILING_ENABLE)
+
+        source = str(Template(BENCHMARK_SRC).render(iterations=DeviceSelector.FLOP_ITERATIONS))
+        program = cl.Program(context, source).build()
+
+        mf = cl.mem_flags
+
+        # Memory bandwidth
+        nbytes = min(self._bandwidthSize, device.max_mem_alloc_size // 2)
+        nbytes -= nbytes % 16
+
+        bufIn = cl.Buffer(context, mf.READ_ONLY, nbytes)
+        bufOut = cl.Buffer(context, mf.WRITE_ONLY, nbytes)
+
+        kernel = cl.Kernel(program, 'bandwidth')
+        kernel.set_args(bufIn, bufOut)
+        elapsed = self._time(queue, kernel, (nbytes // 16,))
+        bandwidth = 2 * nbytes / elapsed * 1e-9
+
+        # Floating point throughput
+        numItems = device.max_compute_units * 16384
+        bufFlops = cl.Buffer(context, mf.WRITE_ONLY, numItems * 16)
+
+        kernel = cl.Kernel(program, 'flops')
+        kernel.set_args(bufFlops, np.float32(0.999), np.float32(1e-3))
+        elapsed = self._time(queue, kernel, (numItems,))
+        flops = numItems * DeviceSelector.FLOP_ITERATIONS * 4 * 4 * 2 / elapsed * 1e-9
+
+        logging.debug('Device <{:s}> - {:.2f} GB/s, {:.2f} GFLOP/s'.format(device.name, bandwidth, flops))
+
+        return {'bandwidth': bandwidth, 'flops': flops}
+
+    def scores(self, device: cl.Device, force: bool = False) -> Dict[str, float]:
+        """
+        Returns the cached scores of a device, running the benchmarks if the device has not been measured
+
+        :param device: The OpenCL device
+        :param force: Re-run the benchmarks even if scores are cached
+        :return: The achieved memory bandwidth [GB/s] and floating point throughput [GFLOP/s]
+        """
+        key = DeviceSelector.generateKey(device)
+
+        with self._lock:
+            scores = self._loadScores().get(key)
+
+        if scores is None or force:
+            scores = self.benchmark(device)
+
+            with self._lock:
+                self._loadScores()[key] = scores
+                self._saveScores()
+
+        return scores
+
+    def rank(self, workload: Workload = Workload.MEMORY_BOUND,
+             devices: Optional[List[cl.Device]] = None) -> List[Tuple[cl.Device, float]]:
+        """
+        Ranks the devices for a workload, fastest first. Devices which fail to run the benchmarks are excluded.
+
+        :param workload: The workload profile
+        :param devices: The devices to rank. If None, all the available devices are ranked
+        :return: List of devices and their score
+        """
+        if devices is None:
+            devices = DeviceSelector.devices()
+
+        metric = 'bandwidth' if workload == Workload.MEMORY_BOUND else 'flops'
+        ranking = []
+
+        for device in devices:
+            try:
+                ranking.append((device, self.scores(device)[metric]))
+            except (cl.Error, RuntimeError) as e:
+                logging.warning('Unable to benchmark device <{:s}> ({:s})'.format(device.name, str(e)))
+
+        return sorted(ranking, key=lambda item: item[1], reverse=True)
+
+    def select(self, workload: Workload = Workload.MEMORY_BOUND,
+               devices: Optional[List[cl.Device]] = None) -> cl.Device:
+        """
+        Selects the fastest device for a workload
+
+        :param workload: The workload profile
+        :param devices: The candidate devices. If None, all the available devices are considered
+        :return: The selected OpenCL device
+        """
+        ranking = self.rank(workload, devices)
+
+        if not ranking:
+            raise RuntimeError('No OpenCL device currently available')
+
+        return ranking[0][0]
@@ -1,10 +1,43 @@
 from enum import Enum, auto
 import abc
-from typing import Any, List, Tuple
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
 import logging
+import numpy as np
 import pyopencl as cl
 
-from .core import Core
+from .core import BuildProfile, Core
+from .pool import CorePool
+from .selection import Workload
+from .tuning import WorkGroupTuner
+from .profiling import Profiler, ProfiledKernel
+from .memory import DoubleBuffer, mapBuffer
+from .snapshot import SnapshotWriter
+from .tiling import TiledExecutor
+from .launch import LaunchPlan, LaunchPlanner
+from .precision import Precision
+from .image import ImageField
+from .ensemble import Ensemble
+from .checkpoint import Checkpoint
+from .convergence import ConvergenceMonitor, ConvergenceNorm, Residual
+
+
+class ProfileValidation(NamedTuple):
+    """
+    The result of validating a build profile against the default profile
+    """
+
+    profile: BuildProfile
+    """ The validated build profile """
+
+    maxError: float
+    """ The maximum absolute difference from the result of the default profile """
+
+    relativeError: float
+    """ The maximum absolute difference relative to the maximum magnitude of the default result """
+
+    accepted: bool
+    """ The relative error is within the tolerance and the profile was selected """
 
 
 class OpenCLSimBase(abc.ABC):
@@ -13,34 +46,282 @@ class OpenCLSimBase(abc.ABC):
     The derived class should specify the kernel input as a string
     """
 
+    useSharedCore = True
+    """ Obtain the Core from the process-wide :class:`CorePool` rather than creating a new OpenCL context """
+
+    workload = None  # type: Optional[Workload]
+    """ Opt-in selection of the fastest device for the workload profile when the Core is created by
+    :meth:`initialiseCL` (see :class:`~pyocl.selection.DeviceSelector`) """
+
+    workGroupTuner = WorkGroupTuner()
+    """ The autotuner used for selecting work group sizes with persisted results """
+
+    profiler = None  # type: Optional[Profiler]
+    """ Records the kernel launches and transfers of the simulation when set. This may be assigned on the class to
+    profile all simulations without modifying them """
+
+    snapshotWriter = None  # type: Optional[SnapshotWriter]
+    """ Copies the fields passed to :meth:`snapshot` to files without blocking when set (see :meth:`startSnapshots`) """
+
+    precision = None  # type: Optional[Precision]
+    """ The precision policy of the kernels and fields. When set, the types and macros of the policy are prepended to
+    the kernel source and the policy falls back according to the capabilities of the device in :meth:`initialiseCL` """
+
+    numTransferQueues = 1
+    """ The number of transfer queues created alongside the compute queue :attr:`queue` """
+
+    outOfOrderCompute = False
+    """ Use an out-of-order compute queue where supported by the device. Steps are always ordered by their events,
+    but any other commands enqueued on :attr:`queue` must then express their dependencies explicitly """
+
+    buildProfile = BuildProfile.DEFAULT
+    """ The compiler options used for building the kernel. See :meth:`setBuildProfile` """
+
+    checkpointAttributes = ()  # type: Tuple[str, ...]
+    """ The names of the scalar attributes (e.g. the time and time step) saved by :meth:`saveCheckpoint` """
+
+    convergenceInterval = 10
+    """ The number of steps between convergence checks when :meth:`run` is given a tolerance """
+
+    convergenceNorm = ConvergenceNorm.MAX
+    """ The measure of the change per step compared against the tolerance of :meth:`run` """
+
+    _lastEvent = None
+
     def __init__(self):
         self.ocl = None
         self.queue = None
+        self.transferQueues = []
         self.program = None
-        self.kernel = None
+        self._programKey = None  # digest of the source and options of the program for the work group tuner
+        self._kernels = {}  # type: Dict[str, cl.Kernel]
+        self._specialisation = {}  # type: Dict[str, Any]
         self._workGroupSize = (64, 1)
         self._dims = 2  # dimension of problem
-
-    def initialiseCL(self) -> None:
+        self._lastEvent = None  # event of the most recently enqueued step
+        self._transferIndex = 0  # the transfer queues are used in turn
+        self._stepDependencies = []  # type: List[List[Any]]
+        self._checkpointBuffers = {}  # type: Dict[str, Tuple[Any, Optional[Tuple[int, ...]], Optional[np.dtype]]]
+        self._checkpoint = None  # type: Optional[Checkpoint]
+        self.convergenceMonitor = None  # type: Optional[ConvergenceMonitor]
+        self.residual = None  # type: Optional[Residual]
+        self.stepsRun = 0  # the number of steps performed by the most recent run
+
+    def initialiseCL(self, ocl: Optional[Core] = None) -> None:
         """
-        Create the OpenCL context, generates the compiled kernel.
+        Create the OpenCL context, generates the compiled kernel. Unless a Core is provided, the Core is taken from the
+        shared :class:`CorePool` when :attr:`useSharedCore` is set, so that simulations on the same device share
+        one context and its compiled programs. Each simulation receives its own command queue.
+
+        :param ocl: An optional existing Core to run the simulation on
         """
 
-        self.ocl = Core()
+        if ocl is not None:
+            self.ocl = ocl
+        elif self.useSharedCore:
+            self.ocl = CorePool.get(workload=self.workload)
+        else:
+            self.ocl = Core(workload=self.workload)
+
+        # Create the compute queue and the transfer queues, which are out-of-order where supported as transfers are
+        # ordered by their events
+        self.queue = self.ocl.createQueue(self.outOfOrderCompute)
+        self.transferQueues = [self.ocl.createQueue(True) for i in range(self.numTransferQueues)]
 
-        # Create a command queue
-        self.queue = cl.CommandQueue(self.ocl.context, properties=cl.command_queue_properties.PROFILING_ENABLE)
+        if self.precision is not None:
+            self.precision = self.precision.resolve(self.ocl.device)
 
         # Compile and build the openCL program
-        buildOptions = []
+        self._buildProgram(self.kernelSource(self.kernel), self.buildOptions())
+
+    def buildOptions(self) -> List[str]:
+        """
+        Returns the compiler options used for building the kernel based on the settings of the Core
+
+        :return: The list of build options
+        """
+        return self.ocl.buildOptions(self.buildProfile)
+
+    def rebuildProgram(self) -> cl.Program:
+        """
+        Rebuilds the program with the current build options, retaining the specialisation parameters
+
+        :return: The compiled program
+        """
+        if self._specialisation:
+            return self.specialise(**self._specialisation)
+
+        self._buildProgram(self.kernelSource(self.kernel), self.buildOptions())
+
+        return self.program
+
+    def _buildProgram(self, source: str, options: List[str]) -> cl.Program:
+
+        self.program = self.ocl.buildProgram(source, options)
+        self._kernels = {}
+        self._programKey = WorkGroupTuner.programKey(source, options)
+
+        return self.program
+
+    def setBuildProfile(self, profile: BuildProfile, validate: Optional[Callable[['OpenCLSimBase'], np.ndarray]] = None,
+                        tolerance: float = 1e-4) -> Optional[ProfileValidation]:
+        """
+        Selects the build profile of the kernel and rebuilds the program.
+
+        When a validation function is given, it is run on a reference input with the program built using the
+        :attr:`BuildProfile.DEFAULT` profile and with the requested profile, and the maximum error is reported. The
+        profile is only accepted when the relative error is within the tolerance and the result is finite, otherwise
+        the previous profile is restored.
+
+        :param profile: The build profile
+        :param validate: A function running the simulation on a reference input and returning the result. This is
+                         called with the simulation and must set up any state it requires
+        :param tolerance: The maximum relative error accepted
+        :return: The result of the validation, or None if no validation function is given
+        """
+        previous = self.buildProfile
+
+        if validate is None:
+            self.buildProfile = profile
+            self.rebuildProgram()
+            return None
+
+        self.buildProfile = BuildProfile.DEFAULT
+        self.rebuildProgram()
+        reference = np.asarray(validate(self), dtype=np.float64)
+
+        self.buildProfile = profile
+        self.rebuildProgram()
+        result = np.asarray(validate(self), dtype=np.float64)
+
+        scale = float(np.max(np.abs(reference))) if reference.size else 0.0
+        maxError = float(np.max(np.abs(result - reference))) if reference.size else 0.0
+        relativeError = maxError / scale if scale > 0.0 else maxError
+
+        accepted = bool(np.all(np.isfinite(result))) and relativeError <= tolerance
+        validation = ProfileValidation(profile, maxError, relativeError, accepted)
+
+        logging.info('Build profile {:s} - max error {:.3e} (relative {:.3e})'.format(profile.name, maxError,
+                                                                                     relativeError))
+
+        if not accepted:
+            logging.warning('Build profile {:s} exceeds the tolerance ({:.3e}) - using {:s}'.format(
+                    profile.name, tolerance, previous.name))
+            self.buildProfile = previous
+            self.rebuildProgram()
+
+        return validation
+
+    @staticmethod
+    def defineOptions(params: Dict[str, Any]) -> List[str]:
+        """
+        Converts specialisation parameters into preprocessor definitions passed to the compiler. Python floats and
+        ``np.float32`` are defined as single precision literals, ``np.float64`` as double precision literals.
+
+        :param params: The specialisation parameters
+        :return: The list of build options
+        """
+        options = []
+
+        for name, value in sorted(params.items()):
+            if isinstance(value, (bool, np.bool_)):
+                literal = '1' if value else '0'
+            elif isinstance(value, (int, np.integer)):
+                literal = str(int(value))
+            elif isinstance(value, np.float64):
+                literal = repr(float(value))
+            elif isinstance(value, (float, np.floating)):
+                literal = repr(float(value)) + 'f'
+            else:
+                literal = str(value)
+
+            options.append('-D{:s}={:s}'.format(name, literal))
+
+        return options
+
+    def renderKernel(self, **params) -> str:
+        """
+        Renders the kernel source for a set of specialisation parameters. By default, the source of :attr:`kernel` is
+        used and the parameters are only provided as preprocessor definitions. Derived classes using a Mako template
+        may override this to bake the parameters into the template.
+
+        :param params: The specialisation parameters
+        :return: The rendered kernel source
+        """
+        return self.kernel
+
+    def kernelSource(self, source: str) -> str:
+        """
+        Returns the kernel source to build, with the header of the :attr:`precision` policy prepended when set
+
+        :param source: The rendered kernel source
+        :return: The kernel source
+        """
+        if self.precision is None:
+            return source
+
+        return self.precision.header() + source
+
+    @property
+    def storageType(self) -> np.dtype:
+        """
+        The NumPy type of fields stored on the device according to the :attr:`precision` policy
+        """
+        if self.precision is None:
+            return np.dtype(np.float32)
+
+        return self.precision.storageType
 
-        if self.ocl.isDebugBuild():
-            buildOptions += ['-g']
+    def real(self, value: float) -> np.floating:
+        """
+        Converts a scalar to the compute type of the :attr:`precision` policy, for passing as a ``real_t`` argument
+
+        :param value: The scalar value
+        :return: The converted scalar
+        """
+        if self.precision is None:
+            return np.float32(value)
 
-        if self.ocl.isUsingOpenCL2():
-            buildOptions += ['-cl-std=CL2.0']
+        return self.precision.real(value)
 
-        self.program = cl.Program(self.ocl.context, self.kernel).build(options=buildOptions)
+    @property
+    def specialisation(self) -> Dict[str, Any]:
+        """
+        The specialisation parameters of the current program
+        """
+        return self._specialisation
+
+    def specialise(self, **params) -> cl.Program:
+        """
+        Selects a program variant with the parameters baked in as compile-time constants. Each parameter is rendered
+        into the template via :meth:`renderKernel` and defined as a ``#define`` in the build options, allowing the
+        compiler to fold arithmetic and unroll loops. Variants (the program and the digest of its source used by
+        :attr:`workGroupTuner`) are retained in :attr:`Core.programs` by the simulation class and parameters, so
+        returning to earlier parameters does not re-render or rebuild the kernel. The kernel source must therefore only
+        depend on the class and the parameters.
+
+        :param params: The specialisation parameters (e.g. ``KAPPA1=0.1``)
+        :return: The compiled program variant
+        """
+        options = self.buildOptions() + OpenCLSimBase.defineOptions(params)
+        key = (type(self).__module__, type(self).__qualname__, self.precision, tuple(options))
+
+        variant = self.ocl.programs.get(key)
+
+        if variant is None:
+            # The variant retains the digest of the rendered source, so that tuning results are not reused after the
+            # kernel changes
+            source = self.kernelSource(self.renderKernel(**params))
+            variant = (self.ocl.buildProgram(source, options), WorkGroupTuner.programKey(source, options))
+            self.ocl.programs.put(key, variant)
+
+        program, self._programKey = variant
+
+        self.program = program
+        self._kernels = {}
+        self._specialisation = dict(params)
+
+        return program
 
     #        try:
     #            self.program = cl.Program(self.ocl.context, self.kernel).build()
@@ -49,6 +330,543 @@ class OpenCLSimBase(abc.ABC):
     #            print(self.program.get_build_info(self.ocl.device, cl.program_build_info.ERROR))
     #            raise
 
+    def getKernel(self, name: str) -> cl.Kernel:
+        """
+        Returns a kernel from the compiled program. Kernel instances are retained by the simulation, avoiding the
+        expense of creating a new kernel object on each launch.
+
+        When a :attr:`profiler` is set, the kernel is wrapped so that each launch is recorded.
+
+        :param name: The name of the kernel
+        :return: The OpenCL kernel
+        """
+        kernel = self._getKernel(name)
+
+        if self.profiler is not None:
+            return ProfiledKernel(kernel, self.profiler)
+
+        return kernel
+
+    def _getKernel(self, name: str) -> cl.Kernel:
+
+        kernel = self._kernels.get(name)
+
+        if kernel is None:
+            kernel = self._kernels[name] = cl.Kernel(self.program, name)
+
+        return kernel
+
+    def enqueueCopy(self, dest: Any, src: Any, **kwargs) -> cl.Event:
+        """
+        Enqueues a copy between host arrays and device memory objects on the simulation queue. This is a
+        thin wrapper around :func:`pyopencl.enqueue_copy` which records the transfer when a :attr:`profiler` is set.
+
+        :param dest: The destination host array or memory object
+        :param src: The source host array or memory object
+        :param kwargs: Additional arguments passed to :func:`pyopencl.enqueue_copy`
+        :return: The event for the transfer
+        """
+        ev = cl.enqueue_copy(self.queue, dest, src, **kwargs)
+
+        if self.profiler is not None:
+            self.profiler.recordTransfer(ev, dest, src)
+
+        return ev
+
+    @property
+    def transferQueue(self) -> cl.CommandQueue:
+        """
+        The transfer queue used by the next call to :meth:`enqueueTransfer`. Transfer queues are used in turn.
+        """
+        if not self.transferQueues:
+            return self.queue
+
+        return self.transferQueues[self._transferIndex % len(self.transferQueues)]
+
+    def enqueueTransfer(self, dest: Any, src: Any, waitFor: Optional[List[cl.Event]] = None,
+                        stepDelay: Optional[int] = None, **kwargs) -> cl.Event:
+        """
+        Enqueues a non-blocking copy on a transfer queue, so that it may overlap with the steps on the compute queue.
+        The copy waits for the most recently enqueued step and any additional events.
+
+        :param dest: The destination host array or memory object
+        :param src: The source host array or memory object
+        :param waitFor: Additional events which must complete before the copy
+        :param stepDelay: The number of steps enqueued before a step that must wait for the copy, e.g. 0 for a copy
+                          read by the next step. If None, no step depends on the copy
+        :param kwargs: Additional arguments passed to :func:`pyopencl.enqueue_copy`
+        :return: The event of the copy
+        """
+        queue = self.transferQueue
+        self._transferIndex += 1
+
+        events = [self._lastEvent] if self._lastEvent is not None else []
+        events += list(waitFor) if waitFor else []
+
+        # The step must be submitted before the transfer queue waits on it, and the transfer before a step waits on it
+        if self._lastEvent is not None:
+            self.queue.flush()
+
+        ev = cl.enqueue_copy(queue, dest, src, is_blocking=False, wait_for=events if events else None, **kwargs)
+        queue.flush()
+
+        if self.profiler is not None:
+            self.profiler.recordTransfer(ev, dest, src)
+
+        if stepDelay is not None:
+            self.addStepDependency(ev, stepDelay)
+
+        return ev
+
+    def enqueueUpload(self, buffer: cl.MemoryObjectHolder, data: np.ndarray,
+                      waitFor: Optional[List[cl.Event]] = None, **kwargs) -> cl.Event:
+        """
+        Enqueues an upload of host data on a transfer queue, which the next step waits for. The host array must not
+        be modified until the upload has completed.
+
+        :param buffer: The device buffer
+        :param data: The host array
+        :param waitFor: Additional events which must complete before the upload
+        :param kwargs: Additional arguments passed to :func:`pyopencl.enqueue_copy`
+        :return: The event of the upload
+        """
+        return self.enqueueTransfer(buffer, data, waitFor, stepDelay=0, **kwargs)
+
+    def enqueueDownload(self, out: np.ndarray, buffer: cl.MemoryObjectHolder,
+                        waitFor: Optional[List[cl.Event]] = None, stepDelay: int = 1, **kwargs) -> cl.Event:
+        """
+        Enqueues a download of a field produced by the most recent step on a transfer queue, so that the download
+        overlaps with the compute of the following step. In a ping-pong scheme, the field is overwritten by the step
+        after next, which waits for the download by default.
+
+        :param out: The host array to copy into
+        :param buffer: The device buffer holding the field
+        :param waitFor: Additional events which must complete before the download
+        :param stepDelay: The number of steps enqueued before the step that overwrites the buffer
+        :param kwargs: Additional arguments passed to :func:`pyopencl.enqueue_copy`
+        :return: The event of the download. The host array is valid once it has completed
+        """
+        return self.enqueueTransfer(out, buffer, waitFor, stepDelay=stepDelay, **kwargs)
+
+    def createDoubleBuffer(self, shape: Tuple[int, ...], dtype=None,
+                           hostbuf: Optional[np.ndarray] = None) -> DoubleBuffer:
+        """
+        Creates a ping-pong field allocated from the memory pool of the Core. Released fields return their buffers to
+        the pool for reuse by subsequent fields of the same size.
+
+        :param shape: The shape of the field
+        :param dtype: The data type of the field. By default the :attr:`storageType` of the precision policy is used
+        :param hostbuf: Optional initial data uploaded to the front buffer, which is converted to the data type
+        :return: The field
+        """
+        dtype = np.dtype(dtype) if dtype is not None else self.storageType
+
+        flags = cl.mem_flags.READ_WRITE
+
+        # Allocate in host accessible memory to allow zero-copy mapping on shared memory devices
+        if self.ocl.hasSharedMemory():
+            flags |= cl.mem_flags.ALLOC_HOST_PTR
+
+        field = DoubleBuffer(self.ocl.memoryPool, shape, dtype, flags)
+
+        if hostbuf is not None:
+            field.upload(self.queue, np.ascontiguousarray(hostbuf, dtype=dtype))
+
+        return field
+
+    def createEnsemble(self, members: int, shape: Tuple[int, ...], dtype=None,
+                       hostbuf: Optional[np.ndarray] = None) -> Ensemble:
+        """
+        Creates a batch of same-shaped fields advanced together by a single launch per step, allocated from the memory
+        pool of the Core. See :class:`~pyocl.ensemble.Ensemble`.
+
+        :param members: The number of members
+        :param shape: The shape of the field of each member
+        :param dtype: The data type of the fields. By default the :attr:`storageType` is used
+        :param hostbuf: Optional initial data of shape ``(members,) + shape`` uploaded to the fields
+        :return: The ensemble
+        """
+        dtype = np.dtype(dtype) if dtype is not None else self.storageType
+
+        ensemble = Ensemble(self.ocl.memoryPool, members, shape, dtype)
+
+        if hostbuf is not None:
+            ensemble.upload(self.queue, np.ascontiguousarray(hostbuf, dtype=dtype))
+
+        return ensemble
+
+    def createImageField(self, shape: Tuple[int, ...], dtype=None,
+                         hostbuf: Optional[np.ndarray] = None) -> ImageField:
+        """
+        Creates a ping-pong field stored as 2D or 3D image objects, which are read in kernels through a sampler. This
+        is an alternative storage to :meth:`createDoubleBuffer` for devices with texture caches. See
+        :class:`~pyocl.image.ImageField`.
+
+        :param shape: The shape of the field
+        :param dtype: The data type of the field (float32 or float16). By default the :attr:`storageType` is used
+        :param hostbuf: Optional initial data uploaded to the front image, which is converted to the data type
+        :return: The field
+        """
+        dtype = np.dtype(dtype) if dtype is not None else self.storageType
+
+        field = ImageField(self.ocl.context, shape, dtype)
+
+        if hostbuf is not None:
+            field.upload(self.queue, np.ascontiguousarray(hostbuf, dtype=dtype))
+
+        return field
+
+    def createTiledExecutor(self, shape: Tuple[int, ...], halo: int = 1, dtype=np.float32,
+                            tileRows: Optional[int] = None) -> TiledExecutor:
+        """
+        Creates an out-of-core executor for fields which do not fit in the device memory. The field is kept on the
+        host and streamed through the device in tiles. See :class:`~pyocl.tiling.TiledExecutor`.
+
+        :param shape: The shape of the field
+        :param halo: The number of halo rows required by the stencil
+        :param dtype: The data type of the field
+        :param tileRows: The number of rows per tile. By default this is derived from the device memory
+        :return: The tiled executor
+        """
+        return TiledExecutor(self.ocl.context, self.ocl.device, shape, halo, dtype, tileRows,
+                             pool=self.ocl.memoryPool)
+
+    def mapBuffer(self, buffer: cl.Buffer, shape: Tuple[int, ...], dtype=np.float32,
+                  flags: int = cl.map_flags.READ | cl.map_flags.WRITE):
+        """
+        Maps a device buffer to a NumPy view on the simulation queue for use in a ``with`` statement. The view is
+        zero-copy on devices sharing memory with the host. See :func:`~pyocl.memory.mapBuffer`.
+
+        :param buffer: The device buffer to map
+        :param shape: The shape of the view
+        :param dtype: The data type of the view
+        :param flags: The OpenCL map flags
+        :return: The context manager providing the NumPy view
+        """
+        return mapBuffer(self.queue, buffer, shape, dtype, flags, [self._lastEvent] if self._lastEvent else None)
+
+    def enqueueStep(self, waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Enqueues a single simulation step on the command queue without blocking the host. Derived classes should
+        override this to launch their kernel(s) and swap any ping-pong buffers. The swap only exchanges the buffer
+        references, so is safe to perform before the kernel has completed.
+
+        :param waitFor: Events which must complete before the step is executed
+        :return: The event of the final command enqueued for the step
+        """
+        raise NotImplementedError('enqueueStep must be implemented by the derived simulation class')
+
+    def enqueueResidual(self, waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Enqueues the device-side reduction of the change of the field over the most recently enqueued step. Derived
+        classes supporting :meth:`run` with a tolerance should override this, typically with
+        :meth:`ConvergenceMonitor.enqueue` on the current and previous ping-pong buffers of the field.
+
+        :param waitFor: Events which must complete before the reduction
+        :return: The event of the reduction
+        """
+        raise NotImplementedError('enqueueResidual must be implemented by the derived simulation class')
+
+    def enqueueStepWithResidual(self, waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Enqueues a single step followed by the reduction of its change into :attr:`convergenceMonitor`. Derived classes
+        may override this to fuse the first stage of the reduction into the step kernel (see
+        :class:`~pyocl.stencil.ConvergentHeatStencil2D`).
+
+        :param waitFor: Events which must complete before the step is executed
+        :return: The event of the reduction
+        """
+        ev = self.enqueueStep(waitFor)
+
+        return self.enqueueResidual([ev])
+
+    def createConvergenceMonitor(self, dtype=None) -> ConvergenceMonitor:
+        """
+        Creates the device-side reduction used by :meth:`run` to detect convergence and assigns it to
+        :attr:`convergenceMonitor`
+
+        :param dtype: The data type of the field. By default the :attr:`storageType` is used
+        :return: The convergence monitor
+        """
+        dtype = np.dtype(dtype) if dtype is not None else self.storageType
+
+        if self.convergenceMonitor is not None:
+            self.convergenceMonitor.release([self._lastEvent] if self._lastEvent is not None else None)
+
+        self.convergenceMonitor = ConvergenceMonitor(self.ocl, dtype)
+
+        return self.convergenceMonitor
+
+    def advanceAsync(self, steps: int = 1, residual: bool = False) -> Optional[cl.Event]:
+        """
+        Enqueues a batch of simulation steps, each dependent on the event of the previous step, without any host
+        synchronisation between the steps.
+
+        :param steps: The number of steps to enqueue
+        :param residual: Reduce the change of the final step using :meth:`enqueueStepWithResidual`
+        :return: An event which completes once all the steps in the batch have completed
+        """
+        ev = self._lastEvent
+
+        for i in range(steps):
+            waitFor = [ev] if ev is not None else []
+
+            if self._stepDependencies:
+                waitFor += self._popStepDependencies()
+
+            if residual and i == steps - 1:
+                ev = self.enqueueStepWithResidual(waitFor if waitFor else None)
+            else:
+                ev = self.enqueueStep(waitFor if waitFor else None)
+
+        self._lastEvent = ev
+
+        return ev
+
+    def addStepDependency(self, event: cl.Event, delay: int = 0) -> None:
+        """
+        Requires an event (e.g. a transfer on another queue) to complete before a subsequently enqueued step
+
+        :param event: The event to depend on
+        :param delay: The number of steps enqueued before the dependent step. Zero applies to the next step
+        """
+        self._stepDependencies.append([delay, event])
+
+    def _popStepDependencies(self) -> List[cl.Event]:
+
+        events = []
+        remaining = []
+
+        for dependency in self._stepDependencies:
+            if dependency[0] <= 0:
+                events.append(dependency[1])
+            else:
+                dependency[0] -= 1
+                remaining.append(dependency)
+
+        self._stepDependencies = remaining
+
+        return events
+
+    def startSnapshots(self, directory: str, shape: Tuple[int, ...], dtype=np.float32,
+                       ringSize: int = 3) -> SnapshotWriter:
+        """
+        Starts a pipelined snapshot writer, which copies fields to a ring of pinned host buffers on a separate queue
+        and writes them to memory-mapped ``.npy`` files in a background thread
+
+        :param directory: The directory to write the snapshots to
+        :param shape: The shape of the field
+        :param dtype: The data type of the field
+        :param ringSize: The number of pinned host buffers
+        :return: The snapshot writer
+        """
+        self.stopSnapshots()
+        self.snapshotWriter = SnapshotWriter(self.ocl.context, self.ocl.device, shape, directory, dtype, ringSize)
+
+        return self.snapshotWriter
+
+    def snapshot(self, buffer: cl.Buffer, filename: Optional[str] = None) -> cl.Event:
+        """
+        Captures a snapshot of a field after the most recently enqueued step without blocking. The step after next,
+        which overwrites the buffer in a ping-pong scheme, waits for the copy to complete.
+
+        :param buffer: The device buffer holding the current field
+        :param filename: Optional filename for the snapshot
+        :return: The event of the copy
+        """
+        if self.snapshotWriter is None:
+            raise RuntimeError('Snapshots have not been started')
+
+        # The step must be submitted before the queue of the snapshot writer waits on it
+        if self._lastEvent is not None:
+            self.queue.flush()
+
+        ev = self.snapshotWriter.capture(buffer, [self._lastEvent] if self._lastEvent else None, filename)
+        self.addStepDependency(ev, 1)
+
+        return ev
+
+    def stopSnapshots(self) -> None:
+        """
+        Writes the outstanding snapshots and stops the snapshot writer
+        """
+        if self.snapshotWriter is not None:
+            self.snapshotWriter.close()
+            self.snapshotWriter = None
+
+    def registerCheckpointBuffer(self, name: str,
+                                 buffer: Union[DoubleBuffer, Ensemble, cl.Buffer, Callable[[], cl.Buffer]],
+                                 shape: Optional[Tuple[int, ...]] = None, dtype=None) -> None:
+        """
+        Registers a device field to be saved by :meth:`saveCheckpoint` and restored by :meth:`restoreCheckpoint`. Only
+        the front buffer of a :class:`DoubleBuffer` or :class:`Ensemble` is saved. Raw buffers which are exchanged
+        between steps should be registered as a function returning the current buffer (e.g. ``lambda: self.u0``).
+
+        :param name: The name of the field in the checkpoint
+        :param buffer: The field, buffer or function returning the buffer
+        :param shape: The shape of a raw buffer
+        :param dtype: The data type of a raw buffer. By default the :attr:`storageType` is used
+        """
+        if not isinstance(buffer, (DoubleBuffer, Ensemble)):
+            if shape is None:
+                raise ValueError('The shape of a raw buffer must be specified')
+
+            dtype = np.dtype(dtype) if dtype is not None else self.storageType
+
+        self._checkpointBuffers[name] = (buffer, shape, dtype)
+
+    def _checkpointField(self, name: str) -> Tuple[cl.Buffer, Tuple[int, ...], np.dtype]:
+
+        buffer, shape, dtype = self._checkpointBuffers[name]
+
+        if isinstance(buffer, DoubleBuffer):
+            return buffer.front, buffer.shape, buffer.dtype
+
+        if isinstance(buffer, Ensemble):
+            return buffer.front, (buffer.members,) + buffer.shape, buffer.dtype
+
+        if callable(buffer):
+            buffer = buffer()
+
+        return buffer, tuple(shape), dtype
+
+    def checkpointState(self) -> Dict[str, Any]:
+        """
+        Returns the scalar state saved in a checkpoint. Derived classes may extend this with state which is not
+        listed in :attr:`checkpointAttributes`.
+
+        :return: The scalar state
+        """
+        return {'attributes': {name: getattr(self, name) for name in self.checkpointAttributes},
+                'specialisation': self.specialisation}
+
+    def restoreCheckpointState(self, state: Dict[str, Any]) -> None:
+        """
+        Restores the scalar state saved by :meth:`checkpointState`. The program is re-specialised if the saved
+        specialisation differs.
+
+        :param state: The scalar state
+        """
+        for name, value in state.get('attributes', {}).items():
+            setattr(self, name, value)
+
+        specialisation = state.get('specialisation', {})
+
+        if specialisation != self.specialisation:
+            self.specialise(**specialisation)
+
+    def saveCheckpoint(self, directory: str, incremental: bool = True, tileBytes: int = 1 << 20) -> int:
+        """
+        Saves the registered fields and the scalar state after the most recently enqueued step to a checkpoint. The
+        fields are mapped (zero-copy on devices sharing memory with the host) and only the tiles which have changed
+        are written to the memory-mapped files. See :class:`~pyocl.checkpoint.Checkpoint`.
+
+        :param directory: The directory of the checkpoint
+        :param incremental: Only write the tiles which have changed
+        :param tileBytes: The size of the tiles of a new checkpoint [bytes]
+        :return: The number of bytes of field data written
+        """
+        if self._checkpoint is None or self._checkpoint.directory != directory:
+            self._checkpoint = Checkpoint(directory, tileBytes)
+
+        with ExitStack() as stack:
+            arrays = {}
+
+            for name in self._checkpointBuffers:
+                buffer, shape, dtype = self._checkpointField(name)
+                arrays[name] = stack.enter_context(self.mapBuffer(buffer, shape, dtype, cl.map_flags.READ))
+
+            return self._checkpoint.write(arrays, self.checkpointState(), incremental)
+
+    def restoreCheckpoint(self, directory: str) -> Checkpoint:
+        """
+        Restores the registered fields and the scalar state from a checkpoint. The fields are copied to the device
+        directly from the memory-mapped files. The fields must be registered with the same names, shapes and types
+        as when the checkpoint was saved.
+
+        :param directory: The directory of the checkpoint
+        :return: The checkpoint
+        """
+        checkpoint = Checkpoint(directory)
+
+        if not checkpoint.exists:
+            raise RuntimeError('No checkpoint has been written to <{:s}>'.format(directory))
+
+        missing = set(checkpoint.names) - set(self._checkpointBuffers)
+
+        if missing:
+            raise ValueError('Fields {:s} are not registered'.format(', '.join(sorted(missing))))
+
+        self.synchronise()
+
+        for name in checkpoint.names:
+            buffer, shape, dtype = self._checkpointField(name)
+
+            if checkpoint.arrayInfo(name) != (tuple(shape), np.dtype(dtype)):
+                raise ValueError('Field <{:s}> does not match the shape and type of the checkpoint'.format(name))
+
+            cl.enqueue_copy(self.queue, buffer, checkpoint.array(name), is_blocking=True)
+
+        self.restoreCheckpointState(checkpoint.state)
+        self._checkpoint = checkpoint
+
+        return checkpoint
+
+    def run(self, steps: int, blocking: bool = True, tolerance: Optional[float] = None) -> Optional[cl.Event]:
+        """
+        Advances the simulation by a number of steps using :meth:`advanceAsync`.
+
+        When a tolerance is given, the change of the field is reduced on the device every :attr:`convergenceInterval`
+        steps and only the resulting scalars are read back. The run stops early once the change of a step measured by
+        :attr:`convergenceNorm` is within the tolerance. The latest change is stored in :attr:`residual` and the number
+        of steps performed in :attr:`stepsRun`. A :attr:`convergenceMonitor` is created if required.
+
+        :param steps: The maximum number of steps to perform
+        :param blocking: Wait for the batch of steps to complete before returning. Runs with a tolerance always block.
+        :param tolerance: Stop once the change of a step is within the tolerance
+        :return: The event for the batch of steps
+        """
+        if tolerance is None:
+            ev = self.advanceAsync(steps)
+            self.stepsRun = steps
+
+            if blocking and ev is not None:
+                ev.wait()
+
+            return ev
+
+        if self.convergenceMonitor is None:
+            self.createConvergenceMonitor()
+
+        ev = self._lastEvent
+        self.stepsRun = 0
+
+        while self.stepsRun < steps:
+            batch = min(self.convergenceInterval, steps - self.stepsRun)
+
+            ev = self.advanceAsync(batch, residual=True)
+            self.stepsRun += batch
+
+            # Only the reduced scalars are transferred, which synchronises the host with the batch of steps
+            self.residual = self.convergenceMonitor.read(self.queue, [ev])
+
+            if self.residual.norm(self.convergenceNorm) <= tolerance:
+                logging.debug('Converged after {:d} steps ({:s})'.format(self.stepsRun, str(self.residual)))
+                break
+
+        return ev
+
+    def synchronise(self) -> None:
+        """
+        Blocks until all the commands enqueued by the simulation have completed
+        """
+        if self.queue is not None:
+            self.queue.finish()
+
+        for queue in self.transferQueues:
+            queue.finish()
+
+        self._lastEvent = None
 
     @property
     def dimensions(self) -> int:
@@ -95,10 +913,55 @@ class OpenCLSimBase(abc.ABC):
         :param wgSize: The work group size
         """
         if isinstance(wgSize,int):
-            wgSize = tuple(wgSize)
+            wgSize = (wgSize,)
 
         self._workGroupSize = wgSize
 
+    def autotuneWorkGroupSize(self, kernelName: str, globalSize: Tuple[int, ...], args: Any,
+                              force: bool = False) -> Tuple[int, ...]:
+        """
+        Selects the fastest work group size for a kernel by timing candidate sizes on the actual problem shape using
+        :attr:`workGroupTuner`. The result is persisted per kernel, program variant, device and global size and is
+        assigned to :attr:`workGroupSize`.
+
+        :param kernelName: The name of the kernel in the compiled program
+        :param globalSize: The global size of the kernel launch
+        :param args: The kernel arguments, or a function returning the arguments for a given work group size
+        :param force: Re-tune even if a persisted result is available
+        :return: The tuned work group size
+        """
+        if not self.isKernelAvailable():
+            raise RuntimeError('The OpenCL program has not been compiled')
+
+        kernel = self._getKernel(kernelName)
+        self.workGroupSize = self.workGroupTuner.tune(self.queue, kernel, globalSize, args, force=force,
+                                                      programKey=self._programKey)
+
+        return self.workGroupSize
+
+
+    def planLaunch(self, kernelName: str, extents: Tuple[int, ...], halo: int = 1, dtype=np.float32,
+                   vectorWidth: int = 1, localSize: Optional[Tuple[int, ...]] = None) -> LaunchPlan:
+        """
+        Plans the launch of a kernel caching a local memory tile with a halo. The local tile allocation is derived from
+        the work group size, halo width, element type and vector width, and the global range is padded to a multiple
+        of the work group size. The real extents of the domain must be passed to the kernel. See
+        :class:`~pyocl.launch.LaunchPlanner`.
+
+        :param kernelName: The name of the kernel in the compiled program
+        :param extents: The real extents of the domain
+        :param halo: The halo width of the stencil
+        :param dtype: The element type of the tile
+        :param vectorWidth: The vector width used for loading along the first dimension
+        :param localSize: The work group size. By default :attr:`workGroupSize` is used
+        :return: The launch plan
+        """
+        if not self.isKernelAvailable():
+            raise RuntimeError('The OpenCL program has not been compiled')
+
+        planner = LaunchPlanner(self.ocl.device, self._getKernel(kernelName))
+
+        return planner.plan(extents, localSize if localSize else self.workGroupSize, halo, dtype, vectorWidth)
 
     def getLocalMemorySize(self) -> int:
         """
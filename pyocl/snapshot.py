@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import os
+import queue
+import threading
+from typing import List, Optional, Tuple
+import logging
+
+import numpy as np
+import pyopencl as cl
+
+
+class SnapshotWriter:
+    """
+    Pipelined download of field snapshots to disk.
+
+    A small ring of pinned host buffers (allocated with ``ALLOC_HOST_PTR`` and mapped once) receives non-blocking copies
+    of the device field on a dedicated transfer queue, so the device can continue with the next steps while the copy is
+    in flight. A background thread waits for each copy to complete and writes the snapshot to a memory-mapped ``.npy``
+    file before returning the host buffer to the ring. When all the host buffers are in use, :meth:`capture` blocks
+    until one becomes available.
+    """
+
+    def __init__(self, context: cl.Context, device: cl.Device, shape: Tuple[int, ...], directory: str,
+                 dtype=np.float32, ringSize: int = 3, filenameFormat: str = 'snapshot_{:06d}.npy') -> None:
+
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+        self._directory = directory
+        self._filenameFormat = filenameFormat
+        self._count = 0
+        self._error = None  # type: Optional[BaseException]
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = cl.CommandQueue(context, device)
+
+        nbytes = int(np.prod(self._shape)) * self._dtype.itemsize
+        flags = cl.mem_flags.READ_WRITE | cl.mem_flags.ALLOC_HOST_PTR
+
+        # Pinned host buffers are mapped for the lifetime of the writer and used as the destination of the copies
+        self._pinned = []  # type: List[cl.Buffer]
+        self._hostArrays = []  # type: List[np.ndarray]
+
+        for i in range(ringSize):
+            buffer = cl.Buffer(context, flags, nbytes)
+            array, ev = cl.enqueue_map_buffer(self._queue, buffer, cl.map_flags.READ | cl.map_flags.WRITE, 0,
+                                              self._shape, self._dtype, is_blocking=True)
+            self._pinned.append(buffer)
+            self._hostArrays.append(array)
+
+        self._freeSlots = queue.Queue()  # type: queue.Queue
+        for i in range(ringSize):
+            self._freeSlots.put(i)
+
+        self._pending = queue.Queue()  # type: queue.Queue
+        self._thread = threading.Thread(target=self._write, name='pyocl-snapshot-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def directory(self) -> str:
+        """
+        The directory snapshots are written to
+        """
+        return self._directory
+
+    @property
+    def count(self) -> int:
+        """
+        The number of snapshots captured
+        """
+        return self._count
+
+    def capture(self, buffer: cl.Buffer, waitFor: Optional[List[cl.Event]] = None,
+                filename: Optional[str] = None) -> cl.Event:
+        """
+        Enqueues a non-blocking copy of a device buffer into the ring, to be written to disk in the background
+
+        :param buffer: The device buffer holding the field
+        :param waitFor: Events which must complete before the copy (e.g. the step producing the field). The queues of
+                        the events must have been flushed
+        :param filename: The filename of the snapshot within :attr:`directory`. By default the filename format is used
+        :return: The event of the copy. The buffer must not be overwritten until this has completed
+        """
+        self._raiseError()
+
+        if filename is None:
+            filename = self._filenameFormat.format(self._count)
+
+        slot = self._freeSlots.get()
+
+        ev = cl.enqueue_copy(self._queue, self._hostArrays[slot], buffer, is_blocking=False, wait_for=waitFor)
+        self._queue.flush()
+
+        self._pending.put((slot, ev, os.path.join(self._directory, filename)))
+        self._count += 1
+
+        return ev
+
+    def _write(self) -> None:
+
+        while True:
+            item = self._pending.get()
+
+            if item is None:
+                self._pending.task_done()
+                break
+
+            slot, ev, path = item
+
+            try:
+                ev.wait()
+
+                snapshot = np.lib.format.open_memmap(path, mode='w+', dtype=self._dtype, shape=self._shape)
+                snapshot[...] = self._hostArrays[slot]
+                snapshot.flush()
+                del snapshot
+
+            except BaseException as e:
+                logging.error('Unable to write snapshot <{:s}> ({:s})'.format(path, str(e)))
+                self._error = e
+
+            finally:
+                self._freeSlots.put(slot)
+                self._pending.task_done()
+
+    def _raiseError(self) -> None:
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('Snapshot writer failed') from error
+
+    def flush(self) -> None:
+        """
+        Blocks until all the captured snapshots have been written to disk
+        """
+        self._pending.join()
+        self._raiseError()
+
+    def close(self) -> None:
+        """
+        Writes the outstanding snapshots, stops the background thread and releases the pinned host buffers
+        """
+        if self._thread is None:
+            return
+
+        self._pending.put(None)
+        self._thread.join()
+        self._thread = None
+
+        for array in self._hostArrays:
+            array.base.release(self._queue)
+
+        self._queue.finish()
+        self._hostArrays = []
+        self._pinned = []
+
+        self._raiseError()
+
+    def __enter__(self) -> 'SnapshotWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+from typing import List, Optional, Tuple
+import logging
+
+import numpy as np
+import pyopencl as cl
+
+from .core import Core
+from .memory import DoubleBuffer
+from .image import ImageField, clampSampler
+from .ensemble import Ensemble
+from .convergence import ConvergenceMonitor
+from .paths import KERNEL_DIR, loadKernelSource
+
+
+class TemporalHeatStencil2D:
+    """
+    Temporally blocked driver for the explicit 2D heat equation.
+
+    Each launch of the ``heat_eq_2D_temporal`` kernel advances the field by several timesteps inside local memory,
+    using a halo widened by one cell per fused timestep. Fusing K timesteps reduces the global memory traffic of this
+    bandwidth-bound stencil by roughly a factor of K, at the cost of redundant computation in the halo. The local tile
+    size is limited by :attr:`Core.localMemorySize` and the maximum work group size, and the number of fused timesteps
+    is chosen at launch time for the tile size available.
+
+    The field layout matches ``heat_eq_2D``, where the cell ``(i, j)`` is stored at ``j * nx + i``.
+    """
+
+    KERNEL_NAME = 'heat_eq_2D_temporal'
+
+    def __init__(self, ocl: Core, nx: int, ny: int, localSize: Optional[Tuple[int, int]] = None,
+                 steps: Optional[int] = None, minEfficiency: float = 0.5) -> None:
+
+        self._ocl = ocl
+        self._nx = nx
+        self._ny = ny
+
+        self._program = ocl.buildProgram(loadKernelSource('heat_eq_2D_temporal.cl'))
+        self._kernel = cl.Kernel(self._program, TemporalHeatStencil2D.KERNEL_NAME)
+
+        if localSize is None:
+            localSize = self.chooseLocalSize()
+
+        self._localSize = tuple(localSize)
+        self._steps = steps if steps else TemporalHeatStencil2D.chooseSteps(self._localSize, minEfficiency)
+
+        logging.debug('Temporal blocking - local size {:s}, {:d} steps per launch'.format(str(self._localSize),
+                                                                                       self._steps))
+
+    @property
+    def localSize(self) -> Tuple[int, int]:
+        """
+        The local work group size, which is also the size of the local memory tile including the halo
+        """
+        return self._localSize
+
+    @property
+    def steps(self) -> int:
+        """
+        The maximum number of timesteps fused into a single launch
+        """
+        return self._steps
+
+    def chooseLocalSize(self) -> Tuple[int, int]:
+        """
+        Chooses the largest square tile that fits within the local memory and the work group limits of the device
+
+        :return: The local work group size
+        """
+        device = self._ocl.device
+
+        maxItems = min(self._ocl.maxWorkGroupSize,
+                       self._kernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE, device),
+                       self._ocl.localMemorySize // np.dtype(np.float32).itemsize)
+
+        size = 1 << (int(np.sqrt(maxItems)).bit_length() - 1)
+        size = min(size, device.max_work_item_sizes[0], device.max_work_item_sizes[1])
+
+        return size, size
+
+    @staticmethod
+    def efficiency(localSize: Tuple[int, int], steps: int) -> float:
+        """
+        Returns the fraction of the tile producing valid output after fusing a number of timesteps
+
+        :param localSize: The local work group size
+        :param steps: The number of fused timesteps
+        :return: The fraction of useful work
+        """
+        outX = localSize[0] - 2 * steps
+        outY = localSize[1] - 2 * steps
+
+        if outX <= 0 or outY <= 0:
+            return 0.0
+
+        return outX * outY / float(localSize[0] * localSize[1])
+
+    @staticmethod
+    def chooseSteps(localSize: Tuple[int, int], minEfficiency: float = 0.5) -> int:
+        """
+        Chooses the largest number of fused timesteps for which the fraction of useful work in the tile remains above
+        a threshold
+
+        :param localSize: The local work group size
+        :param minEfficiency: The minimum fraction of useful work
+        :return: The number of fused timesteps
+        """
+        steps = 1
+
+        while TemporalHeatStencil2D.efficiency(localSize, steps + 1) >= minEfficiency:
+            steps += 1
+
+        return steps
+
+    def globalSize(self, steps: int) -> Tuple[int, int]:
+        """
+        Returns the global size required to cover the domain when fusing a number of timesteps
+
+        :param steps: The number of fused timesteps
+        :return: The global size of the launch
+        """
+        outX = self._localSize[0] - 2 * steps
+        outY = self._localSize[1] - 2 * steps
+
+        return (-(-self._nx // outX) * self._localSize[0],
+                -(-self._ny // outY) * self._localSize[1])
+
+    def enqueue(self, queue: cl.CommandQueue, u1: cl.Buffer, u0: cl.Buffer, kappa1: float, kappa2: float,
+                steps: int, waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Enqueues a single launch advancing the field from `u0` into `u1` by a number of timesteps
+
+        :param queue: The command queue
+        :param u1: The output buffer
+        :param u0: The input buffer
+        :param kappa1: The diffusion number in the x direction (alpha * dt / dx^2)
+        :param kappa2: The diffusion number in the y direction (alpha * dt / dy^2)
+        :param steps: The number of timesteps, which must not exceed :attr:`steps`
+        :param waitFor: Events which must complete before the launch
+        :return: The event of the launch
+        """
+        if steps < 1 or TemporalHeatStencil2D.efficiency(self._localSize, steps) <= 0.0:
+            raise ValueError('Invalid number of fused timesteps ({:d})'.format(steps))
+
+        localMemory = cl.LocalMemory(self._localSize[0] * self._localSize[1] * np.dtype(np.float32).itemsize)
+
+        return self._kernel(queue, self.globalSize(steps), self._localSize,
+                            u1, u0, localMemory, np.float32(kappa1), np.float32(kappa2),
+                            np.int32(self._nx), np.int32(self._ny), np.int32(steps), wait_for=waitFor)
+
+    def advance(self, queue: cl.CommandQueue, field: DoubleBuffer, steps: int, kappa1: float, kappa2: float,
+                waitFor: Optional[List[cl.Event]] = None) -> Optional[cl.Event]:
+        """
+        Advances a ping-pong field by a number of timesteps, using launches of at most :attr:`steps` fused timesteps.
+        The field is swapped after each launch, so the result is in ``field.front``.
+
+        :param queue: The command queue
+        :param field: The field
+        :param steps: The total number of timesteps
+        :param kappa1: The diffusion number in the x direction (alpha * dt / dx^2)
+        :param kappa2: The diffusion number in the y direction (alpha * dt / dy^2)
+        :param waitFor: Events which must complete before the first launch
+        :return: The event of the final launch
+        """
+        ev = None
+
+        while steps > 0:
+            fused = min(steps, self._steps)
+            ev = self.enqueue(queue, field.back, field.front, kappa1, kappa2, fused,
+                              [ev] if ev is not None else waitFor)
+            field.swap()
+            steps -= fused
+
+        return ev
+
+
+class ImageHeatStencil:
+    """
+    Driver for the explicit 2D or 3D heat equation on image-backed fields.
+
+    The ``heat_eq_2D_image`` and ``heat_eq_3D_image`` kernels read the field through a clamp-to-edge sampler, which
+    imposes a zero-gradient boundary condition without explicit boundary branches, and rely on the texture cache of
+    the device rather than local memory tiling. See :class:`~pyocl.image.ImageField`.
+    """
+
+    def __init__(self, ocl: Core, dims: int = 2) -> None:
+
+        if dims not in (2, 3):
+            raise ValueError('Image stencils must be 2D or 3D')
+
+        self._dims = dims
+        self._program = ocl.buildProgram(loadKernelSource('heat_eq_image.cl'))
+        self._kernel = cl.Kernel(self._program, 'heat_eq_{:d}D_image'.format(dims))
+        self._sampler = clampSampler(ocl.context)
+
+    @property
+    def sampler(self) -> cl.Sampler:
+        """
+        The clamp-to-edge sampler used to read the field
+        """
+        return self._sampler
+
+    def enqueue(self, queue: cl.CommandQueue, field: ImageField, kappa: Tuple[float, ...],
+                waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Enqueues a single timestep reading ``field.front`` and writing ``field.back``. The field is not swapped.
+
+        :param queue: The command queue
+        :param field: The image field
+        :param kappa: The diffusion numbers (alpha * dt / dx^2) along the x, y (and z) directions
+        :param waitFor: Events which must complete before the launch
+        :return: The event of the launch
+        """
+        if len(field.shape) != self._dims or len(kappa) != self._dims:
+            raise ValueError('The field and diffusion numbers must be {:d}D'.format(self._dims))
+
+        return self._kernel(queue, field.region, None, field.front, field.back, self._sampler,
+                            *[np.float32(k) for k in kappa], wait_for=waitFor)
+
+    def advance(self, queue: cl.CommandQueue, field: ImageField, steps: int, kappa: Tuple[float, ...],
+                waitFor: Optional[List[cl.Event]] = None) -> Optional[cl.Event]:
+        """
+        Advances an image field by a number of timesteps. The field is swapped after each timestep, so the result is
+        in ``field.front``.
+
+        :param queue: The command queue
+        :param field: The image field
+        :param steps: The number of timesteps
+        :param kappa: The diffusion numbers (alpha * dt / dx^2) along the x, y (and z) directions
+        :param waitFor: Events which must complete before the first timestep
+        :return: The event of the final timestep
+        """
+        ev = None
+
+        for i in range(steps):
+            ev = self.enqueue(queue, field, kappa, [ev] if ev is not None else waitFor)
+            field.swap()
+
+        return ev
+
+
+class HeatEnsemble2D:
+    """
+    Batched driver for an ensemble of explicit 2D heat equation simulations which share a grid but differ in their
+    material properties and initial conditions.
+
+    All the members are packed into a single :class:`~pyocl.ensemble.Ensemble` and advanced by one launch of the
+    ``heat_eq_2D_ensemble`` kernel per step, with the diffusion numbers of each member stored in parameter arrays.
+    Small grids then fill the device rather than being dominated by the launch overhead of separate simulations. The
+    field of each member has the shape ``(ny, nx)``, where the cell ``(i, j)`` is stored at ``j * nx + i``.
+    """
+
+    KERNEL_NAME = 'heat_eq_2D_ensemble'
+
+    def __init__(self, ocl: Core, members: int, nx: int, ny: int) -> None:
+
+        self._nx = nx
+        self._ny = ny
+        self._ensemble = Ensemble(ocl.memoryPool, members, (ny, nx), np.float32)
+
+        self._program = ocl.buildProgram(loadKernelSource('heat_eq_2D_ensemble.cl'))
+        self._kernel = cl.Kernel(self._program, HeatEnsemble2D.KERNEL_NAME)
+
+    @property
+    def ensemble(self) -> Ensemble:
+        """
+        The batched fields and parameters of the members
+        """
+        return self._ensemble
+
+    @property
+    def members(self) -> int:
+        """
+        The number of members in the ensemble
+        """
+        return self._ensemble.members
+
+    def setParameters(self, queue: cl.CommandQueue, k, rho, cp, dt, dx: float, dy: float) -> None:
+        """
+        Sets the parameters of the members. Each parameter may be a scalar shared by all the members or an array with
+        a value for each member.
+
+        :param queue: The command queue
+        :param k: The thermal conductivity [W/mK]
+        :param rho: The density [kg/m^3]
+        :param cp: The specific heat capacity [J/kgK]
+        :param dt: The timestep [s]
+        :param dx: The grid spacing in the x direction [m]
+        :param dy: The grid spacing in the y direction [m]
+        """
+        alpha = np.asarray(k, dtype=np.float64) / (np.asarray(rho, dtype=np.float64) * np.asarray(cp, dtype=np.float64))
+        dt = np.asarray(dt, dtype=np.float64)
+
+        self._ensemble.setParameter(queue, 'kappa1', alpha * dt / (dx * dx))
+        self._ensemble.setParameter(queue, 'kappa2', alpha * dt / (dy * dy))
+
+    def setDiffusionNumbers(self, queue: cl.CommandQueue, kappa1, kappa2) -> None:
+        """
+        Sets the diffusion numbers (alpha * dt / dx^2) of the members directly
+
+        :param queue: The command queue
+        :param kappa1: The diffusion number in the x direction of each member
+        :param kappa2: The diffusion number in the y direction of each member
+        """
+        self._ensemble.setParameter(queue, 'kappa1', kappa1)
+        self._ensemble.setParameter(queue, 'kappa2', kappa2)
+
+    def enqueue(self, queue: cl.CommandQueue, waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Enqueues a single launch advancing every member by one timestep. The ensemble is swapped after the launch.
+
+        :param queue: The command queue
+        :param waitFor: Events which must complete before the launch
+        :return: The event of the launch
+        """
+        ensemble = self._ensemble
+
+        ev = self._kernel(queue, (self._nx, self._ny, ensemble.members), None,
+                          ensemble.back, ensemble.front, ensemble.parameter('kappa1'), ensemble.parameter('kappa2'),
+                          np.int32(self._nx), np.int32(self._ny), wait_for=waitFor)
+        ensemble.swap()
+
+        return ev
+
+    def advance(self, queue: cl.CommandQueue, steps: int,
+                waitFor: Optional[List[cl.Event]] = None) -> Optional[cl.Event]:
+        """
+        Advances every member by a number of timesteps, using one launch per timestep
+
+        :param queue: The command queue
+        :param steps: The number of timesteps
+        :param waitFor: Events which must complete before the first launch
+        :return: The event of the final launch
+        """
+        ev = None
+
+        for i in range(steps):
+            ev = self.enqueue(queue, [ev] if ev is not None else waitFor)
+
+        return ev
+
+    def release(self, waitFor: Optional[List[cl.Event]] = None) -> None:
+        """
+        Returns the buffers of the ensemble to the pool
+
+        :param waitFor: The events of the commands using the ensemble (e.g. the final launch)
+        """
+        self._ensemble.release(waitFor)
+
+
+class ConvergentHeatStencil2D:
+    """
+    Driver for the explicit 2D heat equation with the convergence reduction fused into the update.
+
+    The ``heat_eq_2D_convergence`` kernel writes the change of each work-group to the partials of a
+    :class:`~pyocl.convergence.ConvergenceMonitor` whilst advancing the field, so checking for convergence costs the
+    second stage of the reduction and a read back of two scalars rather than another pass over the field. The field
+    layout matches ``heat_eq_2D``, where the cell ``(i, j)`` is stored at ``j * nx + i``.
+    """
+
+    KERNEL_NAME = 'heat_eq_2D_convergence'
+
+    def __init__(self, ocl: Core, nx: int, ny: int, monitor: Optional[ConvergenceMonitor] = None,
+                 localSize: Tuple[int, int] = (16, 16)) -> None:
+
+        self._nx = nx
+        self._ny = ny
+        self._monitor = monitor if monitor is not None else ConvergenceMonitor(ocl, np.float32)
+
+        if self._monitor.dtype != np.dtype(np.float32):
+            raise ValueError('The fused heat equation requires a float32 convergence monitor')
+
+        source = loadKernelSource('convergence.cl') + loadKernelSource('heat_eq_2D_convergence.cl')
+        self._program = ocl.buildProgram(source, self._monitor.buildOptions())
+        self._kernel = cl.Kernel(self._program, ConvergentHeatStencil2D.KERNEL_NAME)
+
+        maxItems = min(ocl.maxWorkGroupSize,
+                       self._kernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE, ocl.device))
+
+        while localSize[0] * localSize[1] > maxItems:
+            localSize = (max(localSize[0] // 2, 1), max(localSize[1] // 2, 1))
+
+        self._localSize = tuple(localSize)
+
+    @property
+    def monitor(self) -> ConvergenceMonitor:
+        """
+        The convergence monitor receiving the partial results
+        """
+        return self._monitor
+
+    @property
+    def localSize(self) -> Tuple[int, int]:
+        """
+        The local work group size
+        """
+        return self._localSize
+
+    @property
+    def groups(self) -> int:
+        """
+        The number of work-groups of a launch, which is the number of partial results
+        """
+        return -(-self._nx // self._localSize[0]) * -(-self._ny // self._localSize[1])
+
+    def enqueue(self, queue: cl.CommandQueue, u1: cl.Buffer, u0: cl.Buffer, kappa1: float, kappa2: float,
+                waitFor: Optional[List[cl.Event]] = None) -> cl.Event:
+        """
+        Enqueues a single timestep from `u0` into `u1` followed by the second stage of the convergence reduction. The
+        residual may then be read with :meth:`ConvergenceMonitor.read`.
+
+        :param queue: The command queue
+        :param u1: The output buffer
+        :param u0: The input buffer
+        :param kappa1: The diffusion number in the x direction (alpha * dt / dx^2)
+        :param kappa2: The diffusion number in the y direction (alpha * dt / dy^2)
+        :param waitFor: Events which must complete before the launch
+        :return: The event of the reduction
+        """
+        lx, ly = self._localSize
+        globalSize = (-(-self._nx // lx) * lx, -(-self._ny // ly) * ly)
+
+        ev = self._kernel(queue, globalSize, self._localSize, u1, u0, np.float32(kappa1), np.float32(kappa2),
+                          np.int32(self._nx), np.int32(self._ny), self._monitor.partials(self.groups),
+                          *self._monitor.localMemory(lx * ly), wait_for=waitFor)
+
+        return self._monitor.enqueueFinalise(queue, self.groups, [ev])
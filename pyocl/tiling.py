@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+from typing import Callable, List, Optional, Tuple
+import logging
+
+import numpy as np
+import pyopencl as cl
+
+from .memory import BufferPool, DoubleBuffer
+
+
+class Tile:
+    """
+    A tile of a field streamed through the device by :class:`TiledExecutor`.
+
+    The field is split along its first axis. The local field of the tile holds the rows computed for the tile together
+    with the halo rows required by the stencil, laid out as ``[haloTop | interior | haloBottom]``. The tile reads from
+    ``field.front`` and writes to ``field.back``, which are the device buffers of the ring slot used by the tile.
+    """
+
+    def __init__(self, index: int, rowStart: int, rows: int, haloTop: int, haloBottom: int,
+                 shape: Tuple[int, ...], queue: cl.CommandQueue, field: DoubleBuffer) -> None:
+
+        self.index = index
+        self.rowStart = rowStart
+        self.rows = rows
+        self.haloTop = haloTop
+        self.haloBottom = haloBottom
+        self.shape = (haloTop + rows + haloBottom,) + tuple(shape[1:])
+        self.queue = queue
+        self.field = field
+
+    @property
+    def rowOffset(self) -> int:
+        """
+        The global row of the first row of the local field (including the top halo)
+        """
+        return self.rowStart - self.haloTop
+
+    @property
+    def rowBytes(self) -> int:
+        """
+        The size of a single row of the field [bytes]
+        """
+        return int(np.prod(self.shape[1:])) * self.field.dtype.itemsize
+
+
+class TiledExecutor:
+    """
+    Out-of-core execution of a stencil on a field larger than the device memory.
+
+    The full field is kept in host memory (or a memory-mapped file) and streamed through the device as overlapping
+    tiles with halo rows. A ring of device buffers with separate upload, compute and download queues allows the upload
+    of the next tile and the download of the previous tile to overlap with the compute of the current tile. Each pass
+    advances the whole field by one step, reading from a source host array and writing to a destination host array.
+
+    The launch function has the signature ``launch(tile, rowStart, rowCount, waitFor) -> cl.Event`` and must compute
+    the local rows ``[rowStart, rowStart + rowCount)`` of ``tile.field.back`` from ``tile.field.front`` on
+    ``tile.queue``. The global position of the tile is given by :attr:`Tile.rowOffset`.
+    """
+
+    def __init__(self, context: cl.Context, device: cl.Device, shape: Tuple[int, ...], halo: int = 1,
+                 dtype=np.float32, tileRows: Optional[int] = None, numSlots: int = 3,
+                 pool: Optional[BufferPool] = None) -> None:
+
+        self._shape = tuple(shape)
+        self._halo = halo
+        self._dtype = np.dtype(dtype)
+
+        rowBytes = int(np.prod(self._shape[1:])) * self._dtype.itemsize
+
+        if tileRows is None:
+            # Each slot holds an input and output buffer. Use at most half of the device memory.
+            budget = min(device.global_mem_size // (4 * numSlots), device.max_mem_alloc_size)
+            tileRows = max(budget // rowBytes - 2 * halo, 1)
+
+        tileRows = int(min(tileRows, self._shape[0]))
+
+        if tileRows < halo:
+            raise ValueError('Tiles of {:d} rows are smaller than the halo'.format(tileRows))
+
+        self._tileRows = tileRows
+
+        props = cl.command_queue_properties.PROFILING_ENABLE
+        self._uploadQueue = cl.CommandQueue(context, device, properties=props)
+        self._computeQueue = cl.CommandQueue(context, device, properties=props)
+        self._downloadQueue = cl.CommandQueue(context, device, properties=props)
+
+        pool = pool if pool is not None else BufferPool(context)
+
+        numTiles = -(-self._shape[0] // tileRows)
+        numSlots = min(numSlots, numTiles)
+        slotShape = (tileRows + 2 * halo,) + self._shape[1:]
+
+        self._slots = [DoubleBuffer(pool, slotShape, self._dtype) for i in range(numSlots)]
+        self._tiles = []  # type: List[Tile]
+
+        for i in range(numTiles):
+            rowStart = i * tileRows
+            rows = min(tileRows, self._shape[0] - rowStart)
+            haloTop = min(halo, rowStart)
+            haloBottom = min(halo, self._shape[0] - rowStart - rows)
+
+            self._tiles.append(Tile(i, rowStart, rows, haloTop, haloBottom, self._shape,
+                                    self._computeQueue, self._slots[i % numSlots]))
+
+        logging.debug('Tiled field {:s} into {:d} tiles of {:d} rows using {:d} slots'.format(
+                str(self._shape), numTiles, tileRows, numSlots))
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        The global shape of the field
+        """
+        return self._shape
+
+    @property
+    def tileRows(self) -> int:
+        """
+        The number of rows computed by each tile
+        """
+        return self._tileRows
+
+    @property
+    def tiles(self) -> List[Tile]:
+        """
+        The tiles of the field
+        """
+        return self._tiles
+
+    def step(self, src: np.ndarray, dst: np.ndarray,
+             launch: Callable[[Tile, int, int, Optional[List[cl.Event]]], cl.Event]) -> None:
+        """
+        Advances the field by one step, streaming every tile through the device
+
+        :param src: The host array of the current field
+        :param dst: The host array receiving the updated field
+        :param launch: The launch function computing a range of rows of a tile
+        """
+        for array in (src, dst):
+            if array.shape != self._shape or array.dtype != self._dtype or not array.flags.c_contiguous:
+                raise ValueError('Host arrays must be C-contiguous and match the shape and type of the field')
+
+        numSlots = len(self._slots)
+        computeEvents = []
+        downloadEvents = []
+
+        for tile in self._tiles:
+            # The slot buffers must no longer be in use by the tile which previously occupied the slot
+            previous = tile.index - numSlots
+            uploadWait = [computeEvents[previous]] if previous >= 0 else None
+            computeWait = [downloadEvents[previous]] if previous >= 0 else []
+
+            local = src[tile.rowOffset:tile.rowOffset + tile.shape[0]]
+            # Each queue is flushed after enqueueing, as OpenCL requires the command of an event to be submitted
+            # before another queue waits on it. This also lets the queues progress concurrently.
+            uploadEv = cl.enqueue_copy(self._uploadQueue, tile.field.front, local, is_blocking=False,
+                                       wait_for=uploadWait)
+            self._uploadQueue.flush()
+
+            computeEv = launch(tile, tile.haloTop, tile.rows, computeWait + [uploadEv])
+            self._computeQueue.flush()
+
+            interior = dst[tile.rowStart:tile.rowStart + tile.rows]
+            downloadEv = cl.enqueue_copy(self._downloadQueue, interior, tile.field.back, is_blocking=False,
+                                         src_offset=tile.haloTop * tile.rowBytes, wait_for=[computeEv])
+            self._downloadQueue.flush()
+
+            computeEvents.append(computeEv)
+            downloadEvents.append(downloadEv)
+
+        cl.wait_for_events(downloadEvents)
+
+    def run(self, steps: int, u: np.ndarray,
+            launch: Callable[[Tile, int, int, Optional[List[cl.Event]]], cl.Event],
+            work: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Advances the field by a number of steps, alternating between the field and a work array on the host
+
+        :param steps: The number of steps
+        :param u: The host array of the initial field
+        :param launch: The launch function computing a range of rows of a tile
+        :param work: Optional host array (e.g. a memory-mapped file) used as the alternate field
+        :return: The host array holding the final field, which is either `u` or `work`
+        """
+        if work is None:
+            work = np.empty_like(u)
+
+        for i in range(steps):
+            self.step(u, work, launch)
+            u, work = work, u
+
+        return u
+
+    def release(self) -> None:
+        """
+        Returns the device buffers of the ring to the pool
+        """
+        for slot in self._slots:
+            slot.release()
+
+    def __enter__(self) -> 'TiledExecutor':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
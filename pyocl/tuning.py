@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+import itertools
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import pyopencl as cl
+
+from .paths import atomicWrite, cacheDirectory
+
+
+class WorkGroupTuner:
+    """
+    Autotuner for selecting the local work group size of a kernel launch.
+
+    Candidate local sizes are generated that divide the global problem shape and respect both the device limits
+    (maximum work group size and work item sizes) and the kernel limits reported by the compiler. Each candidate is
+    timed on the real problem shape using the profiling events of the command queue, which therefore must be created
+    with ``PROFILING_ENABLE``. The fastest work group size is persisted to a file for each kernel, device and global
+    shape, so that subsequent processes may reuse the result without tuning again.
+    """
+
+    def __init__(self, cacheFile: Optional[str] = None) -> None:
+
+        if cacheFile is None:
+            cacheFile = os.path.join(cacheDirectory(), 'workgroups.json')
+
+        self._cacheFile = cacheFile
+        self._results = None  # type: Optional[Dict[str, List[int]]]
+        self._lock = threading.Lock()
+
+    @property
+    def cacheFile(self) -> str:
+        """
+        The file used to persist the tuned work group sizes
+        """
+        return self._cacheFile
+
+    @staticmethod
+    def programKey(source: str, options: Optional[Sequence[str]] = None) -> str:
+        """
+        Generates a digest identifying a program by its source and build options, so that kernels of the same name
+        in different programs or specialisations are tuned separately
+
+        :param source: The kernel source
+        :param options: The build options
+        :return: The digest of the program
+        """
+        hasher = hashlib.sha1()
+
+        for item in [source] + list(options if options else []):
+            hasher.update(item.encode('utf-8'))
+            hasher.update(b'\0')
+
+        return hasher.hexdigest()
+
+    @staticmethod
+    def generateKey(kernel: cl.Kernel, device: cl.Device, globalSize: Sequence[int],
+                    programKey: Optional[str] = None) -> str:
+        """
+        Generates the key used for storing the tuned work group size
+
+        :param kernel: The OpenCL kernel
+        :param device: The OpenCL device
+        :param globalSize: The global size of the kernel launch
+        :param programKey: The digest of the program (see :meth:`programKey`). By default this is generated from the
+                           source and build options reported for the program of the kernel, which are not available
+                           for programs created from binaries
+        :return: The key for the tuned result
+        """
+        if programKey is None:
+            program = kernel.get_info(cl.kernel_info.PROGRAM)
+            programKey = WorkGroupTuner.programKey(program.get_info(cl.program_info.SOURCE),
+                                                   [program.get_build_info(device, cl.program_build_info.OPTIONS)])
+
+        return '{:s}|{:s}|{:s}|{:s}|{:s}'.format(kernel.function_name,
+                                                 programKey,
+                                                 device.name,
+                                                 device.driver_version,
+                                                 'x'.join(str(n) for n in globalSize))
+
+    def _loadResults(self) -> Dict[str, List[int]]:
+
+        if self._results is None:
+            try:
+                with open(self._cacheFile, 'r') as f:
+                    self._results = json.load(f)
+            except (OSError, ValueError):
+                self._results = {}
+
+        return self._results
+
+    def _saveResults(self) -> None:
+
+        try:
+            atomicWrite(self._cacheFile, json.dumps(self._results, indent=2, sort_keys=True))
+
+        except OSError as e:
+            logging.warning('Unable to store the tuned work group sizes ({:s})'.format(str(e)))
+
+    def lookup(self, kernel: cl.Kernel, device: cl.Device, globalSize: Sequence[int],
+               programKey: Optional[str] = None) -> Optional[Tuple[int, ...]]:
+        """
+        Returns a previously tuned work group size
+
+        :param kernel: The OpenCL kernel
+        :param device: The OpenCL device
+        :param globalSize: The global size of the kernel launch
+        :param programKey: The digest of the program of the kernel (see :meth:`programKey`)
+        :return: The tuned work group size or None if the launch has not been tuned
+        """
+        with self._lock:
+            result = self._loadResults().get(WorkGroupTuner.generateKey(kernel, device, globalSize, programKey))
+
+        return tuple(result) if result else None
+
+    def clear(self) -> None:
+        """
+        Removes all the tuned results
+        """
+        with self._lock:
+            self._results = {}
+
+            try:
+                os.remove(self._cacheFile)
+            except OSError:
+                pass
+
+    @staticmethod
+    def candidates(kernel: cl.Kernel, device: cl.Device, globalSize: Sequence[int]) -> List[Tuple[int, ...]]:
+        """
+        Generates the candidate work group sizes for a kernel launch. Each dimension is a power of two which divides
+        the global size. Candidates are limited by the maximum work group size of the kernel and the maximum work item
+        sizes of the device. Candidates that are a multiple of the preferred work group size multiple are preferred.
+
+        :param kernel: The OpenCL kernel
+        :param device: The OpenCL device
+        :param globalSize: The global size of the kernel launch
+        :return: List of candidate work group sizes
+        """
+        maxSize = min(device.max_work_group_size,
+                      kernel.get_work_group_info(cl.kernel_work_group_info.WORK_GROUP_SIZE, device))
+
+        multiple = kernel.get_work_group_info(cl.kernel_work_group_info.PREFERRED_WORK_GROUP_SIZE_MULTIPLE, device)
+
+        dimSizes = []
+        for dim, n in enumerate(globalSize):
+            limit = min(n, maxSize, device.max_work_item_sizes[dim])
+            dimSizes.append([2 ** p for p in range(limit.bit_length()) if n % (2 ** p) == 0 and 2 ** p <= limit])
+
+        candidates = [size for size in itertools.product(*dimSizes) if WorkGroupTuner._count(size) <= maxSize]
+
+        preferred = [size for size in candidates if WorkGroupTuner._count(size) % multiple == 0]
+
+        return preferred if preferred else candidates
+
+    @staticmethod
+    def _count(size: Sequence[int]) -> int:
+        count = 1
+        for n in size:
+            count *= n
+        return count
+
+    def tune(self, queue: cl.CommandQueue, kernel: cl.Kernel, globalSize: Sequence[int],
+             args: Union[Sequence[Any], Callable[[Tuple[int, ...]], Sequence[Any]]],
+             iterations: int = 3, force: bool = False, programKey: Optional[str] = None) -> Tuple[int, ...]:
+        """
+        Tunes the work group size of a kernel launch by timing each candidate on the device. The kernel is launched
+        with the arguments provided, so the kernel should not modify its own inputs (e.g. reads from ``u0`` and writes
+        to ``u1``). The result is persisted and reused for subsequent calls unless `force` is set.
+
+        :param queue: The command queue, created with profiling enabled
+        :param kernel: The OpenCL kernel to tune
+        :param globalSize: The global size of the kernel launch
+        :param args: The kernel arguments, or a function returning the kernel arguments for a work group size
+                     (e.g. for sizing local memory)
+        :param iterations: The number of timed launches per candidate
+        :param force: Re-tune the kernel even if a result is available
+        :param programKey: The digest of the program of the kernel (see :meth:`programKey`)
+        :return: The fastest work group size
+        """
+        globalSize = tuple(int(n) for n in globalSize)
+        device = queue.device
+
+        if not force:
+            result = self.lookup(kernel, device, globalSize, programKey)
+
+            if result is not None:
+                return result
+
+        if not queue.properties & cl.command_queue_properties.PROFILING_ENABLE:
+            raise ValueError('The command queue must be created with PROFILING_ENABLE for tuning')
+
+        bestTime = None
+        bestSize = None
+
+        for localSize in WorkGroupTuner.candidates(kernel, device, globalSize):
+            kernelArgs = args(localSize) if callable(args) else args
+
+            try:
+                kernel.set_args(*kernelArgs)
+
+                # Warm-up launch
+                cl.enqueue_nd_range_kernel(queue, kernel, globalSize, localSize).wait()
+
+                elapsed = 0
+                for i in range(iterations):
+                    ev = cl.enqueue_nd_range_kernel(queue, kernel, globalSize, localSize)
+                    ev.wait()
+                    elapsed += ev.profile.end - ev.profile.start
+
+            except cl.Error as e:
+                # The launch configuration may exceed resources (e.g. local memory) not captured by the limits
+                logging.debug('Work group size {:s} failed ({:s})'.format(str(localSize), str(e)))
+                continue
+
+            logging.debug('Work group size {:s} - {:.5f} ms'.format(str(localSize), elapsed / iterations * 1e-6))
+
+            if bestTime is None or elapsed < bestTime:
+                bestTime = elapsed
+                bestSize = localSize
+
+        if bestSize is None:
+            raise RuntimeError('No valid work group size available for kernel <{:s}>'.format(kernel.function_name))
+
+        with self._lock:
+            self._loadResults()[WorkGroupTuner.generateKey(kernel, device, globalSize, programKey)] = list(bestSize)
+            self._saveResults()
+
+        return bestSize
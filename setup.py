@@ -46,13 +46,13 @@ setup(
     classifiers=[
         'License :: OSI Approved :: BSD License',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Natural Language :: English',
         'Topic :: Scientific/Engineering'],
     license=license,
     packages=find_packages(exclude=('tests', 'docs')),
+    package_data={'pyocl': ['kernels/*.cl']},
+    python_requires='>=3.7',
     install_requires=list(requirements_default),
 )
 
@@ -2,8 +2,137 @@
 from .context import pyocl
 
 import unittest
+from unittest import mock
 import platform
+import json
 import tempfile
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pyopencl as cl
+
+KERNEL_SRC = """
+kernel void scale(global float *u1, global const float *u0, float alpha) {
+    int i = get_global_id(0);
+    u1[i] = alpha * u0[i];
+}
+
+#ifdef ALPHA
+kernel void scale_const(global float *u1, global const float *u0) {
+    int i = get_global_id(0);
+    u1[i] = ALPHA * u0[i];
+}
+#endif
+"""
+
+SMOOTH_SRC = """
+kernel void smooth(global float *u1, global const float *u0, int rowOffset, int ny) {
+    int nx = get_global_size(0);
+    int i = get_global_id(0);
+    int j = get_global_id(1);
+    int c = j * nx + i;
+
+    if (i > 0 && i < nx - 1 && j + rowOffset > 0 && j + rowOffset < ny - 1)
+        u1[c] = 0.25f * (u0[c - 1] + u0[c + 1] + u0[c - nx] + u0[c + nx]);
+    else
+        u1[c] = u0[c];
+}
+"""
+
+
+def smooth(u, steps):
+    for i in range(steps):
+        u1 = u.copy()
+        u1[1:-1, 1:-1] = 0.25 * (u[1:-1, :-2] + u[1:-1, 2:] + u[:-2, 1:-1] + u[2:, 1:-1])
+        u = u1
+    return u
+
+
+def heat(u, steps, kappa1, kappa2):
+    for i in range(steps):
+        u1 = u.copy()
+        c = u[1:-1, 1:-1]
+        u1[1:-1, 1:-1] = c + kappa1 * (u[1:-1, :-2] - 2.0 * c + u[1:-1, 2:]) \
+                           + kappa2 * (u[:-2, 1:-1] - 2.0 * c + u[2:, 1:-1])
+        u = u1
+    return u
+
+
+PRECISION_SRC = """
+kernel void scale(global storage_t *u1, global const storage_t *u0, real_t alpha) {
+    int i = get_global_id(0);
+    STORE(u1, i, alpha * LOAD(u0, i));
+}
+"""
+
+
+class ScaleSim(pyocl.OpenCLSimBase):
+    """ Minimal simulation used for testing """
+
+    def __init__(self):
+        super().__init__()
+        self.initialiseCL()
+
+    @property
+    def kernel(self):
+        return KERNEL_SRC
+
+    def initialiseData(self, u0):
+        mf = cl.mem_flags
+        self.n = u0.shape[0]
+        self.u0 = cl.Buffer(self.ocl.context, mf.READ_WRITE | mf.COPY_HOST_PTR, hostbuf=u0)
+        self.u1 = cl.Buffer(self.ocl.context, mf.READ_WRITE, u0.nbytes)
+
+    def enqueueStep(self, waitFor=None):
+        ev = self.getKernel('scale')(self.queue, (self.n,), None, self.u1, self.u0, np.float32(2.0),
+                                     wait_for=waitFor)
+        self.u0, self.u1 = self.u1, self.u0
+        return ev
+
+    def download(self):
+        u = np.empty(self.n, dtype=np.float32)
+        cl.enqueue_copy(self.queue, u, self.u0, is_blocking=True)
+        return u
+
+
+class PrecisionSim(pyocl.OpenCLSimBase):
+    """ Simulation using a precision policy """
+
+    def __init__(self, precision):
+        super().__init__()
+        self.precision = precision
+        self.initialiseCL()
+
+    @property
+    def kernel(self):
+        return PRECISION_SRC
+
+
+class SteadyHeatSim(pyocl.OpenCLSimBase):
+    """ Heat equation with the convergence reduction fused into the step """
+
+    def __init__(self, u0, kappa=0.2):
+        super().__init__()
+        self.initialiseCL()
+        self.kappa = kappa
+        self.field = self.createDoubleBuffer(u0.shape, hostbuf=u0)
+        self.stencil = pyocl.ConvergentHeatStencil2D(self.ocl, u0.shape[1], u0.shape[0],
+                                                     self.createConvergenceMonitor())
+
+    @property
+    def kernel(self):
+        return KERNEL_SRC
+
+    def enqueueStep(self, waitFor=None):
+        return self.enqueueStepWithResidual(waitFor)
+
+    def enqueueStepWithResidual(self, waitFor=None):
+        ev = self.stencil.enqueue(self.queue, self.field.back, self.field.front, self.kappa, self.kappa, waitFor)
+        self.field.swap()
+        return ev
+
 
 class AdvancedTestSuite(unittest.TestCase):
     """Advanced test cases."""
@@ -11,6 +140,631 @@ class AdvancedTestSuite(unittest.TestCase):
     def test_thoughts(self):
         assert True
 
+    def test_program_cache(self):
+        ocl = pyocl.Core()
+
+        with tempfile.TemporaryDirectory() as cacheDir:
+            cache = pyocl.ProgramCache(cacheDir)
+            ocl.programCache = cache
+
+            program = ocl.buildProgram(KERNEL_SRC)
+            self.assertEqual(len(cache), 1)
+            self.assertTrue(program.scale)
+
+            # Second build is served from the cache
+            ocl.clearPrograms()
+            program = ocl.buildProgram(KERNEL_SRC)
+            self.assertEqual(len(cache), 1)
+            self.assertTrue(program.scale)
+
+            # Corrupt binaries fall back to a source build
+            key = cache.generateKey(KERNEL_SRC, [], ocl.device)
+            cache.store(key, b'invalid')
+            ocl.clearPrograms()
+            program = ocl.buildProgram(KERNEL_SRC)
+            self.assertTrue(program.scale)
+
+            # Entries removed concurrently by another process are skipped
+            entries = cache._entries()
+            os.remove(entries[0].path)
+            with mock.patch.object(cache, '_entries', return_value=entries):
+                self.assertEqual(cache.size, 0)
+                cache.evict()
+
+            cache.maxSize = 0
+            self.assertEqual(len(cache), 0)
+
+    def test_core_pool(self):
+        simA = ScaleSim()
+        simB = ScaleSim()
+
+        self.assertIs(simA.ocl, simB.ocl)
+        self.assertIs(simA.program, simB.program)
+        self.assertIsNot(simA.queue, simB.queue)
+        self.assertIs(pyocl.CorePool.get(simA.ocl.device), simA.ocl)
+
+        # Workload-aware selection is shared by simulations requesting the workload
+        with tempfile.TemporaryDirectory() as cacheDir, mock.patch.dict(os.environ, {'PYOCL_CACHE_DIR': cacheDir}):
+            simC = ScaleSim.__new__(ScaleSim)
+            pyocl.OpenCLSimBase.__init__(simC)
+            simC.workload = pyocl.Workload.MEMORY_BOUND
+            simC.initialiseCL()
+
+            self.assertIs(pyocl.CorePool.get(workload=pyocl.Workload.MEMORY_BOUND), simC.ocl)
+
+    def test_autotune_work_group_size(self):
+        sim = ScaleSim()
+        n = 1024
+
+        mf = cl.mem_flags
+        u0 = cl.Buffer(sim.ocl.context, mf.READ_ONLY, 4 * n)
+        u1 = cl.Buffer(sim.ocl.context, mf.WRITE_ONLY, 4 * n)
+
+        with tempfile.TemporaryDirectory() as cacheDir:
+            sim.workGroupTuner = pyocl.WorkGroupTuner(os.path.join(cacheDir, 'workgroups.json'))
+
+            wgSize = sim.autotuneWorkGroupSize('scale', (n,), (u1, u0, np.float32(2.0)))
+            self.assertEqual(n % wgSize[0], 0)
+            self.assertLessEqual(wgSize[0], sim.getMaximumWorkGroupSize())
+            self.assertTrue(os.path.isfile(sim.workGroupTuner.cacheFile))
+
+            # The persisted result is reused by a new tuner
+            tuner = pyocl.WorkGroupTuner(sim.workGroupTuner.cacheFile)
+            kernel = cl.Kernel(sim.program, 'scale')
+            self.assertEqual(tuner.lookup(kernel, sim.ocl.device, (n,), sim._programKey), wgSize)
+
+            # Specialised variants of the program are tuned separately
+            sim.specialise(ALPHA=3.0)
+            self.assertIsNone(tuner.lookup(cl.Kernel(sim.program, 'scale'), sim.ocl.device, (n,), sim._programKey))
+
+    def test_run_steps(self):
+        sim = ScaleSim()
+        sim.initialiseData(np.ones(256, dtype=np.float32))
+
+        ev = sim.advanceAsync(3)
+        self.assertIsInstance(ev, cl.Event)
+
+        sim.run(2)
+        np.testing.assert_allclose(sim.download(), 32.0)
+
+    def test_profiler(self):
+        sim = ScaleSim()
+        sim.profiler = pyocl.Profiler()
+        sim.initialiseData(np.ones(256, dtype=np.float32))
+
+        sim.run(4)
+        sim.download()
+
+        u = np.ones(256, dtype=np.float32)
+        sim.enqueueCopy(u, sim.u0, is_blocking=True)
+
+        stats = sim.profiler.stats()
+        self.assertEqual(stats['scale']['count'], 4)
+        self.assertEqual(stats['scale']['bytes'], 4 * 2 * u.nbytes)
+        self.assertEqual(stats['copy_dtoh']['count'], 1)
+
+        trace = sim.profiler.chromeTrace()
+        self.assertEqual(len([ev for ev in trace['traceEvents'] if ev['ph'] == 'X']), 5)
+
+    def test_double_buffer_pool(self):
+        sim = ScaleSim()
+        pool = pyocl.BufferPool(sim.ocl.context, limit=1 << 20)
+        u0 = np.arange(1024, dtype=np.float32)
+
+        field = pyocl.DoubleBuffer(pool, u0.shape, u0.dtype)
+        field.upload(sim.queue, u0)
+        front = field.front
+
+        field.swap()
+        self.assertIs(field.back, front)
+        field.swap()
+        np.testing.assert_array_equal(field.download(sim.queue), u0)
+        self.assertEqual(pool.activeBytes, 2 * u0.nbytes)
+
+        field.release()
+        self.assertEqual(pool.heldBytes, 2 * u0.nbytes)
+
+        # Freed allocations are reused
+        with pyocl.DoubleBuffer(pool, u0.shape, u0.dtype) as field:
+            self.assertEqual(pool.heldBytes, 0)
+            self.assertEqual(pool.allocatedBytes, 2 * u0.nbytes)
+
+        with self.assertRaises(MemoryError):
+            pool.allocate(2 << 20)
+
+        # A buffer freed with commands in flight is only reused once they have completed
+        pending = cl.UserEvent(sim.ocl.context)
+        busy = pool.allocate(4096)
+        idle = pool.allocate(4096)
+        pool.free(busy, [pending])
+        pool.free(idle)
+        self.assertIs(pool.allocate(4096), idle)
+
+        pending.set_status(cl.command_execution_status.COMPLETE)
+        self.assertIs(pool.allocate(4096), busy)
+
+        # A failed allocation of the second buffer does not leak the first
+        active = pool.activeBytes
+        with self.assertRaises(MemoryError):
+            pyocl.DoubleBuffer(pool, (160 << 10,), np.float32)
+        self.assertEqual(pool.activeBytes, active)
+
+    def test_map_buffer(self):
+        sim = ScaleSim()
+        u0 = np.arange(256, dtype=np.float32)
+        field = sim.createDoubleBuffer(u0.shape, u0.dtype, hostbuf=u0)
+
+        with field.map(sim.queue) as u:
+            np.testing.assert_array_equal(u, u0)
+            u[:] = 1.0
+
+        with sim.mapBuffer(field.front, u0.shape, flags=cl.map_flags.READ) as u:
+            np.testing.assert_array_equal(u, 1.0)
+
+        if sim.ocl.isUsingCPU():
+            self.assertTrue(sim.ocl.hasSharedMemory())
+
+        field.release()
+
+    def test_slab_decomposition(self):
+        ocl = pyocl.Core()
+        shape = (37, 16)
+
+        decomposition = pyocl.SlabDecomposition([ocl.device], shape, halo=1, numSlabs=3)
+        kernel = cl.Kernel(decomposition.buildProgram(SMOOTH_SRC), 'smooth')
+
+        def launch(slab, rowStart, rowCount, waitFor):
+            return kernel(slab.queue, (shape[1], rowCount), None, slab.field.back, slab.field.front,
+                          np.int32(slab.rowOffset), np.int32(shape[0]), global_offset=(0, rowStart), wait_for=waitFor)
+
+        u0 = np.random.rand(*shape).astype(np.float32)
+        decomposition.scatter(u0)
+        decomposition.run(5, launch)
+
+        np.testing.assert_allclose(decomposition.gather(), smooth(u0, 5), rtol=1e-6)
+
+        # The slabs of a device share a pool limited by the memory of that device
+        pools = {id(slab.pool) for slab in decomposition.slabs}
+        self.assertEqual(len(pools), 1)
+        self.assertEqual(decomposition.slabs[0].pool.limit, ocl.device.global_mem_size)
+        self.assertEqual(decomposition.slabs[0].pool.activeBytes, sum(2 * slab.field.nbytes
+                                                                      for slab in decomposition.slabs))
+
+    def test_device_selection(self):
+        with tempfile.TemporaryDirectory() as cacheDir:
+            selector = pyocl.DeviceSelector(os.path.join(cacheDir, 'devices.json'), bandwidthSize=1 << 20)
+
+            ranking = selector.rank(pyocl.Workload.COMPUTE_BOUND)
+            self.assertEqual(len(ranking), len(selector.devices()))
+            self.assertGreater(ranking[0][1], 0.0)
+
+            # Scores are persisted for subsequent selections
+            self.assertTrue(os.path.isfile(selector.cacheFile))
+            selector = pyocl.DeviceSelector(selector.cacheFile)
+            self.assertEqual(selector.select(pyocl.Workload.COMPUTE_BOUND), ranking[0][0])
+
+    def test_specialise(self):
+        # The specialisation is empty before the program is built
+        uninitialised = ScaleSim.__new__(ScaleSim)
+        pyocl.OpenCLSimBase.__init__(uninitialised)
+        self.assertEqual(uninitialised.specialisation, {})
+        self.assertEqual(uninitialised.checkpointState()['specialisation'], {})
+
+        sim = ScaleSim()
+        sim.initialiseData(np.ones(64, dtype=np.float32))
+
+        self.assertEqual(pyocl.OpenCLSimBase.defineOptions({'ALPHA': 3.0, 'N': 64}), ['-DALPHA=3.0f', '-DN=64'])
+
+        program = sim.specialise(ALPHA=3.0)
+        self.assertEqual(sim.specialisation, {'ALPHA': 3.0})
+
+        sim.getKernel('scale_const')(sim.queue, (64,), None, sim.u1, sim.u0).wait()
+        u = np.empty(64, dtype=np.float32)
+        cl.enqueue_copy(sim.queue, u, sim.u1)
+        np.testing.assert_allclose(u, 3.0)
+
+        # Returning to earlier parameters reuses the variant and the digest of its source
+        programKey = sim._programKey
+        sim.specialise(ALPHA=2.0)
+        self.assertIs(sim.specialise(ALPHA=3.0), program)
+        self.assertEqual(sim._programKey, programKey)
+
+        # Tuning results are not shared with a variant built from changed source
+        sim.ocl.programs.clear()
+        with mock.patch.object(ScaleSim, 'kernel', KERNEL_SRC + '\n// changed\n'):
+            sim.specialise(ALPHA=3.0)
+        self.assertNotEqual(sim._programKey, programKey)
+
+    def test_snapshots(self):
+        sim = ScaleSim()
+        sim.initialiseData(np.ones(256, dtype=np.float32))
+
+        with tempfile.TemporaryDirectory() as snapshotDir:
+            sim.startSnapshots(snapshotDir, (256,), ringSize=2)
+
+            for i in range(4):
+                sim.advanceAsync(1)
+                sim.snapshot(sim.u0)
+
+            sim.stopSnapshots()
+
+            for i in range(4):
+                u = np.load(os.path.join(snapshotDir, 'snapshot_{:06d}.npy'.format(i)))
+                np.testing.assert_allclose(u, 2.0 ** (i + 1))
+
+    def test_tiled_executor(self):
+        sim = ScaleSim()
+        shape = (37, 16)
+
+        executor = sim.createTiledExecutor(shape, halo=1, tileRows=5)
+        self.addCleanup(executor.release)
+        kernel = cl.Kernel(sim.ocl.buildProgram(SMOOTH_SRC), 'smooth')
+
+        def launch(tile, rowStart, rowCount, waitFor):
+            return kernel(tile.queue, (shape[1], rowCount), None, tile.field.back, tile.field.front,
+                          np.int32(tile.rowOffset), np.int32(shape[0]), global_offset=(0, rowStart), wait_for=waitFor)
+
+        u0 = np.random.rand(*shape).astype(np.float32)
+        u = executor.run(4, u0.copy(), launch)
+
+        self.assertEqual(len(executor.tiles), 8)
+        np.testing.assert_allclose(u, smooth(u0, 4), rtol=1e-6)
+
+    def test_temporal_blocking(self):
+        sim = ScaleSim()
+        nx, ny = 53, 41
+
+        stencil = pyocl.TemporalHeatStencil2D(sim.ocl, nx, ny, localSize=(16, 16))
+        self.assertEqual(stencil.steps, 2)
+
+        u0 = np.random.rand(ny, nx).astype(np.float32)
+        field = sim.createDoubleBuffer(u0.shape, hostbuf=u0)
+        self.addCleanup(field.release)
+
+        stencil.advance(sim.queue, field, 7, 0.2, 0.1).wait()
+        np.testing.assert_allclose(field.download(sim.queue), heat(u0, 7, 0.2, 0.1), rtol=1e-5)
+
+        # Automatic tile size and fusion based on the device limits
+        stencil = pyocl.TemporalHeatStencil2D(sim.ocl, nx, ny)
+        self.assertGreaterEqual(stencil.steps, 1)
+        self.assertLessEqual(stencil.localSize[0] * stencil.localSize[1] * 4, sim.ocl.localMemorySize)
+
+    def test_launch_planner(self):
+        sim = ScaleSim()
+
+        plan = sim.planLaunch('scale', (1000,), halo=1, localSize=(64,))
+        self.assertEqual(plan.globalSize, (1024,))
+        self.assertEqual(plan.extents, (1000,))
+        self.assertEqual(plan.tileShape, (66,))
+        self.assertEqual(plan.localMemorySize, 66 * 4)
+
+        planner = pyocl.LaunchPlanner(sim.ocl.device)
+        self.assertEqual(planner.tileShape((16, 16), halo=1, vectorWidth=8), (24, 18))
+        self.assertEqual(planner.padGlobalSize((53, 37), (16, 16)), (64, 48))
+
+        with self.assertRaises(ValueError):
+            planner.plan((1000, 1000), (planner.maxWorkGroupSize, 2))
+
+    def test_precision(self):
+        u0 = np.linspace(0.0, 1.0, 256).astype(np.float32)
+
+        for precision, tolerance in ((pyocl.Precision.HALF, 1e-3), (pyocl.Precision.FLOAT, 1e-6),
+                                     (pyocl.Precision.DOUBLE, 1e-12)):
+            sim = PrecisionSim(precision)
+            field = sim.createDoubleBuffer(u0.shape, hostbuf=u0)
+            self.assertEqual(field.dtype, sim.precision.storageType)
+
+            sim.getKernel('scale')(sim.queue, u0.shape, None, field.back, field.front, sim.real(0.5))
+            field.swap()
+
+            u1 = field.download(sim.queue)
+            self.assertEqual(u1.dtype, sim.storageType)
+            np.testing.assert_allclose(u1, 0.5 * u0, atol=tolerance)
+            field.release()
+
+        class Device:
+            name = 'test'
+            extensions = 'cl_khr_byte_addressable_store'
+
+        self.assertEqual(pyocl.Precision.DOUBLE.resolve(Device()), pyocl.Precision.FLOAT)
+        self.assertEqual(pyocl.Precision.HALF.resolve(Device()), pyocl.Precision.HALF)
+
+    def test_image_field(self):
+        sim = ScaleSim()
+
+        if not pyocl.hasImageSupport(sim.ocl.context, sim.ocl.device):
+            self.skipTest('Device does not support image fields')
+
+        u0 = np.random.rand(37, 53).astype(np.float32)
+        kappa = (0.2, 0.1)
+
+        with sim.createImageField(u0.shape, hostbuf=u0) as field:
+            np.testing.assert_array_equal(field.download(sim.queue), u0)
+
+            stencil = pyocl.ImageHeatStencil(sim.ocl)
+            stencil.advance(sim.queue, field, 5, kappa)
+
+            # Clamp-to-edge addressing is a zero-gradient boundary
+            expected = u0
+            for i in range(5):
+                expected = heat(np.pad(expected, 1, mode='edge'), 1, kappa[0], kappa[1])[1:-1, 1:-1]
+
+            np.testing.assert_allclose(field.download(sim.queue), expected, rtol=1e-5, atol=1e-6)
+
+    def test_benchmark_kernels(self):
+        # The kernel benchmarks launch every example kernel, including a size which is not a multiple of the work group
+        root = os.path.join(os.path.dirname(__file__), '..')
+        output = subprocess.check_output([sys.executable, os.path.join('benchmarks', 'benchmark.py'), '--only',
+                                          'kernels', '--sizes', '37', '64', '--repeats', '1'], cwd=root)
+
+        names = [result['name'] for result in json.loads(output.decode())['results']]
+        self.assertIn('kernel/heat_eq_2D_shared4/37', names)
+        self.assertIn('kernel/heat_eq_2D_shared4/64', names)
+
+    def test_device_capabilities(self):
+        # Importing pyocl and loading saved capabilities does not load PyOpenCL
+        code = 'import sys, pyocl.capabilities; assert "pyopencl" not in sys.modules'
+        subprocess.check_call([sys.executable, '-c', code], cwd=os.path.join(os.path.dirname(__file__), '..'))
+
+        ocl = pyocl.Core()
+        self.assertEqual(ocl.capabilities, pyocl.DeviceCapabilities.fromDevice(ocl.device))
+        self.assertEqual(ocl.localMemorySize, ocl.device.local_mem_size)
+        self.assertEqual(ocl.hasDouble(), 'cl_khr_fp64' in ocl.device.extensions)
+
+        with tempfile.TemporaryDirectory() as cacheDir:
+            filename = os.path.join(cacheDir, 'capabilities.json')
+            self.assertIsNone(pyocl.loadCapabilities(filename))
+
+            capabilities = pyocl.deviceCapabilities(filename=filename)
+            self.assertIn(ocl.capabilities, capabilities)
+            self.assertEqual(pyocl.loadCapabilities(filename), capabilities)
+            self.assertEqual(capabilities[0].device().int_ptr, ocl.device.int_ptr)
+
+    def test_build_profiles(self):
+        sim = ScaleSim()
+        u0 = np.linspace(0.0, 1.0, 256).astype(np.float32)
+
+        def validate(sim):
+            sim.synchronise()
+            sim.initialiseData(u0)
+            sim.run(3)
+            return sim.download()
+
+        validation = sim.setBuildProfile(pyocl.BuildProfile.FAST, validate)
+        self.assertTrue(validation.accepted)
+        self.assertLessEqual(validation.relativeError, 1e-4)
+        self.assertEqual(sim.buildProfile, pyocl.BuildProfile.FAST)
+        self.assertIn('-cl-fast-relaxed-math', sim.buildOptions())
+
+        # A profile exceeding the tolerance is rejected
+        sim.setBuildProfile(pyocl.BuildProfile.DEFAULT)
+        validation = sim.setBuildProfile(pyocl.BuildProfile.FAST, lambda sim: np.random.rand(4), tolerance=0.0)
+        self.assertFalse(validation.accepted)
+        self.assertEqual(sim.buildProfile, pyocl.BuildProfile.DEFAULT)
+
+        ocl = pyocl.Core()
+        ocl.setBuildFlag(pyocl.OpenCLFlags.DISABLE_OPTIMISATIONS)
+        self.assertEqual(ocl.buildOptions(pyocl.BuildProfile.DEBUG), ['-g', '-cl-opt-disable'])
+        self.assertFalse(ocl.isBuildOptionSupported('-cl-unknown-option'))
+
+    def test_transfer_queues(self):
+        sim = ScaleSim()
+        self.assertEqual(len(sim.transferQueues), 1)
+
+        u0 = np.ones(1024, dtype=np.float32)
+        sim.initialiseData(np.zeros_like(u0))
+        sim.enqueueUpload(sim.u0, u0)
+
+        # The download of step 1 overlaps with step 2 and step 3 waits for it before overwriting the field
+        sim.run(1, blocking=False)
+        out = np.empty_like(u0)
+        download = sim.enqueueDownload(out, sim.u0)
+        sim.run(2)
+
+        download.wait()
+        np.testing.assert_array_equal(out, 2.0 * u0)
+        np.testing.assert_array_equal(sim.download(), 8.0 * u0)
+
+        sim.synchronise()
+
+        # Step dependencies may be added before the queues are created
+        uninitialised = ScaleSim.__new__(ScaleSim)
+        pyocl.OpenCLSimBase.__init__(uninitialised)
+        event = cl.UserEvent(sim.ocl.context)
+        uninitialised.addStepDependency(event)
+        self.assertEqual(uninitialised._popStepDependencies(), [event])
+        self.assertIsNone(uninitialised.transferQueue)
+        event.set_status(cl.command_execution_status.COMPLETE)
+
+    def test_ensemble(self):
+        sim = ScaleSim()
+        nx, ny, members = 23, 17, 5
+
+        u0 = np.random.rand(members, ny, nx).astype(np.float32)
+        k = np.linspace(5.0, 50.0, members)
+
+        stencil = pyocl.HeatEnsemble2D(sim.ocl, members, nx, ny)
+        stencil.ensemble.upload(sim.queue, u0)
+        stencil.setParameters(sim.queue, k, 2700.0, 920.0, 0.01, 1e-3, 1e-3)
+        stencil.advance(sim.queue, 4).wait()
+
+        kappa = stencil.ensemble.parameterValues('kappa1')
+        self.assertAlmostEqual(float(kappa[-1]), 50.0 / (2700.0 * 920.0) * 0.01 / 1e-6, places=5)
+
+        for m in range(members):
+            expected = heat(u0[m], 4, kappa[m], kappa[m])
+            np.testing.assert_allclose(stencil.ensemble.member(sim.queue, m), expected, rtol=1e-5, atol=1e-6)
+
+        np.testing.assert_allclose(stencil.ensemble.download(sim.queue)[-1], stencil.ensemble.member(sim.queue, -1))
+
+        stencil.ensemble.uploadMember(sim.queue, 2, np.zeros((ny, nx), dtype=np.float32))
+        self.assertFalse(np.any(stencil.ensemble.member(sim.queue, 2)))
+
+        stencil.release()
+
+    def test_concurrent_sims(self):
+        environ = dict(os.environ)
+        ocl = pyocl.Core()
+        self.assertEqual(dict(os.environ), environ)
+
+        def create(i):
+            sim = ScaleSim.__new__(ScaleSim)
+            pyocl.OpenCLSimBase.__init__(sim)
+            sim.initialiseCL(ocl)
+            sim.specialise(ALPHA=2.0)
+            sim.initialiseData(np.full(4096, i, dtype=np.float32))
+            return sim
+
+        # Failed builds do not retain their build lock
+        self.assertRaises(cl.Error, ocl.buildProgram, 'kernel void broken(')
+        self.assertEqual(ocl._buildLocks, {})
+
+        with pyocl.SimExecutor(8) as executor:
+            sims = executor.map(create, range(16))
+            self.assertEqual(len({id(sim.program) for sim in sims}), 1)
+
+            executor.run(sims, 5)
+            results = executor.map(lambda sim: sim.download(), sims)
+
+        for i, u in enumerate(results):
+            np.testing.assert_array_equal(u, np.full(4096, i * 32.0, dtype=np.float32))
+
+    def test_device_fission(self):
+        ocl = pyocl.Core(useGPU=False)
+        devices = ocl.createSubDevices()
+        self.assertGreaterEqual(len(devices), 1)
+        self.assertLessEqual(len(devices), ocl.device.max_compute_units)
+
+        # NUMA partitioning falls back to equal partitioning when it is not supported
+        self.assertGreaterEqual(len(ocl.createSubDevices(numa=True)), 1)
+
+        scheduler = pyocl.PartitionScheduler(ocl)
+        partitions = len(scheduler.partitions)
+
+        sims = []
+        for i in range(2 * partitions):
+            sim = ScaleSim.__new__(ScaleSim)
+            pyocl.OpenCLSimBase.__init__(sim)
+            scheduler.place(sim)
+            sim.specialise(ALPHA=2.0)
+            sim.initialiseData(np.full(256, i, dtype=np.float32))
+            sims.append(sim)
+
+        self.assertEqual(scheduler.load, [2] * partitions)
+
+        for i, sim in enumerate(sims):
+            sim.run(3)
+            np.testing.assert_array_equal(sim.download(), np.full(256, i * 8.0, dtype=np.float32))
+            scheduler.release(sim)
+
+        self.assertEqual(scheduler.load, [0] * partitions)
+
+    def test_checkpoint(self):
+        sim = ScaleSim()
+        sim.checkpointAttributes = ('t',)
+        sim.t = 0.0
+        sim.initialiseData(np.arange(4096, dtype=np.float32))
+        field = sim.createDoubleBuffer((64, 64), hostbuf=np.ones((64, 64)))
+
+        sim.registerCheckpointBuffer('u', lambda: sim.u0, (4096,), np.float32)
+        sim.registerCheckpointBuffer('field', field)
+
+        with tempfile.TemporaryDirectory() as directory:
+            sim.run(2)
+            sim.t = 2.0
+            self.assertEqual(sim.saveCheckpoint(directory, tileBytes=1024), 2 * 4096 * 4)
+
+            # Only the changed tiles of the slot being overwritten are written
+            self.assertEqual(sim.saveCheckpoint(directory), 2 * 4096 * 4)
+            self.assertEqual(sim.saveCheckpoint(directory), 0)
+
+            with sim.mapBuffer(field.front, (64, 64)) as u:
+                u[10, :] = 5.0
+
+            self.assertEqual(sim.saveCheckpoint(directory), 1024)
+            self.assertEqual(pyocl.Checkpoint(directory).generation, 4)
+
+            sim.run(3)
+            sim.t = 5.0
+            field.upload(sim.queue, np.zeros((64, 64), dtype=np.float32))
+
+            sim.restoreCheckpoint(directory)
+            self.assertEqual(sim.t, 2.0)
+            np.testing.assert_array_equal(sim.download(), np.arange(4096, dtype=np.float32) * 4)
+
+            expected = np.ones((64, 64), dtype=np.float32)
+            expected[10, :] = 5.0
+            np.testing.assert_array_equal(field.download(sim.queue), expected)
+
+            other = ScaleSim()
+            other.initialiseData(np.zeros(16, dtype=np.float32))
+            other.registerCheckpointBuffer('u', lambda: other.u0, (16,), np.float32)
+            self.assertRaises(ValueError, other.restoreCheckpoint, directory)
+
+    def test_checkpoint_interrupted(self):
+        a, b, c = (np.full(1024, v, dtype=np.float32) for v in (1.0, 2.0, 7.0))
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = pyocl.Checkpoint(directory, tileBytes=512)
+            checkpoint.write({'u': a})
+            checkpoint.write({'u': b})
+
+            # Pre-empt the write after the tiles of the slot have been overwritten
+            writeMetadata = pyocl.Checkpoint._writeMetadata
+            calls = []
+
+            def interrupt(self, metadata):
+                calls.append(metadata)
+                if len(calls) > 1:
+                    raise KeyboardInterrupt()
+                writeMetadata(self, metadata)
+
+            with mock.patch.object(pyocl.Checkpoint, '_writeMetadata', interrupt):
+                self.assertRaises(KeyboardInterrupt, checkpoint.write, {'u': c})
+
+            checkpoint = pyocl.Checkpoint(directory)
+            np.testing.assert_array_equal(checkpoint.array('u'), b)
+
+            # The interrupted slot is rewritten in full rather than compared against stale digests
+            self.assertEqual(checkpoint.write({'u': a}), a.nbytes)
+            np.testing.assert_array_equal(pyocl.Checkpoint(directory).array('u'), a)
+
+    def test_convergence(self):
+        ocl = pyocl.Core()
+        rng = np.random.default_rng(0)
+        u0 = rng.random(5000).astype(np.float32)
+        u1 = rng.random(5000).astype(np.float32)
+
+        monitor = pyocl.ConvergenceMonitor(ocl)
+        queue = cl.CommandQueue(ocl.context)
+        mf = cl.mem_flags
+        b0 = cl.Buffer(ocl.context, mf.READ_ONLY | mf.COPY_HOST_PTR, hostbuf=u0)
+        b1 = cl.Buffer(ocl.context, mf.READ_ONLY | mf.COPY_HOST_PTR, hostbuf=u1)
+
+        residual = monitor.read(queue, [monitor.enqueue(queue, b1, b0, u0.size)])
+        self.assertAlmostEqual(residual.maxChange, np.abs(u1 - u0).max(), places=6)
+        self.assertAlmostEqual(residual.l2Norm, np.linalg.norm(u1 - u0), places=3)
+
+        # A fixed boundary with a zero interior decays to a steady state
+        u = np.zeros((40, 37), dtype=np.float32)
+        u[0, :] = 1.0
+
+        sim = SteadyHeatSim(u)
+        sim.convergenceInterval = 5
+        sim.run(100000, tolerance=1e-5)
+
+        self.assertLess(sim.stepsRun, 100000)
+        self.assertEqual(sim.stepsRun % 5, 0)
+        self.assertLessEqual(sim.residual.maxChange, 1e-5)
+
+        # The fused reduction matches the change of the final step
+        before = sim.field.download(sim.queue)
+        sim.run(1, tolerance=0.0)
+        after = sim.field.download(sim.queue)
+        self.assertEqual(sim.stepsRun, 1)
+        self.assertAlmostEqual(sim.residual.maxChange, np.abs(after - before).max(), places=7)
+        self.assertAlmostEqual(sim.residual.norm(pyocl.ConvergenceNorm.L2), np.linalg.norm(after - before), places=6)
+
 
 if __name__ == '__main__':
     unittest.main()